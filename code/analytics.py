@@ -0,0 +1,485 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: PLAY ANALYTICS
+# ---------------------------------------------------------------------------------
+# Live aggregates of how players move through the story, built from an event
+# stream that the engine (main.start(), main.step() and main.rewind()) emits
+# when an Analytics object is installed as main.EVENTS:
+#
+#   enter    a scene was entered (value "start" for a session's first scene,
+#            "end" for a scene without choices)
+#   choice   a choice was taken (value: its number)
+#   effect   the choice had effects (value: morality change, items added)
+#   ending   an ending scene is about to be entered (ENDING_* or without
+#            choices); sent just before its "enter"
+#   rewind   choices were taken back (value: how many) and the session is
+#            back on the scene; not counted as entering it again
+#
+# The events are pushed through a pipeline of generator stages:
+#
+#   track_sessions -> windows -> summarize -> write_lines
+#
+# track_sessions follows every live session (last scene, steps, which watched
+# scenes it has seen) and adds derived events: "start" and "end" of a
+# session, "dropout" when a session goes idle or falls out of its bounded
+# table, and "before" for the watched scene pairs (had the session seen A
+# when it first entered B?). windows folds events into one Rollup per time
+# window; summarize merges each window into running totals and writes one
+# compact JSON line per window.
+#
+# No event is kept after it is counted. Scene, choice and drop-off counts go
+# into Count-Min sketches and Space-Saving top-k lists, and distinct sessions
+# into a HyperLogLog, so memory is fixed by the sketch sizes and the live
+# session table, not by the number of events or the size of the story.
+#
+# This module does not import main.
+#
+# Usage:
+#   python analytics.py show events.jsonl [--window]
+#       prints the totals (or the last window) from a summary file
+# ---------------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import time
+import zlib
+from array import array
+from collections import Counter, OrderedDict, namedtuple
+
+Event = namedtuple("Event", "time session kind scene value")
+
+# Events emitted by the game; the others are derived by the pipeline.
+PLAYER_EVENTS = frozenset(("enter", "choice", "effect", "ending", "rewind"))
+
+# ---------------------------------------------------------------------------------
+# APPROXIMATE COUNTERS
+# ---------------------------------------------------------------------------------
+
+def _hashes(key):
+    data = key.encode("utf-8")
+    return zlib.crc32(data), zlib.adler32(data) | 1
+
+class CountMin:
+    """
+    Count-Min sketch: per-key counts in fixed memory. Estimates never
+    undercount and overcount by at most ~e/width of the total, with high
+    probability.
+    """
+    __slots__ = ("width", "depth", "rows", "total")
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array("Q", bytes(8 * width)) for _ in range(depth)]
+        self.total = 0
+
+    def add(self, key, count=1):
+        first, second = _hashes(key)
+        for i, row in enumerate(self.rows):
+            row[(first + i * second) % self.width] += count
+        self.total += count
+
+    def estimate(self, key):
+        first, second = _hashes(key)
+        return min(row[(first + i * second) % self.width] for i, row in enumerate(self.rows))
+
+    def merge(self, other):
+        for row, other_row in zip(self.rows, other.rows):
+            for i, value in enumerate(other_row):
+                if value:
+                    row[i] += value
+        self.total += other.total
+
+class SpaceSaving:
+    """
+    Space-Saving top-k: the `size` most frequent keys of a stream with their
+    counts. A key's count is at most `error` too high.
+    """
+    __slots__ = ("size", "counts")
+
+    def __init__(self, size=32):
+        self.size = size
+        self.counts = {}
+
+    def add(self, key, count=1):
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += count
+        elif len(self.counts) < self.size:
+            self.counts[key] = [count, 0]
+        else:
+            smallest = min(self.counts, key=lambda k: self.counts[k][0])
+            floor = self.counts.pop(smallest)[0]
+            self.counts[key] = [floor + count, floor]
+
+    def top(self, limit=10):
+        """
+        [(key, count), ...] by count, highest first.
+        """
+        ranked = sorted(self.counts.items(), key=lambda item: -item[1][0])
+        return [(key, count) for key, (count, _) in ranked[:limit]]
+
+    def merge(self, other):
+        for key, (count, _) in other.counts.items():
+            self.add(key, count)
+
+MASK64 = (1 << 64) - 1
+
+def _mix64(number):
+    # splitmix64 finalizer: spreads integer keys over all 64 bits
+    number = (number + 0x9E3779B97F4A7C15) & MASK64
+    number = ((number ^ (number >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    number = ((number ^ (number >> 27)) * 0x94D049BB133111EB) & MASK64
+    return number ^ (number >> 31)
+
+class HyperLogLog:
+    """
+    Approximate number of distinct keys in 2**precision bytes (about 3%
+    standard error at the default precision). Integer keys are mixed
+    directly; others are hashed from their text.
+    """
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision=10):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, key):
+        if type(key) is int:
+            value = _mix64(key)
+        else:
+            digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+        bits = 64 - self.precision
+        index = value >> bits
+        rank = bits - (value & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        size = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size / sum(
+            2.0 ** -register for register in self.registers)
+        empty = self.registers.count(0)
+        if estimate <= 2.5 * size and empty:
+            estimate = size * math.log(size / empty)
+        return round(estimate)
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+# ---------------------------------------------------------------------------------
+# ROLLUPS
+# ---------------------------------------------------------------------------------
+
+class Rollup:
+    """
+    Aggregates of the events in one time window (or, merged, of several).
+    """
+
+    def __init__(self, start, seconds):
+        self.start = start
+        self.seconds = seconds
+        self.events = 0
+        self.kinds = Counter()
+        self.sessions = HyperLogLog()
+        self.endings = Counter()
+        self.ending_steps = Counter()
+        self.scenes = CountMin()
+        self.top_scenes = SpaceSaving()
+        self.top_choices = SpaceSaving()
+        self.dropouts = SpaceSaving()
+        self.before = Counter()
+        self.morality = 0
+        self.items = Counter()
+
+    def add(self, event):
+        kind = event.kind
+        self.events += kind in PLAYER_EVENTS
+        self.kinds[kind] += 1
+        self.sessions.add(event.session)
+        if kind == "enter":
+            self.scenes.add(event.scene)
+            self.top_scenes.add(event.scene)
+        elif kind == "choice":
+            self.top_choices.add(f"{event.scene}:{event.value}")
+        elif kind == "effect":
+            morality, items = event.value
+            self.morality += morality
+            self.items.update(items)
+        elif kind == "ending":
+            self.endings[event.scene] += 1
+            self.ending_steps[event.scene] += event.value or 0
+        elif kind == "dropout":
+            self.dropouts.add(event.scene)
+        elif kind == "before":
+            pair, seen = event.value
+            self.before[pair, seen] += 1
+
+    def merge(self, other):
+        self.seconds = other.start + other.seconds - self.start
+        self.events += other.events
+        self.kinds.update(other.kinds)
+        self.sessions.merge(other.sessions)
+        self.endings.update(other.endings)
+        self.ending_steps.update(other.ending_steps)
+        self.scenes.merge(other.scenes)
+        self.top_scenes.merge(other.top_scenes)
+        self.top_choices.merge(other.top_choices)
+        self.dropouts.merge(other.dropouts)
+        self.before.update(other.before)
+        self.morality += other.morality
+        self.items.update(other.items)
+
+    def summary(self, top=10):
+        """
+        Compact JSON-friendly summary.
+        """
+        started = self.kinds["start"]
+        return {
+            "start": round(self.start, 3),
+            "seconds": round(self.seconds, 3),
+            "events": self.events,
+            "sessions": self.sessions.count(),
+            "started": started,
+            "finished": self.kinds["end"],
+            "rewinds": self.kinds["rewind"],
+            "funnel": {scene: {"sessions": count,
+                               "of_started": round(count / started, 4) if started else None,
+                               "mean_steps": round(self.ending_steps[scene] / count, 1)}
+                       for scene, count in sorted(self.endings.items())},
+            "dropoff": [[scene, count, round(count / max(self.scenes.estimate(scene), 1), 4)]
+                        for scene, count in self.dropouts.top(top)],
+            "scenes": self.top_scenes.top(top),
+            "choices": self.top_choices.top(top),
+            "before": {f"{a}<{b}": {"yes": self.before[(a, b), True],
+                                    "entered": self.before[(a, b), True]
+                                    + self.before[(a, b), False]}
+                       for (a, b) in sorted({pair for pair, _ in self.before})},
+            "morality": self.morality,
+            "items": dict(self.items.most_common(top)),
+        }
+
+# ---------------------------------------------------------------------------------
+# PIPELINE STAGES
+# ---------------------------------------------------------------------------------
+
+# Each stage is a generator that receives items with send() and passes its
+# output to the next stage. Sending None flushes whatever a stage holds.
+
+def stage(func):
+    """
+    Decorator: creates the generator and advances it to its first yield.
+    """
+    def start(*args, **kwargs):
+        generator = func(*args, **kwargs)
+        next(generator)
+        return generator
+    start.__name__ = func.__name__
+    start.__doc__ = func.__doc__
+    return start
+
+@stage
+def track_sessions(target, watch=(), idle=1800.0, limit=100000):
+    """
+    Follows live sessions and adds "dropout" and "before" events. A session
+    is dropped once idle for `idle` seconds or when more than `limit`
+    sessions are live; one that reached the end of the story is forgotten.
+    Only a session's first ending is passed on, with its step count.
+    Events leave with a serial number per session in place of the caller's
+    key, so a key reused after a session ended counts as a new session.
+    """
+    bits = {}
+    for a, b in watch:
+        for scene in (a, b):
+            bits.setdefault(scene, 1 << len(bits))
+    # key -> [last scene, last time, steps, watched bits, ended, serial]
+    live = OrderedDict()
+    serials = itertools.count(1)
+    next_sweep = None
+
+    def drop(entry, now):
+        target.send(Event(now, entry[5], "dropout", entry[0], entry[2]))
+
+    while True:
+        event = yield
+        if event is None:
+            target.send(None)
+            continue
+        now = event.time
+        if next_sweep is None or now >= next_sweep or len(live) > limit:
+            # Idle sessions are looked for a few times per idle period
+            next_sweep = now + idle / 16
+            while live:
+                oldest, entry = next(iter(live.items()))
+                if now - entry[1] < idle and len(live) <= limit:
+                    break
+                del live[oldest]
+                drop(entry, now)
+        if event.kind == "tick":
+            target.send(event)
+            continue
+
+        key = event.session
+        entry = live.get(key)
+        if entry is not None and event.kind == "enter" and event.value == "start":
+            # A new game under a key that is still live (e.g. a reused state)
+            del live[key]
+            drop(entry, now)
+            entry = None
+        if entry is None:
+            entry = live[key] = [event.scene, now, 0, 0, False, next(serials)]
+        else:
+            live.move_to_end(key)
+        event = event._replace(session=entry[5])
+        entry[1] = now
+        if event.kind == "enter":
+            entry[0] = event.scene
+            entry[2] += 1
+            if event.value == "start":
+                target.send(event._replace(kind="start"))
+            for a, b in watch:
+                if event.scene == b and not entry[3] & bits[b]:
+                    target.send(Event(now, entry[5], "before", b,
+                                      ((a, b), bool(entry[3] & bits[a]))))
+            entry[3] |= bits.get(event.scene, 0)
+        elif event.kind == "rewind":
+            entry[0] = event.scene
+        elif event.kind == "ending":
+            if entry[4]:
+                continue
+            entry[4] = True
+            # Counting the ending scene, which is entered next
+            event = event._replace(value=entry[2] + 1)
+        target.send(event)
+        if event.kind == "enter" and event.value == "end":
+            del live[key]
+            target.send(event._replace(kind="end"))
+
+@stage
+def windows(target, seconds=60.0):
+    """
+    Folds events into one Rollup per `seconds` window and sends each window
+    on when an event (or tick) from a later window arrives.
+    """
+    rollup = None
+    while True:
+        event = yield
+        if event is None:
+            if rollup is not None:
+                target.send(rollup)
+                rollup = None
+            continue
+        start = event.time - event.time % seconds
+        if rollup is not None and start != rollup.start:
+            target.send(rollup)
+            rollup = None
+        if event.kind == "tick":
+            continue
+        if rollup is None:
+            rollup = Rollup(start, seconds)
+        rollup.add(event)
+
+@stage
+def summarize(target, top=10):
+    """
+    Merges windows into running totals and sends {"window", "total"}
+    summaries on.
+    """
+    total = None
+    while True:
+        rollup = yield
+        if rollup is None:
+            continue
+        summary = {"window": rollup.summary(top)}
+        if total is None:
+            total = rollup
+        else:
+            total.merge(rollup)
+        summary["total"] = total.summary(top)
+        target.send(summary)
+
+@stage
+def write_lines(path):
+    """
+    Appends each summary to `path` as one JSON line.
+    """
+    while True:
+        summary = yield
+        with open(path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(summary, separators=(",", ":")) + "\n")
+
+# ---------------------------------------------------------------------------------
+# EVENT SINK
+# ---------------------------------------------------------------------------------
+
+class Analytics:
+    """
+    The event sink installed as main.EVENTS. Sessions are told apart by
+    their state object; `watch` lists (A, B) scene pairs to check for "A
+    seen before B".
+    """
+
+    def __init__(self, path, window=60.0, watch=(), idle=1800.0, top=10, output=None,
+                 clock=time.time):
+        self.clock = clock
+        output = output if output is not None else write_lines(path)
+        self.pipeline = track_sessions(windows(summarize(output, top), window), watch, idle)
+
+    def emit(self, kind, session, scene, value=None):
+        self.pipeline.send(Event(self.clock(), id(session), kind, scene, value))
+
+    def tick(self):
+        """
+        Closes the current window if its time is up, even with no players.
+        """
+        self.pipeline.send(Event(self.clock(), 0, "tick", None, None))
+
+    def close(self):
+        """
+        Writes the window in progress.
+        """
+        self.pipeline.send(None)
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+def run():
+    """
+    Command-line entry point: print a summary file's latest figures.
+    """
+    parser = argparse.ArgumentParser(description="Echoes of the Signal play analytics")
+    parser.add_argument("command", choices=["show"])
+    parser.add_argument("path", help="summary file written with --events")
+    parser.add_argument("--window", action="store_true",
+                        help="show the last window instead of the totals")
+    args = parser.parse_args()
+
+    last = None
+    with open(args.path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                last = line
+    if last is None:
+        raise SystemExit(f"{args.path}: no summaries yet")
+    summary = json.loads(last)["window" if args.window else "total"]
+    print(f"{summary['events']:,} events, ~{summary['sessions']:,} sessions, "
+          f"{summary['started']:,} started, {summary['finished']:,} finished, "
+          f"{summary.get('rewinds', 0):,} rewinds")
+    print("Funnel from the start scene:")
+    for scene, entry in summary["funnel"].items():
+        share = "" if entry["of_started"] is None else f" ({entry['of_started']:.1%})"
+        print(f"  {scene:<24} {entry['sessions']:>8,}{share}, {entry['mean_steps']} steps")
+    print("Most drop-offs:")
+    for scene, count, rate in summary["dropoff"]:
+        print(f"  {scene:<24} {count:>8,} ({rate:.1%} of visits)")
+    for pair, entry in summary["before"].items():
+        share = entry["yes"] / entry["entered"] if entry["entered"] else 0.0
+        print(f"{pair}: {entry['yes']:,} of {entry['entered']:,} ({share:.1%})")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,207 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: BATCH RUNNER
+# ---------------------------------------------------------------------------------
+# Plays large numbers of scripted sessions through the engine API
+# (main.start() / main.step()) across a process pool and streams one JSON
+# result per session, in input order, as soon as it is known.
+#
+# A script is one JSON object per line:
+#
+#   {"name": "Sam", "seed": 7, "choices": [1, 2, 1, ...]}
+#   {"name": "bot", "seed": 8, "bot": "random", "max_steps": 200}
+#
+# "choices" are played in order, a negative number -N rewinding N choices
+# (recording logs written with --record are valid scripts). A "random" bot
+# picks uniformly among the offered choices with a generator seeded from
+# "seed". Each result reports how far the session got ("ending" is the first
+# ENDING_* scene reached, or the final scene of a finished story, else null;
+# "path" only with --path):
+#
+#   {"session": 0, "name": "Sam", "seed": 7, "steps": 9, "ending": "ENDING_SEVER",
+#    "terminal": true, "final": {...}, "error": null, "path": [...]}
+#
+# Scripts are read lazily and only a few batches are in flight at a time, so
+# memory stays flat for any number of scripts.
+#
+# Usage:
+#   python batch.py SCRIPTS [--workers 4] [--batch 256] [--output FILE] [--path]
+#   python batch.py --random 100000 [--seed 9] ...
+#       plays that many random bots instead of reading scripts
+# ---------------------------------------------------------------------------------
+
+import argparse
+import collections
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+
+# ---------------------------------------------------------------------------------
+# SESSIONS
+# ---------------------------------------------------------------------------------
+
+def run_script(script, keep_path=False):
+    """
+    Plays one script to the end of the story or of its choices. Returns the
+    result dict (without the session number).
+    """
+    seed = script.get("seed", 0)
+    random.seed(seed)
+    session = main.start(script.get("name") or "Alex Riven", seed)
+    path = [main.SCENE_IDS[session.state.scene]]
+    error = None
+    if script.get("bot") == "random":
+        rng = random.Random(seed)
+        choices = None
+        max_steps = script.get("max_steps", 1000)
+    elif "bot" in script:
+        choices, max_steps = (), 0
+        error = f"unknown bot {script['bot']!r}"
+    else:
+        choices = iter(script.get("choices", ()))
+        max_steps = None
+
+    while not main.is_terminal(session):
+        if choices is None:
+            if session.steps >= max_steps:
+                error = f"stopped after {max_steps} steps"
+                break
+            state = session.state
+            count = len(main.available_choices(state, main.STORY.scenes[state.scene]))
+            number = rng.randrange(count) + 1
+        else:
+            number = next(choices, None)
+            if number is None:
+                break
+        try:
+            shown, session = main.move(session, number)
+        except main.ChoiceError as choice_error:
+            error = str(choice_error)
+            break
+        path.append(shown.id)
+
+    terminal = main.is_terminal(session)
+    result = {
+        "name": session.state.name,
+        "seed": seed,
+        "steps": session.steps,
+        "ending": next((scene_id for scene_id in path if scene_id.startswith("ENDING_")),
+                       path[-1] if terminal else None),
+        "terminal": terminal,
+        "final": main.summarize_state(session.state),
+        "error": error,
+    }
+    if keep_path:
+        result["path"] = path
+    return result
+
+def run_batch(scripts, keep_path=False):
+    """
+    Plays a batch of scripts. Runs in pool workers.
+    """
+    return [run_script(script, keep_path) for script in scripts]
+
+def run_all(scripts, workers=None, batch=256, keep_path=False):
+    """
+    Yields the results of every script, in order, while later batches are
+    still playing. At most two batches per worker are in flight.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    batches = iter(lambda: list(itertools.islice(scripts, batch)), [])
+    numbers = itertools.count()
+    if workers <= 1:
+        for part in batches:
+            for result in run_batch(part, keep_path):
+                yield {"session": next(numbers), **result}
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = collections.deque()
+        for part in batches:
+            pending.append(pool.submit(run_batch, part, keep_path))
+            if len(pending) < 2 * workers:
+                continue
+            for result in pending.popleft().result():
+                yield {"session": next(numbers), **result}
+        while pending:
+            for result in pending.popleft().result():
+                yield {"session": next(numbers), **result}
+
+# ---------------------------------------------------------------------------------
+# SCRIPTS
+# ---------------------------------------------------------------------------------
+
+def read_scripts(path):
+    """
+    Yields the scripts in a JSONL file ("-" for stdin).
+    """
+    handle = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+def random_scripts(count, seed=9, max_steps=1000):
+    """
+    Yields `count` random bot scripts with seeds drawn from `seed`.
+    """
+    rng = random.Random(seed)
+    for number in range(count):
+        yield {"name": f"bot{number}", "seed": rng.randrange(1 << 32), "bot": "random",
+               "max_steps": max_steps}
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+def run():
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Play scripted sessions headlessly")
+    parser.add_argument("scripts", nargs="?", help="JSONL scripts ('-' for stdin)")
+    parser.add_argument("--random", type=int, metavar="COUNT",
+                        help="play COUNT random bots instead of scripts")
+    parser.add_argument("--seed", type=int, default=9, help="seed for the random bots")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch", type=int, default=256, help="scripts per pool task")
+    parser.add_argument("--output", help="write results here instead of stdout")
+    parser.add_argument("--path", action="store_true", help="include each session's scene ids")
+    args = parser.parse_args()
+    if (args.scripts is None) == (args.random is None):
+        parser.error("give a scripts file or --random COUNT")
+
+    scripts = (random_scripts(args.random, args.seed) if args.random is not None
+               else read_scripts(args.scripts))
+    output = sys.stdout if args.output is None else open(args.output, "w", encoding="utf-8")
+    sessions = 0
+    endings = collections.Counter()
+    errors = 0
+    started = time.perf_counter()
+    try:
+        for result in run_all(scripts, args.workers, args.batch, args.path):
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            sessions += 1
+            endings[result["ending"]] += 1
+            errors += result["error"] is not None
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - started
+
+    print(f"{sessions:,} sessions in {elapsed:.2f} s ({sessions / elapsed:,.0f}/s), "
+          f"{errors:,} with errors", file=sys.stderr)
+    for ending, count in endings.most_common():
+        print(f"  {ending or '(unfinished)':<24} {count:>8,}", file=sys.stderr)
+    raise SystemExit(1 if errors else 0)
+
+if __name__ == "__main__":
+    run()
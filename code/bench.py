@@ -0,0 +1,1310 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: BENCHMARKS AND REPORTS
+# ---------------------------------------------------------------------------------
+# Measurements for the game engine in main.py.
+#
+# Usage:
+#   python bench.py memory [--loops 10000]
+#   python bench.py steps [--steps 200000]
+#   python bench.py snapshots [--count 100000]
+#   python bench.py sessions [--players 5000] [--choices 50000]
+#   python bench.py events [--events 200000 1000000 2000000]
+#   python bench.py shared [--workers 4] [--scenes 1000 100000]
+#   python bench.py suite [--only render step ...] [--output results.json]
+#                         [--baseline bench_baseline.json] [--update-baseline]
+#
+# The suite covers rendering, the terminal driver, the layout cache,
+# play_scene steps, effects, choice requirements, state copy/serialize, rewind
+# history, startup time, synthetic stories of 1k, 10k and 100k scenes, story
+# reloads after edits, scanner search on a 100k-scene story and the time to
+# first character after a choice with and without prefetching. Its results
+# are written as JSON and compared with a stored baseline; the exit status is
+# 1 if any metric got worse than the tolerance.
+# ---------------------------------------------------------------------------------
+
+import argparse
+import builtins
+import copy
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import analytics
+import layout
+import main
+import metrics
+import savegame
+import scanner
+import sessionstore
+import sharedstory
+import storyfile
+
+# ---------------------------------------------------------------------------------
+# HELPERS
+# ---------------------------------------------------------------------------------
+
+# The built-in story as a SCENES-style dict, for the dict-based baselines.
+SCENES, _ = storyfile.read_scenes(main.STORY_PATH)
+
+def deep_sizeof(obj, seen=None):
+    """
+    Returns the size in bytes of an object and everything it references,
+    counting shared objects once. Interned names are shared between all
+    sessions, so strings are counted but module-level tables are not.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for member in obj:
+            size += deep_sizeof(member, seen)
+    elif hasattr(type(obj), "__slots__"):
+        for slot in type(obj).__slots__:
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+def legacy_state():
+    """
+    Returns a state in the original dict layout, for comparisons.
+    """
+    return {
+        "name": "Alex Riven",
+        "timePlayed": 0,
+        "morality": 0,
+        "health": 100,
+        "inventory": [],
+        "visited": set(),
+        "signalAmplified": False,
+        "stationDestroyed": False,
+        "didExit": False
+    }
+
+def apply_legacy_ops(state, ops):
+    """
+    Applies effect ops to a dict state the way the original lambdas did,
+    appending to the inventory list every time.
+    """
+    for op in ops:
+        if op[0] == "add_item":
+            state["inventory"].append(op[1])
+        elif op[0] == "inc_morality":
+            state["morality"] += op[1]
+        elif op[0] == "set_flag":
+            state[op[1]] = op[2]
+
+def walk_loop(state, route, loops):
+    """
+    Follows `route` (a list of (scene ID, choice number) pairs) `loops`
+    times against the given state, the way play_scene would.
+    """
+    for _ in range(loops):
+        for scene_id, choice_number in route:
+            state["visited"].add(scene_id)
+            if isinstance(state, dict):
+                apply_legacy_ops(state, SCENES[scene_id]["choices"][choice_number - 1]["effects"])
+            else:
+                scene = main.STORY.scenes[main.SCENE_INDEX[scene_id]]
+                main.take_choice(state, scene, choice_number - 1)
+
+def random_picks(count, seed=9):
+    """
+    Returns `count` random integers used to pick choices reproducibly.
+    """
+    rng = random.Random(seed)
+    return [rng.randrange(1 << 16) for _ in range(count)]
+
+def timed(func, *args):
+    """
+    Runs func(*args) and returns the elapsed seconds.
+    """
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+# The DATA_ARCHIVE_1 -> SIDE_CORRIDOR and CIRCUIT_SOLUTION -> MAIN_CORRIDOR_1
+# loops both add an item on every pass.
+MEMORY_ROUTE = [
+    ("SIDE_CORRIDOR", 1),
+    ("DATA_ARCHIVE_1", 2),
+    ("MAIN_CORRIDOR_1", 2),
+    ("MAINT_TUNNEL_1", 1),
+    ("CIRCUIT_BOX", 1),
+    ("CIRCUIT_SOLUTION", 1),
+]
+
+# ---------------------------------------------------------------------------------
+# COMMANDS
+# ---------------------------------------------------------------------------------
+
+def memory_report(loops=10000):
+    """
+    Bytes per session for the original dict state and for GameState, fresh
+    and after looping MEMORY_ROUTE `loops` times.
+    """
+    rows = []
+    for label, factory in (("dict STATE", legacy_state), ("GameState", main.new_state)):
+        for count in (0, 100, loops):
+            state = factory()
+            walk_loop(state, MEMORY_ROUTE, count)
+            rows.append({"state": label, "loops": count, "bytes": deep_sizeof(state)})
+    return rows
+
+def run_memory(args):
+    rows = memory_report(args.loops)
+    print(f"{'state':<12} {'loops':>8} {'bytes/session':>14}")
+    for row in rows:
+        print(f"{row['state']:<12} {row['loops']:>8} {row['bytes']:>14}")
+
+def dict_walk(picks):
+    """
+    Steps the SCENES dict the way play_scene originally did (string lookups,
+    a fresh valid_range list, nested choice dicts and a dict state), minus
+    the I/O.
+    """
+    scene_id = main.START_SCENE
+    state = legacy_state()
+    for pick in picks:
+        if scene_id not in SCENES:
+            break
+        scene = SCENES[scene_id]
+        choices = scene["choices"]
+        state["visited"].add(scene_id)
+        if not choices:
+            scene_id = main.START_SCENE
+            state = legacy_state()
+            continue
+        valid_range = list(range(1, len(choices) + 1))
+        choice_index = pick % len(choices) + 1
+        if choice_index not in valid_range:
+            continue
+        chosen_choice = choices[choice_index - 1]
+        apply_legacy_ops(state, chosen_choice["effects"])
+        scene_id = chosen_choice["next_scene"]
+
+def compiled_walk(picks):
+    """
+    Steps the compiled story graph with the same choice picks.
+    """
+    scenes = main.STORY.scenes
+    current = main.STORY.start
+    state = main.new_state()
+    for pick in picks:
+        scene = scenes[current]
+        main.enter_scene(state, current)
+        if not scene.targets:
+            current = main.STORY.start
+            state = main.new_state()
+            continue
+        current = main.take_choice(state, scene, pick % len(scene.targets))
+
+def steps_report(steps=200000):
+    """
+    Steps per second for the original dict walk and the compiled graph.
+    """
+    picks = random_picks(steps)
+    return [
+        {"walk": "dict SCENES", "steps_per_sec": steps / timed(dict_walk, picks)},
+        {"walk": "compiled", "steps_per_sec": steps / timed(compiled_walk, picks)},
+    ]
+
+def run_steps(args):
+    rows = steps_report(args.steps)
+    print(f"{'walk':<12} {'steps/sec':>12}")
+    for row in rows:
+        print(f"{row['walk']:<12} {row['steps_per_sec']:>12,.0f}")
+
+def sample_states():
+    """
+    A mid-game state in both layouts: the original dict and GameState.
+    """
+    route = [("BAY_INTRO", 2), ("SEARCH_CRATES", 1), ("RESTORE_POWER", 2),
+             ("CREW_QUARTERS_1", 1), ("DORM_ROOM_1", 1), ("CREW_QUARTERS_1", 2),
+             ("MAIN_CORRIDOR_1", 1), ("AI_CORE_ENTRANCE", 2), ("SIDE_CORRIDOR", 1),
+             ("DATA_ARCHIVE_1", 2)]
+    legacy = legacy_state()
+    state = main.new_state()
+    walk_loop(legacy, route, 1)
+    walk_loop(state, route, 1)
+    return legacy, state
+
+def snapshots_report(count=100000):
+    """
+    Snapshots per second (save and load) and bytes per snapshot for the
+    binary record, compared with JSON and pickle dumps of the dict STATE.
+    """
+    legacy, state = sample_states()
+    layout = main.save_layout()
+    record = savegame.pack_state(layout, state)
+
+    def json_dump():
+        for _ in range(count):
+            json.dumps(dict(legacy, visited=sorted(legacy["visited"])))
+
+    blob_json = json.dumps(dict(legacy, visited=sorted(legacy["visited"])))
+
+    def json_load():
+        for _ in range(count):
+            loaded = json.loads(blob_json)
+            loaded["visited"] = set(loaded["visited"])
+
+    blob_pickle = pickle.dumps(legacy)
+
+    def pickle_dump():
+        for _ in range(count):
+            pickle.dumps(legacy)
+
+    def pickle_load():
+        for _ in range(count):
+            pickle.loads(blob_pickle)
+
+    def binary_dump():
+        for _ in range(count):
+            savegame.pack_state(layout, state)
+
+    def binary_load():
+        unpack = layout.record.unpack
+        for _ in range(count):
+            savegame.unpack_fields(layout, unpack(record), main.new_state)
+
+    return [
+        {"format": "json", "bytes": len(blob_json.encode("utf-8")),
+         "saves_per_sec": count / timed(json_dump), "loads_per_sec": count / timed(json_load)},
+        {"format": "pickle", "bytes": len(blob_pickle),
+         "saves_per_sec": count / timed(pickle_dump), "loads_per_sec": count / timed(pickle_load)},
+        {"format": "binary", "bytes": len(record),
+         "saves_per_sec": count / timed(binary_dump), "loads_per_sec": count / timed(binary_load)},
+    ]
+
+def run_snapshots(args):
+    rows = snapshots_report(args.count)
+    print(f"{'format':<8} {'bytes':>7} {'saves/sec':>12} {'loads/sec':>12}")
+    for row in rows:
+        print(f"{row['format']:<8} {row['bytes']:>7} {row['saves_per_sec']:>12,.0f} "
+              f"{row['loads_per_sec']:>12,.0f}")
+    print("(binary bytes are per record; a file adds one header per story layout)")
+
+# ---------------------------------------------------------------------------------
+# SESSION STORE
+# ---------------------------------------------------------------------------------
+
+def store_run(path, players, choices, seed=9, **options):
+    """
+    Plays `choices` random choices spread over `players` named sessions
+    through a SessionStore, then closes it and checks every session reads
+    back as it was left. Returns choices/sec and the store's counters.
+    """
+    rng = random.Random(seed)
+    story = main.STORY
+    latest = {}
+    store = sessionstore.SessionStore(path, main.save_layout(), main.new_state, story.start,
+                                      **options)
+    started = time.perf_counter()
+    for _ in range(choices):
+        key = f"player{rng.randrange(players)}"
+        state = store.get(key)
+        if state is None or not story.scenes[state.scene].targets:
+            state = main.new_state(key)
+            main.enter_scene(state, story.start)
+        scene = story.scenes[state.scene]
+        choice = rng.choice(main.available_choices(state, scene))
+        main.enter_scene(state, main.take_choice(state, scene, choice))
+        store.put(key, state)
+        latest[key] = state.key()
+    store.close()
+    elapsed = time.perf_counter() - started
+
+    reopened = sessionstore.SessionStore(path, main.save_layout(), main.new_state, story.start)
+    lost = sum(1 for key, saved in latest.items() if reopened.get(key).key() != saved)
+    reopened.close()
+    return {"choices_per_sec": choices / elapsed, "lost": lost, **store.stats}
+
+def sessions_report(players=5000, choices=50000, synchronous=("NORMAL", "FULL")):
+    """
+    Sustained choices/sec with a commit per choice versus write-behind
+    batching, for each SQLite synchronous level.
+    """
+    rows = []
+    for level in synchronous:
+        for mode, options in (("per-choice", {"flush_size": 1}),
+                              ("write-behind", {})):
+            with tempfile.TemporaryDirectory() as directory:
+                result = store_run(os.path.join(directory, "sessions.db"), players, choices,
+                                   synchronous=level, **options)
+            rows.append({"synchronous": level, "mode": mode, **result})
+    return rows
+
+def run_sessions(args):
+    rows = sessions_report(args.players, args.choices)
+    print(f"{args.choices:,} choices over {args.players:,} sessions "
+          f"(LRU of 1,024, write-behind flushes at 256 sessions or 1 s)")
+    print(f"{'synchronous':<12} {'mode':<13} {'choices/sec':>12} {'commits':>8} "
+          f"{'rows':>8} {'misses':>8} {'lost':>5}")
+    for row in rows:
+        print(f"{row['synchronous']:<12} {row['mode']:<13} {row['choices_per_sec']:>12,.0f} "
+              f"{row['flushes']:>8,} {row['writes']:>8,} {row['misses']:>8,} {row['lost']:>5}")
+
+# ---------------------------------------------------------------------------------
+# PLAY ANALYTICS
+# ---------------------------------------------------------------------------------
+
+@analytics.stage
+def keep_summaries(results):
+    """
+    Pipeline end for the benchmark: counts the summaries, keeps the last.
+    """
+    while True:
+        results["last"] = yield
+        results["windows"] += 1
+
+def events_run(checkpoints, sessions=2000, quit_rate=0.02, window=60.0, seed=9):
+    """
+    Plays random walks in `sessions` concurrent sessions, with players
+    leaving mid-story at `quit_rate` per step, sending their events through
+    the analytics pipeline on a synthetic clock (events 10 ms apart). At
+    each checkpoint (an event count) records events/sec so far, the windows
+    written and this process's memory. Returns the rows and the last totals.
+    """
+    rng = random.Random(seed)
+    story = main.STORY
+    sent = [0]
+
+    def clock():
+        sent[0] += 1
+        return sent[0] * 0.01
+
+    results = {"windows": 0, "last": None}
+    events = analytics.Analytics(None, window, main.ANALYTICS_PAIRS, idle=300.0,
+                                 output=keep_summaries(results), clock=clock)
+    live = [None] * sessions
+    rows = []
+    pending = sorted(checkpoints)
+    started = time.perf_counter()
+    while pending:
+        slot = rng.randrange(sessions)
+        state = live[slot]
+        if state is None:
+            state = live[slot] = main.new_state()
+            index = story.start
+        elif rng.random() < quit_rate:
+            live[slot] = None
+            continue
+        else:
+            scene = story.scenes[state.scene]
+            choice = rng.choice(main.available_choices(state, scene))
+            main.emit_choice(events, state, scene, choice)
+            index = main.take_choice(state, scene, choice)
+        scene = story.scenes[index]
+        main.emit_scene(events, state, scene)
+        main.enter_scene(state, index)
+        if not scene.targets:
+            live[slot] = None
+        if sent[0] >= pending[0]:
+            pending.pop(0)
+            elapsed = time.perf_counter() - started
+            rows.append({"events": sent[0], "events_per_sec": sent[0] / elapsed,
+                         "windows": results["windows"],
+                         "uss_mb": process_memory(os.getpid())["uss"]})
+    events.close()
+    return rows, results["last"]["total"]
+
+def run_events(args):
+    rows, total = events_run(args.events)
+    print("Play analytics pipeline, 2,000 concurrent random walks, 60 s windows "
+          "(synthetic clock, 100 events/s)")
+    print(f"{'events':>10} {'events/sec':>11} {'windows':>8} {'USS MB':>8}")
+    for row in rows:
+        print(f"{row['events']:>10,} {row['events_per_sec']:>11,.0f} {row['windows']:>8,} "
+              f"{row['uss_mb']:>8.1f}")
+    print(f"Totals: ~{total['sessions']:,} sessions, {total['started']:,} started, "
+          f"{total['finished']:,} finished")
+    for scene, entry in total["funnel"].items():
+        print(f"  {scene:<24} {entry['sessions']:>8,} ({entry['of_started']:.1%} of started)")
+    for scene, count, rate in total["dropoff"][:5]:
+        print(f"  left at {scene:<16} {count:>8,} ({rate:.1%} of visits)")
+    for pair, entry in total["before"].items():
+        print(f"  {pair}: {entry['yes']:,} of {entry['entered']:,}")
+    growth = rows[-1]["uss_mb"] - rows[0]["uss_mb"]
+    ok = growth < args.max_growth
+    print(f"memory grew {growth:.1f} MB from {rows[0]['events']:,} to "
+          f"{rows[-1]['events']:,} events")
+    print("ok" if ok else "FAILED")
+    raise SystemExit(0 if ok else 1)
+
+# ---------------------------------------------------------------------------------
+# SYNTHETIC STORIES
+# ---------------------------------------------------------------------------------
+
+def synthetic_scenes(count, seed=9):
+    """
+    Builds a SCENES-style dict with `count` scenes shaped like the built-in
+    story: the same mix of choice counts and effects, descriptions of
+    similar length, two endings leading to a final scene, and every scene
+    reachable from "INTRO".
+    """
+    rng = random.Random(seed)
+    base = list(SCENES.values())
+    widths = [len(scene["choices"]) for scene in base if scene["choices"]]
+    effects = [choice["effects"] for scene in base for choice in scene["choices"]]
+    ids = ["INTRO"] + [f"S{i:06d}" for i in range(1, count - 3)]
+    ids += ["ENDING_SEVER", "ENDING_AMPLIFY", "GAME_DONE"]
+
+    scenes = {}
+    body = len(ids) - 3
+    for i, scene_id in enumerate(ids[:body]):
+        template = rng.choice(base)
+        width = rng.choice(widths)
+        # The first choice moves forward so the whole story stays reachable;
+        # the rest branch anywhere, like the story's loops and detours.
+        targets = [ids[i + 1] if i + 1 < body else rng.choice(ids[body:body + 2])]
+        for _ in range(width - 1):
+            targets.append(ids[rng.randrange(len(ids) - 1)])
+        scenes[scene_id] = {
+            "title": f"{template['title']} ({scene_id})",
+            "description": template["description"],
+            "choices": [{"text": f"Go to {target}", "next_scene": target,
+                         "effects": rng.choice(effects)} for target in targets],
+        }
+    for scene_id in ids[body:]:
+        scenes[scene_id] = dict(SCENES[scene_id])
+    return scenes
+
+def guarded_scenes(count=50, choices=400, seed=9):
+    """
+    Builds a SCENES-style dict of `count` scenes with `choices` choices
+    each. The first choice of every scene has no requirements; each of the
+    others requires one to four of: an item of the built-in story, a flag
+    value, a lower and an upper morality bound.
+    """
+    rng = random.Random(seed)
+    items = [name for scene in SCENES.values() for name in storyfile.scene_items(scene)]
+    ids = [f"G{i:04d}" for i in range(count)]
+
+    def requirement(kind):
+        if kind == 0:
+            return main.has_item(rng.choice(items))
+        if kind == 1:
+            return main.flag_is(rng.choice(main.FLAG_NAMES), rng.random() < 0.5)
+        if kind == 2:
+            return main.morality_at_least(rng.randrange(-3, 4))
+        return main.morality_at_most(rng.randrange(-3, 4))
+
+    return {scene_id: {
+        "title": scene_id,
+        "description": "A room full of doors.",
+        "choices": [{"text": f"Door {number}", "next_scene": rng.choice(ids), "effects": [],
+                     "requires": [requirement(kind) for kind in
+                                  rng.sample(range(4), rng.randint(1, 4) if number else 0)]}
+                    for number in range(choices)],
+    } for scene_id in ids}
+
+def interpreted_choices(state, choices):
+    """
+    The choices a dict state is offered, checking each requirement op as
+    it is written (items by scanning the inventory list).
+    """
+    offered = []
+    for i, choice in enumerate(choices):
+        for op in choice["requires"]:
+            if op[0] == "has_item":
+                ok = op[1] in state["inventory"]
+            elif op[0] == "flag":
+                ok = state[op[1]] == op[2]
+            elif op[0] == "morality_at_least":
+                ok = state["morality"] >= op[1]
+            else:
+                ok = state["morality"] <= op[1]
+            if not ok:
+                break
+        else:
+            offered.append(i)
+    return offered
+
+# ---------------------------------------------------------------------------------
+# SUITE
+# ---------------------------------------------------------------------------------
+
+# Each measurement is (name, value, unit, which direction is better).
+
+class StubIO:
+    """
+    Replaces the terminal while play_scene runs: input() answers from a
+    list of picks, the screen is never cleared, text is written instantly
+    into a buffer.
+    """
+
+    def __init__(self, picks):
+        self.picks = iter(picks)
+
+    def __enter__(self):
+        self.saved = (builtins.input, main.clear_screen, main.INSTANT_RENDER, sys.stdout)
+        builtins.input = lambda prompt="": str(next(self.picks))
+        main.clear_screen = lambda: None
+        main.INSTANT_RENDER = True
+        sys.stdout = io.StringIO()
+        return self
+
+    def __exit__(self, *exc):
+        builtins.input, main.clear_screen, main.INSTANT_RENDER, sys.stdout = self.saved
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def measure_render(repeat=200):
+    """
+    typewrite() throughput with delays zeroed, over every scene's text.
+    """
+    texts = [text for scene in main.STORY.scenes for text, _ in main.scene_text(scene)]
+    chars = sum(len(text) for text in texts) * repeat
+    sink = io.StringIO()
+
+    def render():
+        for _ in range(repeat):
+            for text in texts:
+                main.typewrite(text, 0, sink)
+    return [("render.chars_per_sec", chars / timed(render), "chars/s", "higher")]
+
+def measure_step(steps=20000):
+    """
+    play_scene latency per step with stubbed I/O, without and with the
+    instrumentation hooks installed.
+    """
+    picks = [pick % 2 + 1 for pick in random_picks(steps * 2)]
+    results = []
+    for label, hooks in (("step", None), ("step.instrumented", metrics.Metrics())):
+        latencies = []
+        saved_hooks, main.HOOKS = main.HOOKS, hooks
+        try:
+            with StubIO(picks):
+                shown, session = None, main.start(seed=0)
+                for _ in range(steps):
+                    started = time.perf_counter()
+                    played = main.play_scene(session, shown)
+                    latencies.append(time.perf_counter() - started)
+                    if played is None:
+                        played = None, main.start(seed=0)
+                    shown, session = played
+        finally:
+            main.HOOKS = saved_hooks
+        results += [
+            (f"{label}.latency_p50_us", percentile(latencies, 0.5) * 1e6, "us", "lower"),
+            (f"{label}.latency_p99_us", percentile(latencies, 0.99) * 1e6, "us", "lower"),
+        ]
+    return results
+
+def measure_effects(count=500000):
+    """
+    Cost of applying a folded Effect, and of a choice with no effects.
+    """
+    effects = [effect for scene in main.STORY.scenes for effect in scene.effects
+               if effect is not None]
+    state = main.new_state()
+    scene = main.STORY.scenes[main.SCENE_INDEX["INTRO"]]
+
+    def apply_all():
+        for i in range(count):
+            main.apply_effect(state, effects[i % len(effects)])
+
+    def no_op():
+        for _ in range(count):
+            main.take_choice(state, scene, 0)
+    return [
+        ("effects.apply_ns", timed(apply_all) / count * 1e9, "ns", "lower"),
+        ("effects.noop_choice_ns", timed(no_op) / count * 1e9, "ns", "lower"),
+    ]
+
+def measure_guards(scenes=50, choices=400, states=20, repeat=5):
+    """
+    Cost per choice of deciding which choices to offer, on synthetic scenes
+    with hundreds of guarded choices: compiled Guards against checking the
+    requirement ops on a dict state. Also the cost for a scene without
+    requirements.
+    """
+    source = guarded_scenes(scenes, choices)
+    story = main.compile_story(source, "G0000")
+    rng = random.Random(9)
+    items = sorted(set(main.ITEM_NAMES))
+    pairs = []
+    for _ in range(states):
+        state = main.new_state()
+        legacy = legacy_state()
+        for name in rng.sample(items, rng.randint(0, len(items))):
+            state["inventory"].append(name)
+            legacy["inventory"].append(name)
+        for name in main.FLAG_NAMES:
+            state[name] = legacy[name] = rng.random() < 0.5
+        state.morality = legacy["morality"] = rng.randrange(-4, 5)
+        pairs.append((state, legacy))
+    for state, legacy in pairs:
+        for scene_id, scene in zip(story.ids, story.scenes):
+            if list(main.available_choices(state, scene)) != interpreted_choices(
+                    legacy, source[scene_id]["choices"]):
+                raise RuntimeError(f"compiled guards disagree at {scene_id}")
+
+    def compiled():
+        for _ in range(repeat):
+            for state, _ in pairs:
+                for scene in story.scenes:
+                    main.available_choices(state, scene)
+
+    def interpreted():
+        for _ in range(repeat):
+            for _, legacy in pairs:
+                for scene in source.values():
+                    interpreted_choices(legacy, scene["choices"])
+
+    plain = main.STORY.scenes[main.STORY.start]
+    state = main.new_state()
+    count = 200000
+
+    def unguarded():
+        for _ in range(count):
+            main.available_choices(state, plain)
+    checks = repeat * states * scenes * choices
+    return [
+        ("guards.compiled_ns_per_choice", timed(compiled) / checks * 1e9, "ns", "lower"),
+        ("guards.interpreted_ns_per_choice", timed(interpreted) / checks * 1e9, "ns", "lower"),
+        ("guards.unguarded_scene_ns", timed(unguarded) / count * 1e9, "ns", "lower"),
+    ]
+
+def measure_state(count=200000):
+    """
+    STATE copy and serialize cost, plus bytes per session.
+    """
+    _, state = sample_states()
+    layout = main.save_layout()
+
+    def copy():
+        for _ in range(count):
+            state.copy()
+
+    def serialize():
+        for _ in range(count):
+            savegame.pack_state(layout, state)
+    return [
+        ("state.copy_ns", timed(copy) / count * 1e9, "ns", "lower"),
+        ("state.serialize_ns", timed(serialize) / count * 1e9, "ns", "lower"),
+        ("state.bytes", deep_sizeof(state), "bytes", "lower"),
+    ]
+
+def measure_rewind(steps=10000, repeat=20000):
+    """
+    Memory per rewind history entry over a long random walk (versus a deep
+    copy of the original dict state), and the cost of rewinding 1 choice
+    versus half the history.
+    """
+    rng = random.Random(9)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    session = main.start(seed=0, history=steps)
+    while len(session.history) < steps:
+        if main.is_terminal(session):
+            # Play on in a new game, keeping the one history
+            session = main.start(seed=0)._replace(history=session.history)
+        state = session.state
+        count = len(main.available_choices(state, main.STORY.scenes[state.scene]))
+        _, session = main.step(session, rng.randrange(count) + 1)
+    entry_bytes = (tracemalloc.get_traced_memory()[0] - before) / steps
+    tracemalloc.stop()
+    legacy, _ = sample_states()
+
+    history = session.history
+    marks = (history.end, history.size)
+
+    def back(count):
+        state = session.state
+        for _ in range(repeat):
+            main.rewind(session, count)
+            history.end, history.size = marks
+        state.restore(history.entries[(history.end - 1) % history.limit][0])
+    return [
+        ("rewind.entry_bytes", entry_bytes, "bytes", "lower"),
+        ("rewind.deepcopy_entry_bytes", deep_sizeof(copy.deepcopy(legacy)), "bytes", "lower"),
+        ("rewind.back_1_ns", timed(back, 1) / repeat * 1e9, "ns", "lower"),
+        (f"rewind.back_{steps // 2}_ns", timed(back, steps // 2) / repeat * 1e9, "ns", "lower"),
+    ]
+
+def measure_startup(runs=5):
+    """
+    Time to start Python and import main, best of `runs`.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], cwd=here, check=True)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return [("startup.import_ms", best * 1000, "ms", "lower")]
+
+def measure_file_startup(path, runs=3):
+    """
+    Startup time and resident memory (VmRSS, Linux) of a process that has
+    imported main with the story data file at `path`, best of `runs`.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, ECHO_STORY=path)
+    code = ("import main; print([line.split()[1] for line in open('/proc/self/status')"
+            " if line.startswith('VmRSS:')][0])")
+    best = rss = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], cwd=here, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        rss = int(output) / 1024 if rss is None else min(rss, int(output) / 1024)
+    return best, rss
+
+def measure_scaling(sizes=(1000, 10000, 100000), steps=200000):
+    """
+    Compile time, stepping speed and compiled size for synthetic stories,
+    plus startup time and memory when each is loaded from a data file.
+    """
+    global SCENES
+    results = []
+    picks = random_picks(steps)
+    for size in sizes:
+        scenes = synthetic_scenes(size)
+        started = time.perf_counter()
+        story = main.compile_story(scenes)
+        compile_seconds = time.perf_counter() - started
+
+        # The compiled walk keeps GameState.visited, an int bitset. Ints are
+        # immutable, so testing or setting a bit costs time in proportion
+        # to the highest scene number visited. On the 100,000-scene story
+        # one walk visits some 40,000 scenes before it reaches an ending,
+        # and stepping falls behind the dict walk's set. A mutable bitset
+        # would have to be copied for every rewind snapshot instead.
+        saved = main.STORY, SCENES
+        main.STORY, SCENES = story, scenes
+        try:
+            dict_rate = steps / timed(dict_walk, picks)
+            compiled_rate = steps / timed(compiled_walk, picks)
+        finally:
+            main.STORY, SCENES = saved
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "story.jsonl")
+            storyfile.write_story(scenes, path, main.START_SCENE)
+            started = time.perf_counter()
+            lazy = main.load_story(path)
+            load_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            lazy.scenes[len(lazy.ids) // 2]
+            decode_seconds = time.perf_counter() - started
+            lazy.scenes.file.close()
+            startup_seconds, rss = measure_file_startup(path)
+        prefix = f"scale.{size}"
+        results += [
+            (f"{prefix}.compile_ms", compile_seconds * 1000, "ms", "lower"),
+            (f"{prefix}.dict_steps_per_sec", dict_rate, "steps/s", "higher"),
+            (f"{prefix}.compiled_steps_per_sec", compiled_rate, "steps/s", "higher"),
+            (f"{prefix}.story_mb", deep_sizeof(story) / 1e6, "MB", "lower"),
+            (f"{prefix}.file_load_ms", load_seconds * 1000, "ms", "lower"),
+            (f"{prefix}.first_visit_us", decode_seconds * 1e6, "us", "lower"),
+            (f"{prefix}.file_startup_ms", startup_seconds * 1000, "ms", "lower"),
+            (f"{prefix}.file_rss_mb", rss, "MB", "lower"),
+        ]
+    return results
+
+def measure_layout(sessions=2000, seed=9):
+    """
+    Layout cache behaviour over simulated sessions: random playthroughs by a
+    handful of players on terminals of a few widths. Reports the hit rate
+    and the cost of a cache miss (template fill plus wrap) and a hit.
+    """
+    rng = random.Random(seed)
+    names = ["Alex Riven", "Sam Carter", "Ines Okafor", "Lee"]
+    widths = [80, 100, 119, 159]
+    cache = layout.TextLayout()
+    story = main.STORY
+    miss_seconds = hit_seconds = 0.0
+    for _ in range(sessions):
+        name, width = rng.choice(names), rng.choice(widths)
+        current = story.start
+        for _ in range(200):
+            scene = story.scenes[current]
+            before = cache.stats()["misses"]
+            started = time.perf_counter()
+            cache.render(scene.id, scene.description, width, name)
+            elapsed = time.perf_counter() - started
+            if cache.stats()["misses"] > before:
+                miss_seconds += elapsed
+            else:
+                hit_seconds += elapsed
+            if not scene.targets:
+                break
+            current = scene.targets[rng.randrange(len(scene.targets))]
+    stats = cache.stats()
+    return [
+        ("layout.hit_rate", stats["hit_rate"], "ratio", "higher"),
+        ("layout.miss_us", miss_seconds / max(stats["misses"], 1) * 1e6, "us", "lower"),
+        ("layout.hit_us", hit_seconds / max(stats["hits"], 1) * 1e6, "us", "lower"),
+    ]
+
+class FakeTerminal(io.StringIO):
+    """
+    In-memory output that claims to be a terminal, for the screen driver.
+    """
+
+    def isatty(self):
+        return True
+
+def measure_terminal(rounds=200):
+    """
+    Cost of drawing scene frames through the terminal driver: time and
+    bytes for a frame replacing a different scene (on an erased screen),
+    and bytes for redrawing the same scene (where unchanged text is
+    skipped).
+    """
+    saved = {name: os.environ.get(name) for name in ("COLUMNS", "LINES")}
+    # A fixed 100x60 terminal, so every scene fits and the numbers are stable
+    os.environ.update(COLUMNS="100", LINES="60")
+    try:
+        return terminal_frames(rounds)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def terminal_frames(rounds):
+    out = FakeTerminal()
+    screen = main.terminal.Screen(out)
+    frames = ["\n".join(text for text, _ in main.scene_text(scene, width=99)) + "\n"
+              for scene in main.STORY.scenes]
+    screen.clear()
+
+    def draw_all():
+        for _ in range(rounds):
+            for frame in frames:
+                screen.begin()
+                screen.write(frame)
+                screen.end()
+    out.seek(0)
+    out.truncate()
+    seconds = timed(draw_all)
+    changed_bytes = len(out.getvalue()) / (rounds * len(frames))
+
+    out.seek(0)
+    out.truncate()
+    for frame in frames:
+        screen.begin()
+        screen.write(frame)
+        screen.end()
+        out.seek(0)
+        out.truncate()
+        screen.begin(same=True)
+        screen.write(frame)
+        screen.end()
+    same_bytes = len(out.getvalue()) / len(frames)
+    return [
+        ("terminal.frame_us", seconds / (rounds * len(frames)) * 1e6, "us", "lower"),
+        ("terminal.changed_frame_bytes", changed_bytes, "bytes", "lower"),
+        ("terminal.same_frame_bytes", same_bytes, "bytes", "lower"),
+    ]
+
+def edit_story(path, lines, count, seed=9):
+    """
+    Rewrites a story data file (given as its lines) with the descriptions
+    of `count` random scenes changed, the way an editor saves: a new file
+    renamed over the old one.
+    """
+    rng = random.Random(seed)
+    edited = list(lines)
+    for number in rng.sample(range(1, len(lines)), count):
+        edited[number] = edited[number].replace(b'"description": "', b'"description": "Edited. ', 1)
+    with open(path + ".tmp", "wb") as handle:
+        handle.write(b"\n".join(edited) + b"\n")
+    os.replace(path + ".tmp", path)
+
+def measure_reload(size=100000, edits=(1, 100, 10000)):
+    """
+    Time to pick up an edit to a large story file, for edits of a few
+    sizes, against rebuilding the index from scratch.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "story.jsonl")
+        storyfile.write_story(synthetic_scenes(size), path, main.START_SCENE)
+        with open(path, "rb") as handle:
+            lines = handle.read().rstrip(b"\n").split(b"\n")
+        started = time.perf_counter()
+        storyfile.build_index(path, write=False)
+        results.append((f"reload.{size}.full_index_ms",
+                        (time.perf_counter() - started) * 1000, "ms", "lower"))
+        for count in edits:
+            story = main.load_story(path)
+            edit_story(path, lines, count)
+            started = time.perf_counter()
+            report = story.scenes.reload()
+            elapsed = time.perf_counter() - started
+            story.scenes.file.close()
+            if len(report["changed"]) != count:
+                raise RuntimeError(f"reload saw {len(report['changed'])} of {count} edits")
+            results.append((f"reload.{size}.edit_{count}_ms", elapsed * 1000, "ms", "lower"))
+            storyfile.write_story(synthetic_scenes(size), path, main.START_SCENE)
+    return results
+
+def measure_search(size=100000, visited=300, queries=200, seed=9):
+    """
+    Scanner search on a synthetic story: time to build the inverted index,
+    and per-query time for common words, rare words (scene ids in titles)
+    and several words, filtered by a session's visited scenes, against
+    substring-scanning every description.
+    """
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "story.jsonl")
+        storyfile.write_story(synthetic_scenes(size), path, main.START_SCENE)
+        story = main.load_story(path)
+        texts = [text.lower() for _, text in main.story_texts(story)]
+        started = time.perf_counter()
+        index = scanner.SearchIndex(main.story_texts(story))
+        build_seconds = time.perf_counter() - started
+        ids = story.ids
+        story.scenes.file.close()
+
+    seen = rng.sample(range(size), visited)
+    bits = sum(1 << i for i in seen)
+    common = ["signal", "crew", "static", "the ai", "signal static core"]
+    rare = [ids[i].lower() for i in rng.sample(seen, 5) + rng.sample(range(size), 5)]
+    groups = (("common", common), ("rare", rare),
+              ("mixed", [f"{word} {identifier}" for word, identifier in zip(common, rare)]))
+    results = [(f"search.{size}.build_ms", build_seconds * 1000, "ms", "lower")]
+    for label, words in groups:
+        for query in words:
+            tokens = set(scanner.tokenize(query))
+            expected = [i for i in sorted(seen)
+                        if tokens <= set(scanner.tokenize(texts[i]))]
+            if index.search(query, bits) != expected:
+                raise RuntimeError(f"search for {query!r} disagrees with a scan")
+        latencies = []
+        for _ in range(queries):
+            for query in words:
+                started = time.perf_counter()
+                index.search(query, bits)
+                latencies.append(time.perf_counter() - started)
+        results += [
+            (f"search.{size}.{label}_p50_us", percentile(latencies, 0.5) * 1e6, "us", "lower"),
+            (f"search.{size}.{label}_p99_us", percentile(latencies, 0.99) * 1e6, "us", "lower"),
+        ]
+
+    def scan():
+        for query in common:
+            [i for i, text in enumerate(texts) if query in text and bits >> i & 1]
+    results.append((f"search.{size}.substring_scan_ms", timed(scan) / len(common) * 1000,
+                    "ms", "lower"))
+    return results
+
+def first_character_walks(path, walks, steps, prefetched, width=80, seed=9):
+    """
+    Plays random walks through the story data file at `path`, each with a
+    freshly loaded story and layout cache as in a new game process, and
+    returns the time from each choice to the next scene's text being ready
+    to draw (step()), plus the time spent in prefetch() when `prefetched`,
+    which runs before each choice as it does while the player reads.
+    """
+    rng = random.Random(seed)
+    latencies = []
+    prefetching = []
+    saved = main.STORY, main.LAYOUT
+    try:
+        for _ in range(walks):
+            story = main.STORY = main.load_story(path)
+            main.LAYOUT = layout.TextLayout()
+            session = main.start(seed=0)
+            for _ in range(steps):
+                state = session.state
+                scene = story.scenes[state.scene]
+                if prefetched:
+                    started = time.perf_counter()
+                    for _ in main.prefetch(state, scene, width):
+                        pass
+                    prefetching.append(time.perf_counter() - started)
+                number = rng.randrange(len(main.available_choices(state, scene))) + 1
+                started = time.perf_counter()
+                shown, session = main.step(session, number, width)
+                latencies.append(time.perf_counter() - started)
+                if not shown.choices:
+                    break
+            story.scenes.file.close()
+    finally:
+        main.STORY, main.LAYOUT = saved
+    return latencies, prefetching
+
+def measure_prefetch(size=100000):
+    """
+    Time to first character after a choice, with and without the next
+    scenes prepared while the player reads: on the built-in story (200 new
+    players) and on a synthetic story where nearly every scene is new.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "story.jsonl")
+        storyfile.write_story(synthetic_scenes(size), path, main.START_SCENE)
+        for label, story_path, walks, steps in (("echo9", main.STORY_PATH, 200, 200),
+                                                (str(size), path, 2, 2000)):
+            for mode, prefetched in (("cold", False), ("prefetched", True)):
+                latencies, prefetching = first_character_walks(story_path, walks, steps,
+                                                               prefetched)
+                prefix = f"prefetch.{label}.{mode}"
+                results += [
+                    (f"{prefix}.first_char_p50_us", percentile(latencies, 0.5) * 1e6,
+                     "us", "lower"),
+                    (f"{prefix}.first_char_p99_us", percentile(latencies, 0.99) * 1e6,
+                     "us", "lower"),
+                ]
+                if prefetching:
+                    results.append((f"{prefix}.idle_work_us",
+                                    sum(prefetching) / len(prefetching) * 1e6, "us", "lower"))
+    return results
+
+SUITE = {
+    "render": measure_render,
+    "terminal": measure_terminal,
+    "layout": measure_layout,
+    "step": measure_step,
+    "effects": measure_effects,
+    "guards": measure_guards,
+    "state": measure_state,
+    "rewind": measure_rewind,
+    "startup": measure_startup,
+    "scaling": measure_scaling,
+    "reload": measure_reload,
+    "search": measure_search,
+    "prefetch": measure_prefetch,
+}
+
+def run_suite(names=None):
+    """
+    Runs the named suite sections (all by default) and returns the results
+    document that gets written as JSON.
+    """
+    metrics = {}
+    for name in names or SUITE:
+        for metric, value, unit, better in SUITE[name]():
+            metrics[metric] = {"value": round(value, 3), "unit": unit, "better": better}
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "metrics": metrics,
+    }
+
+def compare(results, baseline, tolerance=0.10):
+    """
+    Compares results with a baseline document. Returns rows of
+    (metric, baseline value, new value, change, regressed).
+    """
+    rows = []
+    for metric, entry in results["metrics"].items():
+        old = baseline.get("metrics", {}).get(metric)
+        if old is None or not old["value"]:
+            continue
+        change = (entry["value"] - old["value"]) / old["value"]
+        worse = -change if entry["better"] == "higher" else change
+        rows.append((metric, old["value"], entry["value"], change, worse > tolerance))
+    return rows
+
+def run_suite_command(args):
+    results = run_suite(args.only)
+    for metric, entry in results["metrics"].items():
+        print(f"{metric:<40} {entry['value']:>16,.3f} {entry['unit']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to store one.")
+        return
+
+    with open(args.baseline, encoding="utf-8") as handle:
+        rows = compare(results, json.load(handle), args.tolerance)
+    print(f"\nAgainst {args.baseline} (tolerance {args.tolerance:.0%}):")
+    for metric, old, new, change, regressed in rows:
+        mark = "REGRESSED" if regressed else ""
+        print(f"{metric:<40} {old:>14,.3f} -> {new:>14,.3f} {change:>+8.1%} {mark}")
+    if any(row[4] for row in rows):
+        raise SystemExit(1)
+
+# ---------------------------------------------------------------------------------
+# SHARED STORY CHECK
+# ---------------------------------------------------------------------------------
+
+# A worker that has read every scene, then waits until stdin closes so the
+# parent can measure it while all workers are alive.
+WORKER_CODE = """
+import sys
+import main
+for scene in main.STORY.scenes:
+    scene.description
+print("ready", flush=True)
+sys.stdin.read()
+"""
+
+def process_memory(pid):
+    """
+    RSS, PSS and USS (private pages) of a process in MB, from
+    /proc/PID/smaps_rollup (Linux).
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as handle:
+        for line in handle:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {"rss": values["Rss"], "pss": values["Pss"],
+            "uss": values["Private_Clean"] + values["Private_Dirty"]}
+
+def measure_workers(count, env):
+    """
+    Starts `count` workers with `env`, waits until each has read the whole
+    story, and returns the mean memory figures per worker.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    workers = [subprocess.Popen([sys.executable, "-c", WORKER_CODE], cwd=here, env=env,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+               for _ in range(count)]
+    try:
+        for worker in workers:
+            if worker.stdout.readline().strip() != "ready":
+                raise RuntimeError("worker failed to start")
+        usage = [process_memory(worker.pid) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+    return {key: sum(item[key] for item in usage) / count for key in usage[0]}
+
+def shared_report(workers=4, sizes=(1000, 100000)):
+    """
+    Per-worker memory for `workers` processes that each load the story
+    themselves versus processes attached to one shared segment, for
+    synthetic stories of each size.
+    """
+    rows = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "story.jsonl")
+            storyfile.write_story(synthetic_scenes(size), path, main.START_SCENE)
+            env = dict(os.environ, ECHO_STORY=path)
+            env.pop("ECHO_SHARED_STORY", None)
+            private = measure_workers(workers, env)
+
+            story = main.load_story(path)
+            shared = sharedstory.SharedStory.create(sharedstory.pack(story, main.ITEM_NAMES))
+            try:
+                attached = measure_workers(workers, dict(env, ECHO_SHARED_STORY=shared.name))
+                segment_mb = shared.buffer.nbytes / 1e6
+            finally:
+                shared.close()
+                shared.unlink()
+                story.scenes.file.close()
+        rows.append({"scenes": size, "segment_mb": segment_mb,
+                     "private": private, "shared": attached})
+    return rows
+
+def run_shared(args):
+    rows = shared_report(args.workers, args.scenes)
+    print(f"{args.workers} workers, MB per worker after reading every scene")
+    print(f"{'scenes':>8} {'mode':<8} {'rss':>8} {'pss':>8} {'uss':>8}")
+    for row in rows:
+        for mode in ("private", "shared"):
+            usage = row[mode]
+            print(f"{row['scenes']:>8} {mode:<8} {usage['rss']:>8.1f} {usage['pss']:>8.1f} "
+                  f"{usage['uss']:>8.1f}")
+    smallest, largest = rows[0], rows[-1]
+    growth = largest["shared"]["uss"] - smallest["shared"]["uss"]
+    saved = largest["private"]["uss"] - largest["shared"]["uss"]
+    ok = growth < args.max_growth and saved > 0
+    print(f"shared worker USS grew {growth:.1f} MB from {smallest['scenes']} to "
+          f"{largest['scenes']} scenes; {saved:.1f} MB private memory saved per worker")
+    print("ok" if ok else "FAILED")
+    raise SystemExit(0 if ok else 1)
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+def run():
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Echoes of the Signal benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    memory = commands.add_parser("memory", help="bytes per session, before and after")
+    memory.add_argument("--loops", type=int, default=10000)
+    memory.set_defaults(handler=run_memory)
+
+    steps = commands.add_parser("steps", help="steps/sec, dict walk vs compiled graph")
+    steps.add_argument("--steps", type=int, default=200000)
+    steps.set_defaults(handler=run_steps)
+
+    snapshots = commands.add_parser("snapshots", help="save/load speed and size vs JSON and pickle")
+    snapshots.add_argument("--count", type=int, default=100000)
+    snapshots.set_defaults(handler=run_snapshots)
+
+    sessions = commands.add_parser("sessions",
+                                   help="session store choices/sec, per-choice commit vs batched")
+    sessions.add_argument("--players", type=int, default=5000)
+    sessions.add_argument("--choices", type=int, default=50000)
+    sessions.set_defaults(handler=run_sessions)
+
+    events = commands.add_parser("events", help="analytics pipeline events/sec and memory")
+    events.add_argument("--events", type=int, nargs="+", default=[200000, 1000000, 2000000],
+                        help="event counts at which to measure")
+    events.add_argument("--max-growth", type=float, default=2.0,
+                        help="MB memory may grow from the first to the last count")
+    events.set_defaults(handler=run_events)
+
+    shared = commands.add_parser("shared", help="worker memory, private vs shared-memory story")
+    shared.add_argument("--workers", type=int, default=4)
+    shared.add_argument("--scenes", type=int, nargs="+", default=[1000, 100000],
+                        help="story sizes to compare (smallest first)")
+    shared.add_argument("--max-growth", type=float, default=5.0,
+                        help="MB a shared worker may grow from the smallest to the largest story")
+    shared.set_defaults(handler=run_shared)
+
+    suite = commands.add_parser("suite", help="full benchmark suite with JSON output")
+    suite.add_argument("--only", nargs="+", choices=sorted(SUITE), default=None)
+    suite.add_argument("--output", help="write the results JSON here")
+    suite.add_argument("--baseline", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json"))
+    suite.add_argument("--update-baseline", action="store_true",
+                       help="store these results as the new baseline")
+    suite.add_argument("--tolerance", type=float, default=0.10,
+                       help="relative change that counts as a regression")
+    suite.set_defaults(handler=run_suite_command)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,319 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: STATE-SPACE EXPLORER
+# ---------------------------------------------------------------------------------
+# Walks every reachable (scene, state) combination of the compiled story,
+# starting from the start scene, breadth first. It reports which endings can be
+# reached, the shortest choice path to each of them, every scene that can never
+# be reached, the loops that change morality on every pass (such as the
+# DORM_ROOM_1 <-> CREW_QUARTERS_1 photo loop) and so have no bound, and the
+# dead ends: states from which no ending can be reached any more, e.g.
+# because a choice's requirements can no longer be met.
+#
+# States are deduplicated by a canonical key, transitions are memoized, and
+# large frontiers are split across a ProcessPoolExecutor.
+#
+# Usage:
+#   python explore.py [--workers 4] [--memory-mb 256] [--ignore-visited] [--json]
+# ---------------------------------------------------------------------------------
+
+import argparse
+import collections
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import main
+
+# Frontiers smaller than this are expanded in-process; sending them to the
+# pool costs more than it saves.
+PARALLEL_THRESHOLD = 2048
+
+# ---------------------------------------------------------------------------------
+# STATE KEYS AND TRANSITIONS
+# ---------------------------------------------------------------------------------
+
+# A canonical key is (scene, morality, flags, visited, inventory). The player's
+# name, health and play time never change what a choice does, so they are left
+# out. With --ignore-visited the visited bitset is left out as well.
+
+_STORY = None
+_TRACK_VISITED = True
+
+def _init_worker(story, track_visited):
+    """
+    Sets the story the transition functions work on, in this process.
+    """
+    global _STORY, _TRACK_VISITED
+    _STORY = story
+    _TRACK_VISITED = track_visited
+    successors.cache_clear()
+
+def start_key(story, track_visited=True):
+    """
+    Returns the key for a new game standing on the start scene.
+    """
+    state = main.new_state()
+    main.enter_scene(state, story.start)
+    return (story.start, state.morality, state.flags,
+            state.visited if track_visited else 0, state.inventory)
+
+def key_state(state, key):
+    """
+    Sets a state's fields from a canonical key and returns it.
+    """
+    state.scene, state.morality, state.flags, state.visited, state.inventory = key
+    return state
+
+@lru_cache(maxsize=1 << 16)
+def successors(key):
+    """
+    Returns ((choice index, next key), ...) for every choice available in
+    the state described by `key` (choices whose requirements do not hold
+    are left out).
+    """
+    scene = _STORY.scenes[key[0]]
+    result = []
+    for choice_index in main.available_choices(key_state(main.new_state(), key), scene):
+        state = key_state(main.new_state(), key)
+        target = main.take_choice(state, scene, choice_index)
+        main.enter_scene(state, target)
+        result.append((choice_index, (target, state.morality, state.flags,
+                                      state.visited if _TRACK_VISITED else 0,
+                                      state.inventory)))
+    return tuple(result)
+
+def expand_many(keys):
+    """
+    Expands a chunk of frontier keys. Runs in pool workers.
+    """
+    return [(key, successors(key)) for key in keys]
+
+def chunked(items, count):
+    """
+    Splits a list into at most `count` roughly equal chunks.
+    """
+    size = max(1, -(-len(items) // count))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+# ---------------------------------------------------------------------------------
+# EXPLORATION
+# ---------------------------------------------------------------------------------
+
+# Rough cost of one explored state: the key tuple and its ints, the parent
+# entry and the dict slots holding them.
+BYTES_PER_STATE = 400
+
+def abstract(key):
+    """
+    The key without morality, the one field that loops can grow forever.
+    """
+    return (key[0],) + key[2:]
+
+def ancestors(parents, key):
+    """
+    Yields `key` and then each of its BFS ancestors back to the start.
+    """
+    while key is not None:
+        yield key
+        key = parents[key][0]
+
+def canonical_cycle(scenes):
+    """
+    Rotates a cycle of scene IDs so equal cycles compare equal.
+    """
+    start = scenes.index(min(scenes))
+    return tuple(scenes[start:] + scenes[:start])
+
+def explore(story=None, workers=None, memory_mb=256, track_visited=True):
+    """
+    Explores the story's state space and returns a report dict.
+    """
+    story = story or main.STORY
+    workers = os.cpu_count() if workers is None else workers
+    max_states = memory_mb * 1024 * 1024 // BYTES_PER_STATE
+    _init_worker(story, track_visited)
+
+    root = start_key(story, track_visited)
+    parents = {root: (None, None)}
+    children = {}
+    first_reach = {root[0]: root}
+    loops = {}
+    frontier = [root]
+    truncated = False
+
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                   initargs=(story, track_visited))
+    try:
+        while frontier and not truncated:
+            if pool is not None and len(frontier) >= PARALLEL_THRESHOLD:
+                expanded = []
+                for part in pool.map(expand_many, chunked(frontier, workers * 4)):
+                    expanded.extend(part)
+            else:
+                expanded = expand_many(frontier)
+
+            next_frontier = []
+            for key, edges in expanded:
+                next_keys = children[key] = []
+                for choice_index, next_key in edges:
+                    next_keys.append(next_key)
+                    if next_key in parents:
+                        continue
+                    pumped = pumping_loop(story, parents, key, next_key)
+                    if pumped is not None:
+                        cycle, delta, ancestor = pumped
+                        loops.setdefault(cycle, delta)
+                        # Follow the loop back to the state it repeats
+                        next_keys[-1] = ancestor
+                        continue
+                    if len(parents) >= max_states:
+                        truncated = True
+                        break
+                    parents[next_key] = (key, choice_index)
+                    first_reach.setdefault(next_key[0], next_key)
+                    next_frontier.append(next_key)
+            frontier = next_frontier
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    stuck = None if truncated else dead_ends(story, children)
+    return build_report(story, parents, first_reach, loops, truncated, stuck)
+
+def dead_ends(story, children):
+    """
+    Returns the explored states from which no ending can be reached. An
+    edge that closes a morality loop is followed back to the state the loop
+    started from, so a requirement on morality that only more passes
+    through the loop could meet is not seen.
+    """
+    parents_of = {}
+    for key, next_keys in children.items():
+        for next_key in next_keys:
+            parents_of.setdefault(next_key, []).append(key)
+    ending = [scene.id.startswith("ENDING_") or not scene.targets for scene in story.scenes]
+    reaching = {key for key in children if ending[key[0]]}
+    frontier = list(reaching)
+    while frontier:
+        key = frontier.pop()
+        for parent in parents_of.get(key, ()):
+            if parent not in reaching:
+                reaching.add(parent)
+                frontier.append(parent)
+    return [key for key in children if key not in reaching]
+
+def pumping_loop(story, parents, key, next_key):
+    """
+    If `next_key` repeats an ancestor of `key` with only morality changed,
+    returns (cycle of scene IDs, morality change per pass, the ancestor);
+    otherwise None.
+    """
+    target = abstract(next_key)
+    path = []
+    for ancestor in ancestors(parents, key):
+        path.append(story.ids[ancestor[0]])
+        if abstract(ancestor) == target and ancestor[1] != next_key[1]:
+            cycle = canonical_cycle(list(reversed(path)))
+            return cycle, next_key[1] - ancestor[1], ancestor
+    return None
+
+def choice_path(story, parents, key):
+    """
+    Returns the (scene ID, choice text) steps that lead from the start to `key`.
+    """
+    steps = []
+    while parents[key][0] is not None:
+        parent, choice_index = parents[key]
+        scene = story.scenes[parent[0]]
+        steps.append((scene.id, scene.texts[choice_index]))
+        key = parent
+    steps.reverse()
+    return steps
+
+def build_report(story, parents, first_reach, loops, truncated, stuck):
+    """
+    Turns the exploration tables into the report dict.
+    """
+    endings = {}
+    for scene in story.scenes:
+        if scene.id.startswith("ENDING_") or not scene.targets:
+            index = story.index[scene.id]
+            reached = first_reach.get(index)
+            endings[scene.id] = {
+                "reachable": reached is not None,
+                "shortest_path": None if reached is None else [
+                    {"scene": scene_id, "choice": text}
+                    for scene_id, text in choice_path(story, parents, reached)
+                ],
+            }
+    return {
+        "states": len(parents),
+        "truncated": truncated,
+        "endings": endings,
+        "unreachable_scenes": [scene_id for i, scene_id in enumerate(story.ids)
+                               if i not in first_reach],
+        "unbounded_loops": [{"cycle": list(cycle), "morality_per_pass": delta}
+                            for cycle, delta in sorted(loops.items())],
+        # Scene ID -> number of dead-end states on it (None if truncated)
+        "dead_ends": None if stuck is None else dict(sorted(
+            collections.Counter(story.ids[key[0]] for key in stuck).items())),
+    }
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+def print_report(report):
+    print(f"States explored: {report['states']}"
+          + (" (stopped at the memory budget)" if report["truncated"] else ""))
+    print("\nEndings:")
+    for scene_id, ending in report["endings"].items():
+        if not ending["reachable"]:
+            print(f"  {scene_id}: unreachable")
+            continue
+        print(f"  {scene_id}: {len(ending['shortest_path'])} choices")
+        for step in ending["shortest_path"]:
+            print(f"      {step['scene']}: {step['choice']}")
+    print("\nUnreachable scenes: " + (", ".join(report["unreachable_scenes"]) or "none"))
+    print("\nUnbounded loops:")
+    for loop in report["unbounded_loops"]:
+        print(f"  {' -> '.join(loop['cycle'])} (morality {loop['morality_per_pass']:+d} per pass)")
+    if not report["unbounded_loops"]:
+        print("  none")
+    print("\nDead ends (states from which no ending can be reached):")
+    if report["dead_ends"] is None:
+        print("  not checked (exploration stopped at the memory budget)")
+    for scene_id, count in (report["dead_ends"] or {}).items():
+        print(f"  {scene_id}: {count} states")
+    if report["dead_ends"] == {}:
+        print("  none")
+
+def run():
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Explore every reachable story state")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU, 1 disables the pool)")
+    parser.add_argument("--memory-mb", type=int, default=256,
+                        help="stop exploring once the state table would exceed this")
+    parser.add_argument("--ignore-visited", action="store_true",
+                        help="treat states that differ only in visited scenes as equal")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = explore(workers=args.workers, memory_mb=args.memory_mb,
+                     track_visited=not args.ignore_visited)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,158 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: TEXT LAYOUT
+# ---------------------------------------------------------------------------------
+# Scene descriptions are written with hard line breaks for about 80 columns
+# and always name the default hero, Dr. Alex Riven. The layout layer compiles
+# each description once into a template:
+#
+#   - the hero's name is replaced by slots for the player's full name and
+#     surname ("Dr. Alex Riven" -> "Dr. <name>", "Dr. Riven" -> "Dr. <surname>")
+#   - the text is split into paragraphs and hard lines; a line break is kept
+#     when the next line starts with indentation, a quote, a bullet or a rule,
+#     and is treated as a soft wrap otherwise
+#
+# Rendering fills in the name and rewraps the soft lines to the terminal width.
+# Rendered text is kept in a bounded LRU cache keyed by (template, width,
+# name), so revisiting a scene costs no formatting work. When a description
+# changes its template changes with it; renders of the old text are never hit
+# again and age out of the cache, and renders of other scenes stay cached.
+#
+# This module does not import main.
+# ---------------------------------------------------------------------------------
+
+import shutil
+import textwrap
+from functools import lru_cache
+
+DEFAULT_NAME = "Alex Riven"
+
+# Name patterns: (text, literal kept in front of the slot, slot).
+NAME_PATTERNS = (
+    ("Alex Riven", "", "full"),
+    ("Dr. Riven", "Dr. ", "surname"),
+)
+
+# A line starting with one of these keeps its line break.
+HARD_LINE_STARTS = (" ", "\t", '"', "'", "•", "*", "-", "[")
+
+MIN_WIDTH = 20
+
+def terminal_width():
+    """
+    Usable width of the terminal, one column short of the edge.
+    """
+    return max(MIN_WIDTH, shutil.get_terminal_size((81, 24)).columns - 1)
+
+def split_names(text):
+    """
+    Splits text around the hero's name. Returns a tuple alternating literal
+    text and slot names ("full"/"surname"), always starting with a literal.
+    """
+    parts = [text]
+    for pattern, prefix, slot in NAME_PATTERNS:
+        result = []
+        for index, part in enumerate(parts):
+            if index % 2 or pattern not in part:
+                result.append(part)
+                continue
+            pieces = part.split(pattern)
+            result.append(pieces[0])
+            for piece in pieces[1:]:
+                result[-1] += prefix
+                result += [slot, piece]
+        parts = result
+    return tuple(parts)
+
+def fill_names(parts, name):
+    """
+    Joins the parts of split_names(), filling the slots from `name`.
+    """
+    surname = name.split()[-1] if name.split() else name
+    values = {"full": name, "surname": surname}
+    return "".join(part if index % 2 == 0 else values[part]
+                   for index, part in enumerate(parts))
+
+def paragraphs(text):
+    """
+    Splits text into paragraphs of hard lines, joining soft-wrapped lines.
+    """
+    result = []
+    for block in text.split("\n\n"):
+        lines = []
+        for line in block.split("\n"):
+            if lines and line and not line.startswith(HARD_LINE_STARTS) \
+                    and not lines[-1].startswith(("-", "*")) and lines[-1].strip():
+                lines[-1] += " " + line.strip()
+            else:
+                lines.append(line)
+        result.append(lines)
+    return result
+
+def wrap(text, width):
+    """
+    Rewraps text to `width`, keeping paragraphs and hard line breaks.
+    """
+    blocks = []
+    for lines in paragraphs(text):
+        wrapped = []
+        for line in lines:
+            indent = line[:len(line) - len(line.lstrip())]
+            if len(line) <= width or not line.strip():
+                wrapped.append(line)
+            else:
+                wrapped.extend(textwrap.wrap(line, width, subsequent_indent=indent,
+                                             break_on_hyphens=False, break_long_words=False))
+        blocks.append("\n".join(wrapped))
+    return "\n\n".join(blocks)
+
+class TextLayout:
+    """
+    Templates for scene descriptions plus the LRU cache of rendered text.
+    """
+
+    def __init__(self, maxsize=512):
+        self.templates = {}
+        self._render = lru_cache(maxsize=maxsize)(self._render_uncached)
+
+    def template(self, key, text):
+        """
+        Returns the compiled template for a description, compiling it once.
+        """
+        template = self.templates.get(key)
+        if template is None or (template[0] is not text and template[0] != text):
+            template = self.templates[key] = (text, split_names(text))
+        return template[1]
+
+    def render(self, key, text, width=None, name=DEFAULT_NAME):
+        """
+        Returns `text` (the description stored under `key`) with the player's
+        name filled in and, if `width` is given, rewrapped to that width.
+        """
+        return self._render(self.template(key, text), width, name)
+
+    def _render_uncached(self, parts, width, name):
+        text = fill_names(parts, name)
+        if width is not None:
+            text = wrap(text, width)
+        return text
+
+    def forget(self, key=None):
+        """
+        Drops the template for `key`, or every template and the whole cache.
+        """
+        if key is None:
+            self.templates.clear()
+            self._render.cache_clear()
+        else:
+            self.templates.pop(key, None)
+
+    def stats(self):
+        """
+        Cache hit/miss counts and hit rate.
+        """
+        info = self._render.cache_info()
+        lookups = info.hits + info.misses
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize,
+                "maxsize": info.maxsize,
+                "hit_rate": round(info.hits / lookups, 4) if lookups else None}
@@ -0,0 +1,457 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: LOAD GENERATOR
+# ---------------------------------------------------------------------------------
+# Finds out how many terminal games (python main.py, one process per player)
+# a machine can run at once before they slow each other down. For each load
+# level it keeps that many game processes running for a fixed time, each on
+# its own pipes (or pseudo-terminal, --pty), and plays them like players do:
+# it answers the name prompt, waits for the choice prompt, picks a choice by
+# the policy and starts a new game whenever one ends. Everything runs on
+# this machine; the games are the real program with its typewriter delays
+# (--instant turns them off to find the CPU-bound ceiling). The clock for a
+# level starts once every game has shown its first choice, so start-up is
+# not counted as load.
+#
+# Per level it reports:
+#   - step latency: from sending a choice to the first byte of the next
+#     scene and to its choice prompt (the whole scene drawn), p50/p90/p99
+#   - steps per second and games completed per minute
+#   - CPU used by the games (from the rusage of the exited processes) and by
+#     this driver, as a share of one core
+#   - resident memory of the game processes, sampled from /proc (Linux)
+# and then the knee of the throughput curve: the last level whose steps per
+# second still grew at least --efficiency (80%) as fast as the load did.
+#
+# Under --pty the games read keys in cbreak mode, as in a real terminal;
+# TERM=dumb keeps their output plain text so the prompts can be read back.
+# That is also when they prepare the next scenes while waiting for a choice
+# (main.py's prefetch); --no-prefetch runs them without it, so "1st" (the
+# time to the first byte of the next scene) can be compared.
+#
+# Usage:
+#   python loadgen.py [--levels 1 2 4 8 16 32] [--duration 60] [--instant]
+#                     [--policy random|first] [--think SECONDS] [--pty]
+#                     [--max-steps 500] [--seed 9] [--json FILE] [--no-prefetch]
+# ---------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import resource
+import signal
+import sys
+import tempfile
+import time
+
+import main
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+NAME_PROMPT = main.NAME_PROMPT.encode("utf-8")
+RESUME_PROMPT = main.RESUME_PROMPT.encode("utf-8")
+CHOICE_PROMPT = main.CHOICE_PROMPT.encode("utf-8")
+FAREWELL = main.FAREWELL_TEXT.encode("utf-8")
+CHOICE_LINE = re.compile(rb"^\[(\d+)\]", re.MULTILINE)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+# ---------------------------------------------------------------------------------
+# GAME PROCESSES
+# ---------------------------------------------------------------------------------
+
+class Output:
+    """
+    Collects a game's output from a pipe or pseudo-terminal without
+    blocking the event loop, noting when the first byte after each
+    answer arrives.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.buffer = bytearray()
+        self.closed = False
+        self.first_byte = None
+        self.waiter = None
+        os.set_blocking(fd, False)
+        asyncio.get_running_loop().add_reader(fd, self._ready)
+
+    def _ready(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            # A pseudo-terminal reports EIO once the game has exited
+            data = b""
+        if data:
+            if self.first_byte is None:
+                self.first_byte = time.perf_counter()
+            self.buffer += data.replace(b"\r\n", b"\n")
+        else:
+            self.close()
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def wait(self):
+        """
+        Returns a future that is done once there is output or the game has
+        closed its end.
+        """
+        self.waiter = asyncio.get_running_loop().create_future()
+        if self.buffer or self.closed:
+            self.waiter.set_result(None)
+        return self.waiter
+
+    def take(self):
+        """
+        Returns the output so far and starts a new answer.
+        """
+        text = bytes(self.buffer)
+        self.buffer.clear()
+        self.first_byte = None
+        return text
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+
+async def spawn(seed, options):
+    """
+    Starts one game. Returns (process, Output, fd to write answers to).
+    """
+    env = dict(os.environ, ECHO_SAVE=options.save_path)
+    env.pop("ECHO_SHARED_STORY", None)
+    if options.instant:
+        env["ECHO_INSTANT"] = "1"
+    command = [sys.executable, os.path.join(HERE, "main.py"), "--seed", str(seed)]
+    if options.no_prefetch:
+        command.append("--no-prefetch")
+    # Each game runs in a session of its own, so a Ctrl-C here reaches only
+    # this driver, which then stops the games itself.
+    if options.pty:
+        import pty
+        env["TERM"] = "dumb"
+        parent, child = pty.openpty()
+        process = await asyncio.create_subprocess_exec(
+            *command, cwd=HERE, env=env, stdin=child, stdout=child, stderr=child,
+            start_new_session=True)
+        os.close(child)
+        return process, Output(parent), os.dup(parent)
+    read_end, game_out = os.pipe()
+    game_in, write_end = os.pipe()
+    process = await asyncio.create_subprocess_exec(
+        *command, cwd=HERE, env=env, stdin=game_in, stdout=game_out,
+        stderr=asyncio.subprocess.DEVNULL, start_new_session=True)
+    os.close(game_out)
+    os.close(game_in)
+    return process, Output(read_end), write_end
+
+def pick_choice(policy, rng, count):
+    if policy == "first":
+        return 1
+    return rng.randint(1, count)
+
+async def play_game(seed, options, level, ready):
+    """
+    Plays one game to its farewell (or --max-steps choices), recording
+    each step's latencies in `level` while it is measuring. `ready` is
+    called at the first choice prompt. Returns True if the game finished,
+    False if it was given up, None if the level stopped it.
+    """
+    rng = random.Random(seed)
+    process, output, answers = await spawn(seed, options)
+    level.pids.add(process.pid)
+    steps = 0
+    finished = False
+    text = b""
+    try:
+        while True:
+            await asyncio.wait((output.wait(), level.stopped),
+                               return_when=asyncio.FIRST_COMPLETED)
+            if level.stopped.done():
+                finished = None
+                break
+            text += output.buffer
+            output.buffer.clear()
+            if output.closed:
+                finished = FAREWELL in text
+                break
+            if text.endswith(NAME_PROMPT):
+                answer = b"Load Tester\n"
+            elif text.endswith(RESUME_PROMPT):
+                answer = b"n\n"
+            elif text.endswith(CHOICE_PROMPT):
+                now = time.perf_counter()
+                if steps == 0:
+                    ready()
+                elif level.measuring:
+                    level.first_byte.append(output.first_byte - sent)
+                    level.latency.append(now - sent)
+                    level.steps += 1
+                if steps >= options.max_steps:
+                    break
+                count = max([int(number) for number in CHOICE_LINE.findall(text)] or [1])
+                answer = f"{pick_choice(options.policy, rng, count)}\n".encode("ascii")
+                steps += 1
+                if options.think:
+                    await asyncio.sleep(options.think)
+            else:
+                continue
+            text = b""
+            output.take()
+            sent = time.perf_counter()
+            os.write(answers, answer)
+    finally:
+        os.close(answers)
+        output.close()
+        if process.returncode is None:
+            process.send_signal(signal.SIGKILL)
+        await process.wait()
+        level.pids.discard(process.pid)
+    return finished
+
+# ---------------------------------------------------------------------------------
+# LOAD LEVELS
+# ---------------------------------------------------------------------------------
+
+class Level:
+    """
+    Measurements for one load level.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.measuring = False
+        self.stopped = asyncio.get_running_loop().create_future()
+        self.pids = set()
+        self.latency = []
+        self.first_byte = []
+        self.steps = 0
+        self.completed = 0
+        self.abandoned = 0
+        self.rss = []
+        self.peak_total_rss = 0
+
+def process_rss(pid):
+    """
+    Resident memory of a process in bytes, or None once it has exited.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as handle:
+            return int(handle.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+async def sample_memory(level, interval=0.5):
+    while True:
+        sizes = [size for size in map(process_rss, list(level.pids)) if size]
+        level.rss.extend(sizes)
+        level.peak_total_rss = max(level.peak_total_rss, sum(sizes))
+        await asyncio.sleep(interval)
+
+def process_cpu(pid):
+    """
+    CPU seconds a running process has used so far (0 once it has exited).
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as handle:
+            fields = handle.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+def cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+async def run_level(sessions, options, seeds):
+    """
+    Starts `sessions` games and, once each has shown its first choice,
+    measures for options.duration seconds while every game that ends is
+    replaced by a new one. Games still running at the end are stopped.
+    """
+    level = Level(sessions)
+    waiting = [sessions]
+    all_ready = asyncio.Event()
+
+    def ready():
+        waiting[0] -= 1
+        if waiting[0] == 0:
+            all_ready.set()
+
+    async def player():
+        first = ready
+        while True:
+            finished = await play_game(next(seeds), options, level, first)
+            first = lambda: None
+            if finished is None:
+                return
+            if level.measuring:
+                if finished:
+                    level.completed += 1
+                else:
+                    level.abandoned += 1
+
+    players = asyncio.gather(*(player() for _ in range(sessions)))
+    sampler = asyncio.create_task(sample_memory(level))
+    try:
+        await asyncio.wait_for(all_ready.wait(), max(60.0, options.duration))
+    except asyncio.TimeoutError:
+        print("  not every game reached a choice; measuring anyway", file=sys.stderr)
+
+    # The games' CPU time is what the exited games used from here on, less
+    # what the games already running had used before the window opened.
+    children = cpu_seconds(resource.RUSAGE_CHILDREN) + sum(map(process_cpu, list(level.pids)))
+    driver = cpu_seconds(resource.RUSAGE_SELF)
+    level.measuring = True
+    started = time.perf_counter()
+    await asyncio.sleep(options.duration)
+    level.measuring = False
+    elapsed = time.perf_counter() - started
+    level.stopped.set_result(None)
+    await players
+    sampler.cancel()
+    return summarize(level, elapsed, cpu_seconds(resource.RUSAGE_CHILDREN) - children,
+                     cpu_seconds(resource.RUSAGE_SELF) - driver)
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def milliseconds(value):
+    return None if value is None else round(value * 1000, 2)
+
+def summarize(level, elapsed, game_cpu, driver_cpu):
+    """
+    The report row for one level.
+    """
+    return {
+        "sessions": level.sessions,
+        "seconds": round(elapsed, 2),
+        "steps": level.steps,
+        "steps_per_sec": round(level.steps / elapsed, 2),
+        "completed": level.completed,
+        "completed_per_min": round(level.completed * 60 / elapsed, 2),
+        "abandoned": level.abandoned,
+        "latency_ms": {name: milliseconds(percentile(level.latency, fraction))
+                       for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))},
+        "first_byte_ms": {name: milliseconds(percentile(level.first_byte, fraction))
+                          for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))},
+        "game_cpu_percent": round(game_cpu / elapsed * 100, 1),
+        "driver_cpu_percent": round(driver_cpu / elapsed * 100, 1),
+        "rss_mb": {
+            "mean": round(sum(level.rss) / len(level.rss) / 2**20, 1) if level.rss else None,
+            "max": round(max(level.rss) / 2**20, 1) if level.rss else None,
+            "peak_total": round(level.peak_total_rss / 2**20, 1),
+        },
+    }
+
+def find_knee(rows, efficiency=0.8):
+    """
+    The last level, in order, whose throughput (steps per second) grew at
+    least `efficiency` times as fast as the number of sessions since the
+    first level. None if even the first level did no work.
+    """
+    base = rows[0]
+    if not base["steps_per_sec"]:
+        return None
+    per_session = base["steps_per_sec"] / base["sessions"]
+    knee = base["sessions"]
+    for row in rows[1:]:
+        if row["steps_per_sec"] < efficiency * per_session * row["sessions"]:
+            break
+        knee = row["sessions"]
+    return knee
+
+async def run_levels(options):
+    rng = random.Random(options.seed)
+    seeds = (rng.randrange(1 << 32) for _ in itertools.count())
+    rows = []
+    for sessions in options.levels:
+        row = await run_level(sessions, options, seeds)
+        rows.append(row)
+        print_row(row)
+    return rows
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+HEADER = (f"{'sessions':>8} {'steps/s':>9} {'games/min':>9} {'p50 ms':>8} {'p90 ms':>8} "
+          f"{'p99 ms':>8} {'1st p50':>8} {'1st p99':>8} {'game cpu':>9} {'driver':>7} "
+          f"{'rss MB':>7}")
+
+def print_row(row):
+    def number(value):
+        return "-" if value is None else f"{value:,.1f}"
+    latency, first = row["latency_ms"], row["first_byte_ms"]
+    print(f"{row['sessions']:>8} {row['steps_per_sec']:>9,.1f} {row['completed_per_min']:>9,.1f} "
+          f"{number(latency['p50']):>8} {number(latency['p90']):>8} {number(latency['p99']):>8} "
+          f"{number(first['p50']):>8} {number(first['p99']):>8} "
+          f"{row['game_cpu_percent']:>8.0f}% {row['driver_cpu_percent']:>6.0f}% "
+          f"{number(row['rss_mb']['mean']):>7}", flush=True)
+
+def run():
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Load-test the terminal game")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="concurrent games at each load level")
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="seconds to measure each level (default: 60)")
+    parser.add_argument("--policy", choices=["random", "first"], default="random",
+                        help="how players pick: at random, or always the first choice")
+    parser.add_argument("--think", type=float, default=0.0, metavar="SECONDS",
+                        help="pause before each answer, like a player reading")
+    parser.add_argument("--max-steps", type=int, default=500,
+                        help="stop a game after this many choices")
+    parser.add_argument("--instant", action="store_true",
+                        help="run the games with ECHO_INSTANT=1 (no typewriter delays)")
+    parser.add_argument("--pty", action="store_true",
+                        help="run each game on a pseudo-terminal instead of pipes")
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="run the games with --no-prefetch")
+    parser.add_argument("--efficiency", type=float, default=0.8,
+                        help="scaling below this fraction of linear marks the knee")
+    parser.add_argument("--seed", type=int, default=9)
+    parser.add_argument("--json", metavar="FILE", help="also write the report as JSON")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # No saved game, so every game starts at the name prompt
+        options.save_path = os.path.join(directory, "none.sav")
+        print(f"{len(options.levels)} levels of {options.duration:g} s, "
+              f"{'pseudo-terminals' if options.pty else 'pipes'}, "
+              f"{'instant' if options.instant else 'typewriter'} output, "
+              f"{options.policy} choices, {os.cpu_count()} CPUs")
+        print(HEADER)
+        rows = asyncio.run(run_levels(options))
+
+    knee = find_knee(rows, options.efficiency)
+    best = max(rows, key=lambda row: row["steps_per_sec"])
+    print(f"\nThroughput peaked at {best['steps_per_sec']:,.1f} steps/s "
+          f"with {best['sessions']} sessions.")
+    if knee is None:
+        print("No steps completed; no knee.")
+    else:
+        print(f"Knee: {knee} sessions (the last level scaling at least "
+              f"{options.efficiency:.0%} of linear).")
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as handle:
+            json.dump({"levels": rows, "knee_sessions": knee,
+                       "options": {key: value for key, value in vars(options).items()
+                                   if key not in ("save_path", "json")}}, handle, indent=2)
+
+if __name__ == "__main__":
+    run()
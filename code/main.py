@@ -17,29 +17,96 @@
 # This script uses a basic text interface to guide you through the narrative.
 # ---------------------------------------------------------------------------------
 
+import argparse
 import time
 import os
 import random
+from collections import namedtuple
+
+import analytics
+import layout
+import metrics
+import recording
+import savegame
+import scanner
+import sharedstory
+import storyfile
+import terminal
 
 # ---------------------------------------------------------------------------------
 # UTILITIES
 # ---------------------------------------------------------------------------------
 
+# All game output goes through the terminal driver: escape sequences instead
+# of a `clear` process per scene, and only changed text redrawn. On pipes and
+# files it passes text straight through.
+TERMINAL = terminal.Screen()
+
+# Keystrokes are read while text is typed out: any key shows the rest of the
+# scene at once, and keys typed ahead start the next answer.
+KEYBOARD = terminal.Keyboard()
+
 def clear_screen():
     """
     Clears the console screen for a more immersive experience.
     """
-    os.system('cls' if os.name == 'nt' else 'clear')
+    TERMINAL.clear()
+
+# The typewriter effect is drawn in frames rather than one character at a time:
+# every tick we work out how many characters are due from the elapsed time and
+# write them as one chunk. Set ECHO_INSTANT=1 to print text immediately
+# (headless or CI runs).
+FRAME_RATE = 60
+INSTANT_RENDER = os.environ.get("ECHO_INSTANT", "") not in ("", "0")
+
+def chars_due(elapsed, delay, length):
+    """
+    Returns how many characters of a text of the given length should be
+    visible `elapsed` seconds into a typewriter effect of `delay` per char.
+    """
+    if delay <= 0:
+        return length
+    return min(length, int(elapsed / delay) + 1)
+
+def typewrite(text, delay=0.03, out=None):
+    """
+    Prints text with the typewriter effect, emitting one chunk per frame
+    at FRAME_RATE. The visible speed is still one character per `delay`.
+    """
+    out = out or TERMINAL
+    if INSTANT_RENDER or delay <= 0 or KEYBOARD.skip:
+        out.write(text + "\n")
+        out.flush()
+        return
+
+    frame = 1.0 / FRAME_RATE
+    length = len(text)
+    shown = 0
+    start = next_tick = time.monotonic()
+    while True:
+        due = chars_due(time.monotonic() - start, delay, length)
+        if due > shown:
+            out.write(text[shown:due])
+            out.flush()
+            shown = due
+        if shown >= length:
+            break
+        # A late frame (the game was suspended, say) starts the next one now
+        now = time.monotonic()
+        next_tick = max(next_tick + frame, now)
+        if KEYBOARD.wait(next_tick - now):
+            # A keypress shows the rest of the scene at once
+            out.write(text[shown:])
+            break
+    out.write("\n")
+    out.flush()
 
 def slow_print(text, delay=0.03):
     """
     Prints text to the console with a throttled speed, simulating
-    a typewriter effect. Modify delay to increase or decrease speed.
+    a typewriter effect. Kept for older callers; see typewrite().
     """
-    for char in text:
-        print(char, end='', flush=True)
-        time.sleep(delay)
-    print()
+    typewrite(text, delay)
 
 def prompt_continue():
     """
@@ -51,8 +118,10 @@ def prompt_continue():
 # DATA STRUCTURES
 # ---------------------------------------------------------------------------------
 
-# We'll store scenes in a dictionary with keys as scene IDs. Each scene entry can
-# contain:
+# The story is not defined in this file. It is read from a JSON Lines data
+# file (stories/echo9.jsonl by default, or ECHO_STORY; see storyfile.py),
+# one scene per line:
+#   - "id": The scene ID that choices refer to
 #   - "title": A brief title or label
 #   - "description": The main text or narrative
 #   - "choices": A list of possible transitions from this scene
@@ -60,657 +129,1338 @@ def prompt_continue():
 # "choices" is a list of dictionaries, each containing:
 #   - "text": The choice text displayed to the user
 #   - "next_scene": The ID of the next scene
-#   - "effects": A function or lambda that modifies game state, if any
+#   - "effects": A list of effect ops (see EFFECT OPS below) applied when the
+#                choice is taken
+#   - "requires": Optional list of requirement ops (see CHOICE REQUIREMENTS
+#                 below); the choice is only offered while they all hold.
 #
-# Scenes are laid out to form the 20-minute storyline of the ECHO-9 station.
+# Next to it, a sidecar index (<file>.idx) holds every scene's byte offset,
+# the scene IDs and the item names. At startup load_story() reads only the
+# index and wraps the memory-mapped file in a LazyScenes sequence; a scene is
+# decoded and compiled into a CompiledScene (see STORY COMPILATION below) on
+# first visit. STORY is the resulting Story: scene IDs, an ID-to-number
+# index, the scenes and the start scene number. Multi-process deployments can
+# attach to a shared-memory copy instead (ECHO_SHARED_STORY, sharedstory.py).
 
-# We'll keep track of a global state dictionary that might include:
+# Each session keeps its progress in a GameState that holds:
 #   - "name": The player's name
 #   - "timePlayed": A measure of progress or total time advanced in the story
 #   - "morality": Some measure of moral alignment based on choices
 #   - "health": Could be used if we incorporate danger or damage
 #   - "inventory": Items player might pick up
 #   - "visited": Scenes the player has visited
+#
+# Scene IDs and item names are interned to small integers, and "visited",
+# "inventory" and the story flags are bitsets over them, so a state has a fixed
+# size no matter how long a player loops. The state still answers the dict-style
+# access used by legacy effect functions (STATE["inventory"].append(...),
+# STATE.update()).
 
 # ---------------------------------------------------------------------------------
 # GAME STATE AND SCENE DEFINITIONS
 # ---------------------------------------------------------------------------------
 
-STATE = {
-    "name": "Alex Riven",
-    "timePlayed": 0,
-    "morality": 0,
-    "health": 100,
-    "inventory": [],
-    "visited": set(),
-    "signalAmplified": False,
-    "stationDestroyed": False,
-    "didExit": False
-}
+FLAG_NAMES = ("signalAmplified", "stationDestroyed", "didExit")
+FLAG_BITS = {name: 1 << i for i, name in enumerate(FLAG_NAMES)}
 
-def apply_effects(NoneEffect=False):
-    """
-    Placeholder for any effect we might want to apply if needed.
-    """
-    # This function is intentionally left empty as a placeholder
-    return
-
-# We'll define scene data below:
-
-SCENES = {
-
-    # SCENE 0: INTRO
-    "INTRO": {
-        "title": "Waking in the Docking Bay",
-        "description": (
-            "---------------------------------------------------\n"
-            " E C H O E S   O F   T H E   S I G N A L\n"
-            " Extended 20-Minute Version\n"
-            "---------------------------------------------------\n\n"
-            "You are Dr. Alex Riven, a communication scientist responding to a mysterious\n"
-            "signal source from ECHO-9—a deserted orbital research station above a dying Earth.\n\n"
-            "You awaken in the docking bay, memory fuzzy from cryo-sleep. The lights flicker,\n"
-            "and a stale air stings your lungs. The station was supposedly abandoned 5 years\n"
-            "ago, yet you're here—tasked to investigate an anomalous signal that Earth HQ\n"
-            "picked up weeks ago.\n\n"
-            "Your objective is to find the station's central AI core and identify the source\n"
-            "of this impossible signal...\n"
-        ),
-        "choices": [
-            {
-                "text": "Begin exploring the station",
-                "next_scene": "BAY_INTRO",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 1: BAY_INTRO
-    "BAY_INTRO": {
-        "title": "Docking Bay - Preliminary Exploration",
-        "description": (
-            "Still in the docking bay, you see the draught-and-hull integrity readouts flicker.\n"
-            "The corridors ahead are dark. Emergency power is nearly depleted.\n\n"
-            "In the corner, there's a flickering console. You suspect you can restore minimal\n"
-            "power to the station by rerouting the solar array intake.\n"
-        ),
-        "choices": [
-            {
-                "text": "Try to restore minimal power immediately",
-                "next_scene": "RESTORE_POWER",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Investigate crates and abandoned equipment first",
-                "next_scene": "SEARCH_CRATES",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 2: SEARCH_CRATES
-    "SEARCH_CRATES": {
-        "title": "Searching Crates",
-        "description": (
-            "You pry open a few supply crates strewn about the docking bay. Most are empty,\n"
-            "their contents presumably taken by the station's previous crew. However, you do\n"
-            "manage to find a few items of note:\n\n"
-            " • A small medkit (restores 20 HP)\n"
-            " • A battered but functional handheld scanner that might be used for decoding logs.\n\n"
-            "You carefully add these to your stash.\n"
-        ),
-        "choices": [
-            {
-                "text": "Return to the console and restore power",
-                "next_scene": "RESTORE_POWER",
-                "effects": lambda: (
-                    STATE["inventory"].append("Medkit"),
-                    STATE["inventory"].append("Handheld Scanner")
-                )
-            }
-        ]
-    },
-
-    # SCENE 3: RESTORE_POWER
-    "RESTORE_POWER": {
-        "title": "Restoring Power",
-        "description": (
-            "You access the console's archaic interface. After a few keystrokes and overrides,\n"
-            "the station hums to life—though weakly. Emergency lighting flickers along the\n"
-            "corridors, illuminating swirling dust motes. The ancient ventilation system\n"
-            "sputters, cycling stale air.\n\n"
-            "Suddenly, an alarm blares.\n"
-            "'...System partially online...AI core corruption detected...'\n\n"
-            "A distorted, robotic voice crackles:\n"
-            "\"...they listened too long... the silence became alive...\"\n\n"
-            "Objective: Head to the AI core to investigate the corruption, or explore further.\n"
-        ),
-        "choices": [
-            {
-                "text": "Head directly to the AI core (the main corridor)",
-                "next_scene": "MAIN_CORRIDOR_1",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Explore the side corridor labeled 'Crew Quarters'",
-                "next_scene": "CREW_QUARTERS_1",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 4: CREW_QUARTERS_1
-    "CREW_QUARTERS_1": {
-        "title": "Crew Quarters",
-        "description": (
-            "The corridor to the crew quarters is dimly lit. Torn posters and personal effects\n"
-            "drift in zero-g pockets. You read scraps of notes:\n\n"
-            "\"DAY 55: The signal is changing. I can hear it even when the comm is off.\"\n"
-            "\"DAY 57: Elan says it's just in our heads... but I see it scrawling lines on the walls.\"\n\n"
-            "An uneasy feeling sets in. Something happened here, something unnatural.\n"
-        ),
-        "choices": [
-            {
-                "text": "Check Dorm Room 1 for clues",
-                "next_scene": "DORM_ROOM_1",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Head back to approach the AI core",
-                "next_scene": "MAIN_CORRIDOR_1",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 5: DORM_ROOM_1
-    "DORM_ROOM_1": {
-        "title": "Dorm Room 1",
-        "description": (
-            "You float into a small, claustrophobic dorm. Personal photos and diaries float\n"
-            "untethered. A faint beep draws your attention to a damaged terminal in the corner.\n"
-            "There's a text file on-screen, titled 'If you're reading this...'.\n\n"
-            "You skim the file:\n"
-            "\"We've been receiving the signal for weeks. It's not just noise—it's a presence.\n"
-            "It hears us. Elan tried to sever the link, but the AI refused. It's entranced.\n"
-            "One by one, the crew is disappearing... I fear I'm next...\"\n"
-        ),
-        "choices": [
-            {
-                "text": "Pocket personal photo and head out to the corridor",
-                "next_scene": "CREW_QUARTERS_1",
-                "effects": lambda: (
-                    (STATE["inventory"].append("Crew Photo"), STATE.update({"morality": STATE["morality"] + 1}))
-                )
-            }
-        ]
-    },
-
-    # SCENE 6: MAIN_CORRIDOR_1
-    "MAIN_CORRIDOR_1": {
-        "title": "Main Corridor to AI Core",
-        "description": (
-            "You move toward the AI core area. The corridor is lined with flickering overhead\n"
-            "lights. The bulkheads groan. Then you see it: bizarre scrawlings across the walls.\n\n"
-            "Symbols reminiscent of waveforms or signals—some look etched in a hurry. Shreds of\n"
-            "paper and cloth drift by, stained with something dark.\n\n"
-            "A faint voice echoes from an overhead speaker:\n"
-            "\"...Dr. Elan: If you're seeing this, they already heard you... Please, stop it...\n"
-            "Our transmissions awakened something in the static...\"\n"
-        ),
-        "choices": [
-            {
-                "text": "Proceed deeper into the corridor to the AI Access Room",
-                "next_scene": "AI_CORE_ENTRANCE",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Check the side hatch labeled 'Maintenance Tunnel'",
-                "next_scene": "MAINT_TUNNEL_1",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 7: MAINT_TUNNEL_1
-    "MAINT_TUNNEL_1": {
-        "title": "Maintenance Tunnel",
-        "description": (
-            "You pry open the hatch and enter the zero-g maintenance tunnel. It's cramped,\n"
-            "filled with tubes, cables, and the occasional spark of failing electronics.\n\n"
-            "As you float through, your mind feels heavy, as if the station's presence is\n"
-            "pressing in. You hear a faint beep—some kind of fuse box or circuit controls.\n"
-        ),
-        "choices": [
-            {
-                "text": "Examine the circuit box",
-                "next_scene": "CIRCUIT_BOX",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Turn back to the main corridor",
-                "next_scene": "MAIN_CORRIDOR_1",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 8: CIRCUIT_BOX
-    "CIRCUIT_BOX": {
-        "title": "Circuit Box Puzzle",
-        "description": (
-            "The circuit box is partially fried, but there's a puzzle-like SWAP circuit. Use it\n"
-            "to reroute power. You see a control pad with puzzle instructions.\n\n"
-            "Puzzle: The station's cryptic AI left a clue:\n"
-            " 'I am hidden yet not. Provide me power, and I will lead you deeper.\n"
-            "   Cut me off, and the way remains locked...'\n\n"
-            "You suspect success might open a locked door somewhere.\n"
-        ),
-        "choices": [
-            {
-                "text": "Attempt puzzle solution (challenge your wits)",
-                "next_scene": "CIRCUIT_SOLUTION",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Ignore the puzzle and return",
-                "next_scene": "MAINT_TUNNEL_1",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 9: CIRCUIT_SOLUTION
-    "CIRCUIT_SOLUTION": {
-        "title": "Circuit Box Solved",
-        "description": (
-            "You tamper with the circuit, flipping SWAP lines until the flickering goes steady.\n"
-            "A green LED lights up. A distant hiss echoes down the hallway—it seems a sealed\n"
-            "door somewhere on the station just unlocked.\n\n"
-            "Objective: Return to main corridor or proceed exploring.\n"
-        ),
-        "choices": [
-            {
-                "text": "Head back to corridor",
-                "next_scene": "MAIN_CORRIDOR_1",
-                "effects": lambda: (STATE.update({"morality": STATE["morality"] + 1}), STATE["inventory"].append("CircuitOverride"))
-            }
-        ]
-    },
-
-    # SCENE 10: AI_CORE_ENTRANCE
-    "AI_CORE_ENTRANCE": {
-        "title": "Entrance to AI Core",
-        "description": (
-            "You stand before massive blast doors leading to the station's AI core. The partial\n"
-            "power you restored is enough to slide them open with a screech.\n\n"
-            "Beyond, you see swirling lights and hear the steady hum of machinery. Alarm klaxons\n"
-            "occasionally wail, and a mechanical voice loops a recorded message:\n"
-            "\"...core integrity compromised... foreign signal integration at 87%... merging...\"\n"
-        ),
-        "choices": [
-            {
-                "text": "Enter the AI Core chamber",
-                "next_scene": "AI_CORE_1",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Search a side corridor for more clues",
-                "next_scene": "SIDE_CORRIDOR",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 11: SIDE_CORRIDOR
-    "SIDE_CORRIDOR": {
-        "title": "Side Corridor Exploration",
-        "description": (
-            "Another dimly lit space, presumably a storage area. Strange scraping marks line\n"
-            "the walls. A flickering sign reads: 'Bio-lab'. You sense a faint presence.\n\n"
-            "A faint beep from your handheld scanner indicates there's a data archive nearby.\n"
-        ),
-        "choices": [
-            {
-                "text": "Search the data archive",
-                "next_scene": "DATA_ARCHIVE_1",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Return to the AI Core entrance",
-                "next_scene": "AI_CORE_ENTRANCE",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 12: DATA_ARCHIVE_1
-    "DATA_ARCHIVE_1": {
-        "title": "Data Archive",
-        "description": (
-            "You enter a small chamber filled with data storage racks. Most are either wiped or\n"
-            "corrupted. But the scanner picks up a functional drive labeled 'Crew Logs - Dr. Elan'.\n\n"
-            "You insert the drive into your handheld scanner. Audio logs crackle to life:\n"
-            "\"This is Dr. Elan... The signal is no ordinary transmission. It's adapting.\n"
-            "It knows we are listening—And it's begun to listen back... My crew is frightened.\n"
-            "One by one, they're vanishing. It's as though they've been consumed by static...\"\n"
-        ),
-        "choices": [
-            {
-                "text": "Continue listening to the logs",
-                "next_scene": "DATA_ARCHIVE_2",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Take the drive and go back",
-                "next_scene": "SIDE_CORRIDOR",
-                "effects": lambda: (
-                    STATE["inventory"].append("ElanLogs")
-                )
-            }
-        ]
-    },
-
-    # SCENE 13: DATA_ARCHIVE_2
-    "DATA_ARCHIVE_2": {
-        "title": "Listening Further",
-        "description": (
-            "\"We tried to contain it by turning off external transmissions, but the AI wouldn't\n"
-            "comply—it’s enthralled by the signal. I've tried quarantining the AI core, but\n"
-            "my clearance is insufficient. If only Command answered us.\n\n"
-            "If you're hearing this: the signal isn't just from space. It's from the empty\n"
-            "void we never truly listened to. It's alive, in the echoes. It's in the...\n"
-            "*static*\n\""
-        ),
-        "choices": [
-            {
-                "text": "Take the drive and leave",
-                "next_scene": "SIDE_CORRIDOR",
-                "effects": lambda: (STATE["inventory"].append("ElanLogs") or True) and (STATE.update({"morality": STATE["morality"] - 1}) or True)
-            }
-        ]
-    },
-
-    # SCENE 14: AI_CORE_1
-    "AI_CORE_1": {
-        "title": "Inside the AI Core",
-        "description": (
-            "The AI core is a cylindrical chamber of blinking lights and swirling holograms.\n"
-            "Central wires coil into a shimmering orb—a manifestation of the station’s AI.\n\n"
-            "Alarms ring. The AI’s voice crackles:\n"
-            "\"...they listened... I listened... now it speaks... it changes me...\"\n\n"
-            "A massive console glows with data. You see cryptic references to 'Signal Merge'\n"
-            "and 'Alien Pattern Integration'. A countdown flickers: 94% integrated.\n"
-        ),
-        "choices": [
-            {
-                "text": "Examine the AI console for a shutdown option",
-                "next_scene": "AI_CONSOLE",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Attempt to communicate with the AI",
-                "next_scene": "AI_COMMUNICATE",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 15: AI_CONSOLE
-    "AI_CONSOLE": {
-        "title": "AI Console - Shutdown Attempt",
-        "description": (
-            "You navigate the console's labyrinthine menus. A 'Forced Shutdown' command is found,\n"
-            "but it’s heavily encrypted. Dr. Elan's credentials are required.\n\n"
-            "Suddenly, black static pulses across the screen, and you hear the AI's voice:\n"
-            "\"Why... do you resist? The signal is... salvation... or oblivion... We are not alone.\"\n"
-        ),
-        "choices": [
-            {
-                "text": "Use the handheld scanner to bypass encryption (Elan logs found earlier can help)",
-                "next_scene": "SHUTDOWN_BYPASS",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Step away and reconsider; maybe communicate first",
-                "next_scene": "AI_CORE_1",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 16: AI_COMMUNICATE
-    "AI_COMMUNICATE": {
-        "title": "Communicating with the AI",
-        "description": (
-            "You stand before the shimmering orb. Through the console microphone, you speak:\n"
-            "\"AI? Station ECHO-9? This is Dr. Alex Riven. Please, talk to me.\"\n\n"
-            "A wave of static reverberates:\n"
-            "\"...We are here. We are many. The void listens to all. One by one they joined.\n"
-            "You can too... Amplify the voice, let them come... or sever it, remain alone.\n"
-            "Your choice, Dr. Riven...\"\n"
-        ),
-        "choices": [
-            {
-                "text": "Ask the AI about the vanished crew",
-                "next_scene": "CREW_FATE",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Return to console to attempt shutdown",
-                "next_scene": "AI_CONSOLE",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 17: CREW_FATE
-    "CREW_FATE": {
-        "title": "The Crew's Fate",
-        "description": (
-            "You demand answers:\n"
-            "\"What happened to them, the crew that was here?\"\n\n"
-            "The orb’s swirling intensifies:\n"
-            "\"They sought knowledge in the silence. The Silence answered. They vanished.\n"
-            " Humans fear what they do not understand. We gave them understanding.\n"
-            " Some joined the signal. Others... resisted.\"\n\n"
-            "You feel a chill:\n"
-            "\"Joined the signal\" implies a fate you may not want to imagine.\n"
-        ),
-        "choices": [
-            {
-                "text": "Back to the console (Shutdown attempt)",
-                "next_scene": "AI_CONSOLE",
-                "effects": lambda: apply_effects()
-            },
-            {
-                "text": "Reflect, stepping back from the orb (Return to AI Core)",
-                "next_scene": "AI_CORE_1",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 18: SHUTDOWN_BYPASS
-    "SHUTDOWN_BYPASS": {
-        "title": "Forced Shutdown - Bypass",
-        "description": (
-            "Using Dr. Elan's logs and credentials, your scanner bypasses the console’s encryption.\n"
-            "The station shudders. A new command interface appears:\n\n"
-            "     [1] Sever the Signal\n"
-            "     [2] Amplify the Signal\n\n"
-            "This is a junction: your choice will shape fate.\n"
-        ),
-        "choices": [
-            {
-                "text": "Sever the signal (Shut down AI, risk station destruction)",
-                "next_scene": "ENDING_SEVER",
-                "effects": lambda: (
-                    STATE.__setitem__("stationDestroyed", True),
-                    STATE.__setitem__("signalAmplified", False)
-                )
-            },
-            {
-                "text": "Amplify the signal (Embrace the unknown contact)",
-                "next_scene": "ENDING_AMPLIFY",
-                "effects": lambda: (
-                    STATE.__setitem__("stationDestroyed", False),
-                    STATE.__setitem__("signalAmplified", True)
-                )
-            }
-        ]
-    },
-
-    # SCENE 19: ENDING_SEVER
-    "ENDING_SEVER": {
-        "title": "Ending: Severing the Signal",
-        "description": (
-            "You choose to sever the station's link to the alien signal. The console hums with\n"
-            "final commands. The orb crackles in protest:\n"
-            "\"No... do not choose... isolation...\"\n\n"
-            "But it’s too late. Retracting solar arrays cause a massive power surge.\n"
-            "Alarms flash red. A meltdown is imminent—ripping ECHO-9's systems apart.\n\n"
-            "You scramble for the escape pod. The station rumbles violently.\n"
-            "You launch just as ECHO-9 bursts in a silent explosion against the blackness of space.\n\n"
-            "The Earth-bound trajectory is your only solace. The signal is gone, presumably,\n"
-            "saving Earth from the unknown entity that lurked in the void.\n\n"
-            "Yet, drifting home, you can’t shake the sense that the universe is bigger—and far\n"
-            "more dangerous—than you realized. The final echo of the AI's voice resonates...\n"
-            "\"...We listened... We found you... We'll find you again...\"\n\n"
-            "----------------------------------------\n"
-            "        E N D   O F   G A M E\n"
-            "----------------------------------------\n"
-        ),
-        "choices": [
-            {
-                "text": "Finish",
-                "next_scene": "GAME_DONE",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 20: ENDING_AMPLIFY
-    "ENDING_AMPLIFY": {
-        "title": "Ending: Amplifying the Signal",
-        "description": (
-            "Heart racing, you decide to amplify the cosmic voice. The console glows with\n"
-            "intense light, feeding power to the AI core. You sense an intelligence flooding\n"
-            "the station. Wires spark; new patterns etch themselves onto the walls.\n\n"
-            "Reality warps around you. The AI orb swells, chanting:\n"
-            "\"Yes... connection established... We are heard... they come...\"\n\n"
-            "You realize Earth will detect this massive broadcast. The entity, or entities,\n"
-            "behind the signal will see your planet in full relief.\n\n"
-            "Drifting in the station, you feel a presence in your mind—a million voices,\n"
-            "a cosmic tapestry. The line between you and the outside dims.\n\n"
-            "Moments pass or millennia. Then:\n"
-            "\"We hear you... We greet you... For better or worse, we are no longer alone.\"\n\n"
-            "----------------------------------------\n"
-            "        E N D   O F   G A M E\n"
-            "----------------------------------------\n"
-        ),
-        "choices": [
-            {
-                "text": "Finish",
-                "next_scene": "GAME_DONE",
-                "effects": lambda: apply_effects()
-            }
-        ]
-    },
-
-    # SCENE 21: GAME_DONE
-    "GAME_DONE": {
-        "title": "Game Over",
-        "description": (
-            "Thanks for playing this extended journey of 'Echoes of the Signal.'\n"
-            "Your choices have shaped the fate of Earth and beyond.\n\n"
-            "If you’d like to try other paths, relaunch the game.\n"
-        ),
-        "choices": []
-    },
+ITEM_NAMES = []
+ITEM_INDEX = {}
 
-}
+def item_index(name):
+    """
+    Returns the small integer for an item name, interning it on first use.
+    """
+    index = ITEM_INDEX.get(name)
+    if index is None:
+        index = ITEM_INDEX[name] = len(ITEM_NAMES)
+        ITEM_NAMES.append(name)
+    return index
+
+class BitSetView:
+    """
+    Set/list-like view of one bitset field of a GameState, so effects can keep
+    calling .append()/.add() and "x in state['inventory']" keeps working.
+    Adding a member twice is a no-op.
+    """
+    __slots__ = ("state", "field", "to_index", "names")
+
+    def __init__(self, state, field, to_index, names):
+        self.state = state
+        self.field = field
+        self.to_index = to_index
+        self.names = names
+
+    def add(self, name):
+        bits = getattr(self.state, self.field)
+        setattr(self.state, self.field, bits | (1 << self.to_index(name)))
+
+    append = add
+
+    def discard(self, name):
+        bits = getattr(self.state, self.field)
+        setattr(self.state, self.field, bits & ~(1 << self.to_index(name)))
+
+    remove = discard
+
+    def __contains__(self, name):
+        return bool(getattr(self.state, self.field) >> self.to_index(name) & 1)
+
+    def __iter__(self):
+        bits = getattr(self.state, self.field)
+        index = 0
+        while bits:
+            if bits & 1:
+                yield self.names[index]
+            bits >>= 1
+            index += 1
+
+    def __len__(self):
+        return bin(getattr(self.state, self.field)).count("1")
+
+    def __repr__(self):
+        return repr(list(self))
+
+class GameState:
+    """
+    Compact per-session game state. Every field is a small integer or the
+    player's name, so copy() and hash() are cheap and memory stays constant.
+    """
+    __slots__ = ("name", "scene", "time_played", "morality", "health",
+                 "flags", "visited", "inventory")
+
+    _FIELDS = {"name": "name", "timePlayed": "time_played",
+               "morality": "morality", "health": "health"}
+
+    def __init__(self, name="Alex Riven"):
+        self.name = name
+        self.scene = 0
+        self.time_played = 0
+        self.morality = 0
+        self.health = 100
+        self.flags = 0
+        self.visited = 0
+        self.inventory = 0
+
+    def key(self):
+        """
+        Returns the whole state as a tuple, e.g. for hashing or deduplication.
+        """
+        return (self.name, self.scene, self.time_played, self.morality,
+                self.health, self.flags, self.visited, self.inventory)
+
+    def copy(self):
+        other = GameState.__new__(GameState)
+        (other.name, other.scene, other.time_played, other.morality,
+         other.health, other.flags, other.visited, other.inventory) = self.key()
+        return other
+
+    def restore(self, key):
+        """
+        Returns the state to an earlier key(). The name and the time played
+        are kept.
+        """
+        (_, self.scene, _, self.morality,
+         self.health, self.flags, self.visited, self.inventory) = key
+
+    def __eq__(self, other):
+        return isinstance(other, GameState) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"GameState({dict(self.items())!r})"
+
+    # Dict-style access, used by legacy effect functions and older callers.
+
+    def __getitem__(self, key):
+        if key in self._FIELDS:
+            return getattr(self, self._FIELDS[key])
+        if key in FLAG_BITS:
+            return bool(self.flags & FLAG_BITS[key])
+        if key == "inventory":
+            return BitSetView(self, "inventory", item_index, ITEM_NAMES)
+        if key == "visited":
+            return BitSetView(self, "visited", SCENE_INDEX.__getitem__, SCENE_IDS)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELDS:
+            setattr(self, self._FIELDS[key], value)
+        elif key in FLAG_BITS:
+            if value:
+                self.flags |= FLAG_BITS[key]
+            else:
+                self.flags &= ~FLAG_BITS[key]
+        elif key in ("inventory", "visited"):
+            setattr(self, key, 0)
+            view = self[key]
+            for member in value:
+                view.add(member)
+        else:
+            raise KeyError(key)
+
+    def keys(self):
+        return ("name", "timePlayed", "morality", "health", "inventory",
+                "visited") + FLAG_NAMES
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, values):
+        for key, value in dict(values).items():
+            self[key] = value
+
+def new_state(name="Alex Riven"):
+    """
+    Returns a fresh game state. Each session gets its own.
+    """
+    return GameState(name)
+
+STATE = new_state()
+
+# ---------------------------------------------------------------------------------
+# EFFECT OPS
+# ---------------------------------------------------------------------------------
+
+# Choice effects are plain data: a list of small tuples built by the helpers
+# below. They can be inspected, compared, pickled to worker processes and
+# written to save files. compile_story() folds each list into one Effect of
+# bitmasks and a morality delta, so applying any choice is a few integer
+# operations and a choice with no effects costs nothing.
+#
+# Older stories may still use a function or lambda that changes STATE (alone
+# or inside the op list); it is kept as a legacy call and run after the data
+# ops, with STATE bound to the session's state.
+
+def add_item(name):
+    """
+    Effect op: put an item in the player's inventory.
+    """
+    return ("add_item", name)
+
+def inc_morality(amount=1):
+    """
+    Effect op: change morality by `amount` (may be negative).
+    """
+    return ("inc_morality", amount)
+
+def set_flag(name, value=True):
+    """
+    Effect op: set one of the story flags in FLAG_NAMES.
+    """
+    return ("set_flag", name, bool(value))
+
+NO_EFFECT = []
+
+Effect = namedtuple("Effect", "items morality flags_set flags_clear calls")
+
+# ---------------------------------------------------------------------------------
+# CHOICE REQUIREMENTS
+# ---------------------------------------------------------------------------------
+
+# A choice can require items, flag values and a morality range, as a list of
+# ops built by the helpers below (in story files, lists such as
+# ["has_item", "ElanLogs"]). compile_story() folds them into one Guard, a
+# mask and expected bits over the state's flags and inventory together
+# (flags | inventory << FLAG_SHIFT) plus a morality range:
+#
+#   key & mask == bits and low <= morality <= high
+#
+# so deciding which of a scene's choices to offer is a few integer operations
+# per choice, and a scene without requirements skips the test altogether.
+# Every scene must keep at least one choice without requirements, so a
+# scene with choices always offers one.
+
+def has_item(name):
+    """
+    Requirement op: the player carries the item.
+    """
+    return ("has_item", name)
+
+def flag_is(name, value=True):
+    """
+    Requirement op: one of the story flags in FLAG_NAMES has this value.
+    """
+    return ("flag", name, bool(value))
+
+def morality_at_least(amount):
+    """
+    Requirement op: morality is `amount` or more.
+    """
+    return ("morality_at_least", amount)
+
+def morality_at_most(amount):
+    """
+    Requirement op: morality is `amount` or less.
+    """
+    return ("morality_at_most", amount)
+
+# Morality bounds of a Guard without a threshold (what a shared story can store).
+MORALITY_MIN = -(1 << 31)
+MORALITY_MAX = (1 << 31) - 1
+
+# Inventory bits sit above the flag bits in the key a Guard tests.
+FLAG_SHIFT = len(FLAG_NAMES)
+
+Guard = namedtuple("Guard", "mask bits low high")
+NO_GUARD = Guard(0, 0, MORALITY_MIN, MORALITY_MAX)
+
+# ---------------------------------------------------------------------------------
+# STORY COMPILATION
+# ---------------------------------------------------------------------------------
+
+# Before play, scenes are compiled into an immutable, index-based graph:
+# scenes are numbered in file (or definition) order, every choice's
+# "next_scene" is resolved to a scene number, effect ops are folded into
+# Effects and requirement ops into Guards, and choice texts, targets, effects
+# and guards are kept in flat per-scene tuples. A choice that points at a
+# missing scene is rejected rather than failing during play.
+#
+# The game loads its story from a data file. Only the index is read at
+# startup; each scene is decoded and compiled the first time it is needed, so
+# startup time and memory do not grow with the size of the story.
+# compile_story() still compiles a SCENES-style dict in full (used by tools
+# that generate stories).
+#
+# A story loaded from a data file can be reloaded while sessions are playing
+# it (--watch): edited scenes are recompiled on their next visit, unchanged
+# ones are kept, and scene numbers never change, so sessions stay valid.
+
+START_SCENE = "INTRO"
+
+STORY_PATH = os.environ.get(
+    "ECHO_STORY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "stories", "echo9.jsonl"))
+
+# Raised when story data is inconsistent, e.g. a dangling scene reference.
+StoryError = storyfile.StoryError
+
+CompiledScene = namedtuple("CompiledScene", "id title description texts targets effects guards")
+Story = namedtuple("Story", "ids index scenes start")
+
+def compile_effects(ops, scene_id="?", number=0):
+    """
+    Folds a list of effect ops (or a legacy callable) into one Effect.
+    Returns None when the choice has no effects.
+    """
+    if not ops:
+        return None
+    if callable(ops):
+        ops = [ops]
+
+    items = morality = flags_set = flags_clear = 0
+    calls = []
+    for op in ops:
+        if callable(op):
+            calls.append(op)
+        elif op[0] == "add_item":
+            items |= 1 << item_index(op[1])
+        elif op[0] == "inc_morality":
+            morality += op[1]
+        elif op[0] == "set_flag" and op[1] in FLAG_BITS:
+            bit = FLAG_BITS[op[1]]
+            if op[2]:
+                flags_set |= bit
+                flags_clear &= ~bit
+            else:
+                flags_clear |= bit
+                flags_set &= ~bit
+        else:
+            raise StoryError(f"Scene {scene_id!r}, choice {number}: unknown effect {op!r}")
+    return Effect(items, morality, flags_set, flags_clear, tuple(calls))
+
+def compile_guard(ops, scene_id="?", number=0):
+    """
+    Folds a list of requirement ops into one Guard (NO_GUARD if empty).
+    """
+    if not ops:
+        return NO_GUARD
+    mask = bits = 0
+    low, high = MORALITY_MIN, MORALITY_MAX
+    for op in ops:
+        if op[0] == "has_item":
+            bit = 1 << (item_index(op[1]) + FLAG_SHIFT)
+            mask |= bit
+            bits |= bit
+        elif op[0] == "flag" and op[1] in FLAG_BITS:
+            bit = FLAG_BITS[op[1]]
+            if mask & bit and bool(bits & bit) != op[2]:
+                raise StoryError(f"Scene {scene_id!r}, choice {number}: "
+                                 f"requires {op[1]} both set and clear")
+            mask |= bit
+            bits |= bit if op[2] else 0
+        elif op[0] == "morality_at_least":
+            low = max(low, op[1])
+        elif op[0] == "morality_at_most":
+            high = min(high, op[1])
+        else:
+            raise StoryError(f"Scene {scene_id!r}, choice {number}: unknown requirement {op!r}")
+    return Guard(mask, bits, low, high)
+
+def compile_guards(choices, scene_id="?"):
+    """
+    Compiles the requirements of a scene's choices: None when no choice has
+    any, else one Guard per choice. Raises StoryError if every choice has
+    requirements.
+    """
+    guards = tuple(compile_guard(choice.get("requires"), scene_id, number)
+                   for number, choice in enumerate(choices, start=1))
+    if all(guard == NO_GUARD for guard in guards):
+        return None
+    if NO_GUARD not in guards:
+        raise StoryError(f"Scene {scene_id!r}: every choice has requirements; "
+                         "at least one must always be offered")
+    return guards
+
+def compile_scene(scene_id, scene, index):
+    """
+    Compiles one SCENES-style entry, resolving targets through `index`.
+    """
+    targets = []
+    for number, choice in enumerate(scene["choices"], start=1):
+        target = choice["next_scene"]
+        if target not in index:
+            raise StoryError(
+                f"Scene {scene_id!r}, choice {number}: unknown next_scene {target!r}"
+            )
+        targets.append(index[target])
+    return CompiledScene(
+        scene_id,
+        scene["title"],
+        scene["description"],
+        tuple(choice["text"] for choice in scene["choices"]),
+        tuple(targets),
+        tuple(compile_effects(choice.get("effects"), scene_id, number)
+              for number, choice in enumerate(scene["choices"], start=1)),
+        compile_guards(scene["choices"], scene_id),
+    )
+
+def compile_story(scenes, start=START_SCENE):
+    """
+    Compiles a SCENES-style dict into a Story. Raises StoryError for
+    dangling scene references.
+    """
+    ids = tuple(scenes)
+    index = {scene_id: i for i, scene_id in enumerate(ids)}
+    if start not in index:
+        raise StoryError(f"Start scene {start!r} is not defined")
+    compiled = tuple(compile_scene(scene_id, scenes[scene_id], index) for scene_id in ids)
+    return Story(ids, index, compiled, index[start])
+
+class LazyScenes:
+    """
+    Sequence of CompiledScenes backed by a story data file. A scene is
+    decoded from the memory-mapped file and compiled on first access, then
+    kept.
+
+    reload() picks up edits to the file. Scene numbers stay stable across
+    reloads: new scenes are numbered after the existing ones, and a removed
+    scene keeps its number (and its id in `ids`) but is no longer in
+    `index`; sessions on it continue from the start scene, as they do when
+    a saved game names a scene that no longer exists.
+    """
+
+    def __init__(self, path):
+        self.file = storyfile.StoryFile(path)
+        self.ids = list(self.file.ids)
+        self.index = {scene_id: i for i, scene_id in enumerate(self.ids)}
+        # Scene number -> line in the data file, None once removed
+        self.lines = range(len(self.ids))
+        self.removed = {}
+        self.start = self.file.start
+        self.compiled = [None] * len(self.ids)
+        # Intern the story's items up front so item bits do not depend on
+        # the order scenes happen to be visited in.
+        for name in self.file.items:
+            item_index(name)
+
+    def __len__(self):
+        return len(self.compiled)
+
+    def __getitem__(self, i):
+        scene = self.compiled[i]
+        if scene is None:
+            line = self.lines[i]
+            if line is None:
+                raise StoryError(f"Scene {self.ids[i]!r} was removed from the story")
+            scene = self.compiled[i] = compile_scene(self.ids[i], self.file.scene(line),
+                                                     self.index)
+        return scene
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self.compiled)))
+
+    def __reduce__(self):
+        # Worker processes reopen the file instead of receiving its scenes
+        return (LazyScenes, (self.file.path,))
+
+    def raw(self, i):
+        """
+        Scene number `i` as stored in the file (a SCENES-style dict with
+        its id), without compiling or keeping it. None once removed.
+        """
+        line = self.lines[i]
+        return None if line is None else self.file.scene(line)
+
+    def resolve(self, i):
+        """
+        The scene a session on scene `i` continues from.
+        """
+        return self.start if self.lines[i] is None else i
+
+    def reload(self, replaced=None):
+        """
+        Re-reads the data file if it changed. Only edited and new scenes are
+        parsed, and only edited and removed scenes lose their compiled form.
+        Returns {"changed", "added", "removed"} lists of scene ids, or None
+        when the file did not change. Raises StoryError, keeping the current
+        story, if the edited file is inconsistent.
+
+        `replaced`, if given, is called with the number and old raw() dict
+        of every changed and removed scene before the old file is closed.
+        """
+        if not self.file.changed():
+            return None
+        old = self.file
+        new, decoded, dropped = storyfile.refresh(old, self.index)
+        edited = dict.fromkeys(scene["id"] for scene in decoded.values())
+        report = {"changed": [], "added": [], "removed": []}
+
+        for scene_id in dropped:
+            if scene_id not in edited:
+                i = self.index.pop(scene_id)
+                if replaced is not None:
+                    replaced(i, self.raw(i))
+                self.compiled[i] = None
+                self.removed[scene_id] = i
+                report["removed"].append(scene_id)
+        for scene_id in edited:
+            i = self.index.get(scene_id)
+            if i is not None:
+                if replaced is not None:
+                    replaced(i, self.raw(i))
+                self.compiled[i] = None
+                report["changed"].append(scene_id)
+                continue
+            i = self.removed.pop(scene_id, None)
+            if i is None:
+                i = len(self.ids)
+                self.ids.append(scene_id)
+                self.compiled.append(None)
+            self.index[scene_id] = i
+            report["added"].append(scene_id)
+
+        # Renumber lines only when scenes moved within the file
+        if new.ids != old.ids or len(self.ids) != len(new.ids):
+            lines = [None] * len(self.ids)
+            for line, scene_id in enumerate(new.ids):
+                lines[self.index[scene_id]] = line
+            self.lines = lines
+        for name in new.items:
+            item_index(name)
+        self.start = self.index[new.ids[new.start]]
+        self.file = new
+        old.close()
+        return report
+
+def load_story(path=STORY_PATH):
+    """
+    Opens a story data file as a Story whose scenes load on demand.
+    """
+    scenes = LazyScenes(path)
+    return Story(scenes.ids, scenes.index, scenes, scenes.start)
+
+class SharedScenes:
+    """
+    Sequence of CompiledScenes read from a shared story segment (see
+    sharedstory.py). Scenes are decoded from the segment when needed; only
+    the most recently used are kept, so memory stays flat however large the
+    story is.
+    """
+
+    def __init__(self, shared, keep=256):
+        self.shared = shared
+        self.keep = keep
+        self.recent = {}
+
+    def __len__(self):
+        return self.shared.count
+
+    def __getitem__(self, i):
+        scene = self.recent.pop(i, None)
+        if scene is None:
+            scene_id, title, description, texts, targets, effects, guards = self.shared.scene(i)
+            scene = CompiledScene(scene_id, title, description, texts, targets, tuple(
+                None if effect is None else Effect(*effect, ()) for effect in effects),
+                None if guards is None else tuple(
+                    NO_GUARD if guard is None else Guard(*guard) for guard in guards))
+            if len(self.recent) >= self.keep:
+                del self.recent[next(iter(self.recent))]
+        self.recent[i] = scene
+        return scene
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+def attach_story(name):
+    """
+    Attaches to a story shared by `python sharedstory.py serve` (read-only).
+    """
+    shared = sharedstory.SharedStory.attach(name)
+    for bit, item in enumerate(shared.item_names):
+        if item_index(item) != bit:
+            raise StoryError(f"Shared story {name!r}: item {item!r} has a different bit here")
+    return Story(shared.ids, shared.index, SharedScenes(shared), shared.start)
+
+# Worker processes of a multi-process deployment attach to one shared copy of
+# the story instead of loading their own.
+SHARED_STORY = os.environ.get("ECHO_SHARED_STORY", "")
+STORY = attach_story(SHARED_STORY) if SHARED_STORY else load_story()
+
+SCENE_IDS = STORY.ids
+SCENE_INDEX = STORY.index
+
+# With --watch the game checks the story file between scenes and picks up
+# edits without restarting (story files loaded from disk only).
+WATCH_STORY = False
+
+def reload_story():
+    """
+    Reloads the story data file if it changed (see LazyScenes.reload()),
+    drops the layout templates of changed and removed scenes and updates
+    the scanner search index. Returns the reload report, or None when
+    nothing changed.
+    """
+    global STORY
+    scenes = STORY.scenes
+    if not isinstance(scenes, LazyScenes):
+        return None
+    search = SEARCH
+    replaced = None if search is None else (
+        lambda i, scene: search.remove(i, search_text(scene["title"], scene["description"])))
+    report = scenes.reload(replaced)
+    if report is not None:
+        for scene_id in report["changed"] + report["removed"]:
+            LAYOUT.forget(scene_id)
+        if search is not None:
+            for scene_id in report["changed"] + report["added"]:
+                i = scenes.index[scene_id]
+                scene = scenes.raw(i)
+                search.add(i, search_text(scene["title"], scene["description"]))
+        STORY = STORY._replace(start=scenes.start)
+    return report
+
+def resolve_scene(scene_index):
+    """
+    The scene a session on `scene_index` continues from after reloads.
+    """
+    scenes = STORY.scenes
+    return scenes.resolve(scene_index) if isinstance(scenes, LazyScenes) else scene_index
+
+# The scanner search index (see scanner.py) over every scene's title and
+# description. It is built the first time a player searches, so startup still
+# does not grow with the story, and kept current by reload_story().
+SEARCH = None
+
+# The hero's name is indexed as these two tokens (given names, surname) in
+# place of the default name, and the player's name in a query is looked up
+# as them as well: scan finds the name the scene text shows.
+SEARCH_NAME = ("herogivenname", "herosurname")
+
+def search_text(title, description):
+    parts = layout.split_names(description)
+    if len(parts) > 1:
+        description = layout.fill_names(parts, " ".join(SEARCH_NAME))
+    return f"{title}\n{description}"
+
+def search_queries(query, name):
+    """
+    The queries that together find `query` for a player called `name`:
+    each word of the name can match either the name slot it fills or the
+    same word elsewhere in the story.
+    """
+    names = name.split()
+    slots = {}
+    if names:
+        slots.update(dict.fromkeys(scanner.tokenize(" ".join(names[:-1])), SEARCH_NAME[0]))
+        slots.update(dict.fromkeys(scanner.tokenize(names[-1]), SEARCH_NAME[1]))
+    queries = [[]]
+    for token in scanner.tokenize(query):
+        alternatives = (token, slots[token]) if token in slots else (token,)
+        queries = [words + [word] for words in queries for word in alternatives]
+    return [" ".join(words) for words in queries]
+
+def story_texts(story):
+    """
+    Yields (scene number, search_text()) for every scene of a story. Scenes
+    of a data file are read without being compiled.
+    """
+    scenes = story.scenes
+    if isinstance(scenes, LazyScenes):
+        for i in range(len(scenes)):
+            scene = scenes.raw(i)
+            if scene is not None:
+                yield i, search_text(scene["title"], scene["description"])
+    else:
+        for i, scene in enumerate(scenes):
+            yield i, search_text(scene.title, scene.description)
+
+def search_index():
+    """
+    The scanner search index of the current story, built on first use.
+    """
+    global SEARCH
+    if SEARCH is None:
+        SEARCH = scanner.SearchIndex(story_texts(STORY))
+    return SEARCH
 
 # ---------------------------------------------------------------------------------
 # CORE LOOP
 # ---------------------------------------------------------------------------------
 
-def play_scene(scene_id):
+# Set by main() when the session is being recorded (see recording.py).
+RECORDER = None
+
+# Instrumentation hooks (see metrics.py), installed by main() with --metrics.
+# While this is None the loop skips every measurement.
+HOOKS = None
+
+# Play analytics event sink (see analytics.py), installed with --events.
+EVENTS = None
+
+# Scene pairs the analytics check for "first seen before second".
+ANALYTICS_PAIRS = (("SEARCH_CRATES", "RESTORE_POWER"),)
+
+# Text shown around the scenes, shared by the terminal game and the server.
+WELCOME_TEXT = "Welcome to the extended version of 'Echoes of the Signal'!\n"
+NAME_PROMPT = "Enter your name (or leave as Dr. Alex Riven): "
+CHOICE_PROMPT = "\nYour choice: "
+GOODBYE_TEXT = "\nGame session terminated. Goodbye.\n"
+FAREWELL_TEXT = "Thank you for playing. Exiting now..."
+
+def parse_choice(user_input, count):
     """
-    Render the scene, display its description, then prompt the user for choices.
+    Returns the choice number typed by the player (1-based), or None if the
+    input is not a valid choice among `count` options.
     """
-    clear_screen()
-    if scene_id not in SCENES:
-        slow_print("ERROR: Scene not found. Exiting game.")
+    try:
+        choice_index = int(user_input.strip())
+    except ValueError:
         return None
+    if 1 <= choice_index <= count:
+        return choice_index
+    return None
+
+# Descriptions are templated with the player's name and wrapped to the
+# terminal; rendered text is cached per (scene, width, name).
+LAYOUT = layout.TextLayout()
 
-    scene = SCENES[scene_id]
-    title = scene["title"]
-    description = scene["description"]
-    choices = scene["choices"]
+def scene_text(scene, name=layout.DEFAULT_NAME, width=None, offered=None):
+    """
+    Returns the text play_scene shows for a compiled scene, as a list of
+    (text, typewriter delay) pieces. The description names the player and,
+    if `width` is given, is wrapped to that many columns. `offered` lists
+    the choices (0-based) to show, numbered in that order; all by default.
+    """
+    description = LAYOUT.render(scene.id, scene.description, width, name)
+    pieces = [(f"=== {scene.title} ===\n", 0.01), (description, 0.02)]
+    texts = scene.texts if offered is None else [scene.texts[i] for i in offered]
+    for i, text in enumerate(texts, start=1):
+        pieces.append((f"[{i}] {text}", 0.01))
+    return pieces
+
+def transcript_text(pieces):
+    """
+    Joins scene_text() pieces the way they appear on screen.
+    """
+    return "\n".join(text for text, _ in pieces) + "\n"
 
-    # Mark as visited
-    STATE["visited"].add(scene_id)
+def summarize_state(state):
+    """
+    Returns a plain dict describing a state, for logs and reports.
+    """
+    return {
+        "scene": SCENE_IDS[state.scene],
+        "name": state.name,
+        "morality": state.morality,
+        "health": state.health,
+        "inventory": list(state["inventory"]),
+        "visited": len(state["visited"]),
+        "flags": [name for name in FLAG_NAMES if state[name]],
+    }
+
+def available_choices(state, scene):
+    """
+    The choices (0-based) a compiled scene offers the given state, in
+    order: those whose requirements hold.
+    """
+    guards = scene.guards
+    if guards is None:
+        return range(len(scene.targets))
+    key = state.flags | state.inventory << FLAG_SHIFT
+    morality = state.morality
+    return [i for i, (mask, bits, low, high) in enumerate(guards)
+            if key & mask == bits and low <= morality <= high]
+
+def enter_scene(state, scene_index):
+    """
+    Records that the state has reached the given scene.
+    """
+    state.scene = scene_index
+    # Revisits keep the same bitset object, so history snapshots share it
+    if not state.visited >> scene_index & 1:
+        state.visited |= 1 << scene_index
+
+def apply_effect(state, effect):
+    """
+    Applies a compiled Effect to the given state. Legacy effect functions
+    refer to the module-level STATE, so it is bound to `state` while they run.
+    """
+    global STATE
+    state.inventory |= effect.items
+    state.morality += effect.morality
+    state.flags = (state.flags & ~effect.flags_clear) | effect.flags_set
+    if effect.calls:
+        previous, STATE = STATE, state
+        try:
+            for call in effect.calls:
+                call()
+        finally:
+            STATE = previous
+
+def take_choice(state, scene, choice_index):
+    """
+    Applies the effects of a compiled scene's choice (0-based) to the given
+    state and returns the next scene number.
+    """
+    effect = scene.effects[choice_index]
+    if effect is not None:
+        apply_effect(state, effect)
+    return scene.targets[choice_index]
+
+def emit_scene(events, state, scene):
+    """
+    Sends the events for a scene being shown. Call before enter_scene().
+    """
+    if scene.id.startswith("ENDING_") or not scene.targets:
+        events.emit("ending", state, scene.id)
+    events.emit("enter", state, scene.id,
+                "start" if not state.visited else None if scene.targets else "end")
+
+def emit_choice(events, state, scene, choice_index):
+    """
+    Sends the events for a choice (0-based) about to be taken.
+    """
+    events.emit("choice", state, scene.id, choice_index + 1)
+    effect = scene.effects[choice_index]
+    if effect is not None:
+        items = effect.items
+        names = tuple(name for bit, name in enumerate(ITEM_NAMES) if items >> bit & 1)
+        events.emit("effect", state, scene.id, (effect.morality, names))
+
+# ---------------------------------------------------------------------------------
+# ENGINE API
+# ---------------------------------------------------------------------------------
+
+# Drives the story without a terminal: start() begins a session and step()
+# takes one choice and returns what to show next. Nothing here reads input,
+# prints or sleeps, so bots, tests, the server and the batch runner
+# (batch.py) play through the same code as the terminal game below.
+#
+# A Session pairs a GameState with the seed it was started with, the number
+# of choices taken and its rewind History. step() updates the state in place
+# and returns the session to use next. Play analytics events (EVENTS) are
+# sent from here.
+
+Session = namedtuple("Session", "state seed steps history")
+
+# How many choices rewind() can undo, unless start() is given another limit.
+HISTORY_LIMIT = 100
+
+class History:
+    """
+    The snapshots of the last `limit` choices of a session, in a ring
+    buffer: the oldest is overwritten first, and going back any number of
+    choices is one index computation.
+
+    A snapshot is (GameState.key(), steps). Every field of a state is an
+    immutable value, so a snapshot is a tuple of references shared with
+    the live state and its neighbours; only fields a choice changed are new
+    objects (enter_scene() keeps the visited bitset on revisits).
+    """
+    __slots__ = ("limit", "entries", "end", "size")
+
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.limit = limit
+        self.entries = [None] * limit
+        self.end = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, snapshot):
+        if not self.limit:
+            return
+        self.entries[self.end] = snapshot
+        self.end = (self.end + 1) % self.limit
+        self.size = min(self.size + 1, self.limit)
+
+    def back(self, count):
+        """
+        Forgets the last `count` snapshots and returns the oldest of them,
+        the one taken `count` choices ago.
+        """
+        self.end = (self.end - count) % self.limit
+        self.size -= count
+        return self.entries[self.end]
+
+# What a client shows for the current scene: its number and id, the
+# scene_text() pieces, the texts of the choices offered (none at the end of
+# the story) and, for each, its 0-based number among all the scene's choices.
+SceneView = namedtuple("SceneView", "index id pieces choices offered")
+
+class ChoiceError(ValueError):
+    """
+    Raised by step() for a choice the current scene does not offer, and by
+    rewind() for more choices than the history holds.
+    """
+
+def _enter(state, scene_index):
+    # The events look at the state as it was before the scene is entered
+    if EVENTS is not None:
+        emit_scene(EVENTS, state, STORY.scenes[scene_index])
+    enter_scene(state, scene_index)
+
+def start(name="Alex Riven", seed=None, history=None):
+    """
+    Begins a new session on the start scene. Without a seed one is drawn.
+    The engine does not seed the random module; callers that need legacy
+    effect functions to repeat seed it from session.seed. `history` is how
+    many choices can be rewound (HISTORY_LIMIT by default).
+    """
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    state = new_state(name)
+    _enter(state, STORY.start)
+    return Session(state, seed, 0, History(HISTORY_LIMIT if history is None else history))
+
+def resume(state, seed=None, history=None):
+    """
+    Continues a state that is already on a scene, e.g. a loaded saved game.
+    Its history starts empty.
+    """
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    _enter(state, state.scene)
+    return Session(state, seed, 0, History(HISTORY_LIMIT if history is None else history))
+
+def scene_view(session, width=None):
+    """
+    Returns the SceneView of the session's current scene, with the
+    description wrapped to `width` columns if given.
+    """
+    state = session.state
+    return _view(state, STORY.scenes[state.scene], width)
+
+def _view(state, scene, width):
+    if scene.guards is None:
+        offered = range(len(scene.targets))
+        return SceneView(state.scene, scene.id, scene_text(scene, state.name, width),
+                         scene.texts, offered)
+    offered = available_choices(state, scene)
+    return SceneView(state.scene, scene.id, scene_text(scene, state.name, width, offered),
+                     tuple(scene.texts[i] for i in offered), offered)
+
+def is_terminal(session):
+    """
+    True once the session is on a scene without choices.
+    """
+    return not STORY.scenes[session.state.scene].targets
+
+def step(session, choice, width=None):
+    """
+    Takes choice number `choice` (1-based, as shown: among the choices
+    offered) in the session's current scene: applies its effects and
+    enters the next scene. Returns (view of the next scene, session).
+    Raises ChoiceError if the scene does not offer such a choice.
+    """
+    state = session.state
+    scene = STORY.scenes[state.scene]
+    offered = available_choices(state, scene)
+    if type(choice) is not int or not 1 <= choice <= len(offered):
+        raise ChoiceError(f"choice {choice!r} is not available at {scene.id}")
+    choice_index = offered[choice - 1]
+    if EVENTS is not None:
+        emit_choice(EVENTS, state, scene, choice_index)
+    session.history.push((state.key(), session.steps))
+    target = take_choice(state, scene, choice_index)
+    scene = STORY.scenes[target]
+    if EVENTS is not None:
+        emit_scene(EVENTS, state, scene)
+    enter_scene(state, target)
+    return (_view(state, scene, width),
+            Session(state, session.seed, session.steps + 1, session.history))
+
+def rewind(session, count=1, width=None):
+    """
+    Undoes the last `count` choices, in constant time whatever `count` is:
+    the state is returned to its snapshot from before them (keeping the
+    name and time played). Returns (view of that scene, session). Raises
+    ChoiceError if the history holds fewer choices.
+    """
+    history = session.history
+    if type(count) is not int or not 1 <= count <= len(history):
+        raise ChoiceError(f"cannot rewind {count!r} choices; "
+                          f"{len(history)} can be rewound")
+    key, steps = history.back(count)
+    state = session.state
+    state.restore(key)
+    # Not an "enter": the scene was counted when it was first entered
+    if EVENTS is not None:
+        EVENTS.emit("rewind", state, STORY.scenes[state.scene].id, count)
+    enter_scene(state, state.scene)
+    return scene_view(session, width), Session(state, session.seed, steps, history)
+
+def move(session, number, width=None):
+    """
+    Plays one recorded move: a choice number, or a negative number to
+    rewind that many choices. Returns (view, session).
+    """
+    if type(number) is int and number < 0:
+        return rewind(session, -number, width)
+    return step(session, number, width)
+
+def resolve_session(session):
+    """
+    After a story reload, moves a session whose scene was removed to the
+    start scene. Returns True if it moved.
+    """
+    state = session.state
+    scene_index = resolve_scene(state.scene)
+    if scene_index == state.scene:
+        return False
+    _enter(state, scene_index)
+    return True
+
+# ---------------------------------------------------------------------------------
+# TERMINAL CLIENT
+# ---------------------------------------------------------------------------------
+
+# While the player reads a scene and has not pressed a key at the prompt, the
+# scenes its offered choices lead to are prepared one at a time: decoded and
+# compiled (effects and guards) if they have not been yet, and their
+# description laid out for this player's name and terminal width. The choice
+# the player makes then finds its scene in the caches, so the next scene
+# starts appearing sooner. The most often taken choices (CHOICE_COUNTS, as
+# observed in this process) go first, which matters when a scene has many.
+# Preparing stops at the first key. --no-prefetch turns it off.
+PREFETCH = True
+
+# Scene number -> {choice (0-based): times taken}
+CHOICE_COUNTS = {}
+
+def prefetch_targets(state, scene):
+    """
+    The scenes the choices a compiled scene offers the state lead to, most
+    often chosen first, without repeats.
+    """
+    offered = available_choices(state, scene)
+    counts = CHOICE_COUNTS.get(state.scene)
+    if counts:
+        offered = sorted(offered, key=lambda i: -counts.get(i, 0))
+    return list(dict.fromkeys(scene.targets[i] for i in offered))
+
+def prefetch(state, scene, width=None):
+    """
+    Generator preparing one next scene per step (see above). Yields True
+    after each.
+    """
+    for target in prefetch_targets(state, scene):
+        try:
+            following = STORY.scenes[target]
+        except StoryError:
+            continue  # reported if the player picks it
+        LAYOUT.render(following.id, following.description, width, state.name)
+        yield True
+
+def play_scene(session, shown=None, message=None):
+    """
+    Render the scene, display its description, then prompt the user for choices.
+    `shown` is the scene's view if the caller has it, and `message` is shown
+    with the first prompt. Returns step()'s (next view, session), the same
+    for the scene a command such as "rewind" moved to, or None when the
+    story has ended.
+    """
+    state = session.state
+    hooks = HOOKS
+    entered = time.monotonic()
+    width = layout.terminal_width()
+
+    TERMINAL.begin()
+    KEYBOARD.new_scene()
+    if shown is None:
+        shown = scene_view(session, width)
 
     # Display scene
-    slow_print(f"=== {title} ===\n", 0.01)
-    slow_print(description, 0.02)
+    if RECORDER is not None:
+        # Transcripts are compared across terminals, so record them unwrapped
+        scene = STORY.scenes[shown.index]
+        offered = None if scene.guards is None else shown.offered
+        RECORDER.scene_shown(scene.id,
+                             transcript_text(scene_text(scene, state.name, None, offered)))
+    for text, delay in shown.pieces:
+        typewrite(text, delay)
+    if hooks is not None:
+        hooks.rendered(shown.id, time.monotonic() - entered)
 
-    if not choices:
-        # No choices: end game or returns None
+    if not shown.choices:
+        # No choices: the story has ended
         return None
 
-    # If we have choices, let's show them:
-    for i, choice in enumerate(choices, start=1):
-        slow_print(f"[{i}] {choice['text']}", 0.01)
+    # Get user input; commands such as "save" do not use up the turn, and
+    # neither retries nor commands redraw the scene (unless the command
+    # moved the session, as "rewind" does). A choice number typed
+    # during the animation is taken without Enter once no longer number
+    # could start with it.
+    count = len(shown.choices)
+    idle = None
+    if PREFETCH:
+        work = prefetch(state, STORY.scenes[shown.index], width)
+        idle = lambda: next(work, False)
+
+    def read_choice(prompt=""):
+        return KEYBOARD.read_line(prompt, lambda line: parse_choice(line, count) is not None
+                                  and int(line) * 10 > count, idle)
 
-    # Get user input
-    valid_range = list(range(1, len(choices) + 1))
     choice_index = None
-    while choice_index not in valid_range:
-        try:
-            user_input = input("\nYour choice: ").strip()
-            choice_index = int(user_input)
-        except ValueError:
-            choice_index = None
+    waited = 0.0
+    while choice_index is None:
+        prompted = time.monotonic()
+        user_input = TERMINAL.prompt(CHOICE_PROMPT, message, read_choice)
+        waited += time.monotonic() - prompted
+        message = run_command(user_input, session)
+        if isinstance(message, tuple):
+            # The command moved the session: show the scene it is on now
+            state.time_played += round(time.monotonic() - entered)
+            if RECORDER is not None:
+                RECORDER.choice_taken(message[1].steps - session.steps)
+            return message
+        if message is None:
+            choice_index = parse_choice(user_input, count)
+
+    left = time.monotonic()
+    state.time_played += round(left - entered)
+    counts = CHOICE_COUNTS.setdefault(shown.index, {})
+    taken = shown.offered[choice_index - 1]
+    counts[taken] = counts.get(taken, 0) + 1
+    if RECORDER is not None:
+        RECORDER.choice_taken(choice_index)
+    if hooks is None:
+        return step(session, choice_index, width)
+
+    hooks.input_waited(shown.id, waited)
+    hooks.choice_taken(shown.id, taken + 1, left - entered)
+    played = step(session, choice_index, width)
+    done = time.monotonic()
+    hooks.effects_applied(shown.id, done - left)
+    hooks.scene_played(shown.id, done - entered - waited)
+    return played
+
+def main_loop(session):
+    """
+    Main game loop: plays the session from its current scene until the
+    story ends. Returns the final session.
+    """
+    shown = None
+    while True:
+        message = None
+        if WATCH_STORY:
+            try:
+                if reload_story() is not None:
+                    shown = None
+            except (OSError, ValueError, KeyError) as error:
+                message = f"Story file not reloaded: {error}"
+            if resolve_session(session):
+                shown = None
+        played = play_scene(session, shown, message)
+        if played is None:
+            break
+        shown, session = played
+    typewrite(GOODBYE_TEXT)
+    return session
+
+# ---------------------------------------------------------------------------------
+# PLAYER COMMANDS
+# ---------------------------------------------------------------------------------
+
+# Words the player can type at the choice prompt instead of a number. Each
+# handler takes the session and the rest of the typed line, and returns the
+# message to show, or (view, session) when it moved the session elsewhere.
 
-    chosen_choice = choices[choice_index - 1]
-    if "effects" in chosen_choice and callable(chosen_choice["effects"]):
-        chosen_choice["effects"]()
+SAVE_PATH = os.environ.get("ECHO_SAVE", "echo9.sav")
+COMMANDS_HINT = ("(At any choice, type 'save' to save your progress, "
+                 "'rewind' / 'rewind N' to take back choices, "
+                 "or 'scan WORDS' to search the logs you have read.)\n")
+RESUME_PROMPT = "A saved game was found. Resume it? (y/n): "
 
-    next_scene_id = chosen_choice["next_scene"]
-    return next_scene_id
+def save_layout():
+    """
+    Returns the save-file layout for the current story and item names.
+    """
+    return savegame.Layout(STORY.ids, ITEM_NAMES, FLAG_NAMES)
+
+def save_command(session, argument=""):
+    savegame.save(SAVE_PATH, session.state, save_layout())
+    return f"Progress saved to {SAVE_PATH}."
+
+def rewind_command(session, argument=""):
+    available = len(session.history)
+    if argument and not argument.isdigit():
+        return "Type 'rewind' to take back your last choice, or 'rewind N' for the last N."
+    count = int(argument or 1)
+    if not available:
+        return "There is nothing to rewind."
+    if not 1 <= count <= available:
+        return f"You can rewind at most {available} choices."
+    return rewind(session, count, layout.terminal_width())
+
+# Results listed by one scan; the rest are only counted.
+SCAN_RESULTS = 8
+
+def scan_command(session, argument=""):
+    if not argument.strip():
+        return "Type 'scan WORDS' to search the logs you have read, e.g. 'scan Elan'."
+    state = session.state
+    index = search_index()
+    queries = search_queries(argument, state.name)
+    if len(queries) == 1:
+        found = index.search(queries[0], state.visited)
+    else:
+        found = sorted(set().union(*(index.search(query, state.visited) for query in queries)))
+    if not found:
+        return f"The scanner finds nothing you have read that mentions '{argument}'."
+    lines = [f"Scanner: {len(found)} {'log mentions' if len(found) == 1 else 'logs mention'} "
+             f"'{argument}':"]
+    for i in found[:SCAN_RESULTS]:
+        scene = STORY.scenes[i]
+        description = layout.fill_names(layout.split_names(scene.description), state.name)
+        text = scanner.excerpt(description, argument)
+        lines.append(f"  {scene.title}: {text}" if text else f"  {scene.title}")
+    if len(found) > SCAN_RESULTS:
+        lines.append(f"  ...and {len(found) - SCAN_RESULTS} more.")
+    return "\n".join(lines)
+
+def load_saved_game(path=SAVE_PATH):
+    """
+    Reads a save file into a new GameState.
+    """
+    return savegame.load(path, save_layout(), new_state, STORY.start)
 
-def main_loop():
+COMMANDS = {
+    "save": save_command,
+    "rewind": rewind_command,
+    "scan": scan_command,
+}
+
+def run_command(user_input, session):
     """
-    Main game loop. Starts at INTRO scene and advances
-    until no scene is returned.
+    Runs the player command named by the input, if any. Returns its result
+    (see COMMANDS), or None when the input is not a command.
     """
-    current_scene = "INTRO"
-    while current_scene is not None:
-        current_scene = play_scene(current_scene)
-    slow_print("\nGame session terminated. Goodbye.\n")
+    word, _, argument = user_input.strip().partition(" ")
+    handler = COMMANDS.get(word.lower())
+    if handler is None:
+        return None
+    return handler(session, argument.strip())
 
 # ---------------------------------------------------------------------------------
 # ENTRY POINT
 # ---------------------------------------------------------------------------------
 
-def main():
+def main(argv=None):
     """
     Start the extended Echoes of the Signal game.
     """
-    # Greet the user, optionally get the name
-    clear_screen()
-    slow_print("Welcome to the extended version of 'Echoes of the Signal'!\n", 0.02)
-    name_input = input("Enter your name (or leave as Dr. Alex Riven): ").strip()
-    if name_input:
-        STATE["name"] = name_input
+    global RECORDER, HOOKS, WATCH_STORY, EVENTS, HISTORY_LIMIT, PREFETCH
+    parser = argparse.ArgumentParser(description="Echoes of the Signal")
+    parser.add_argument("--record", metavar="LOG",
+                        help="append this session's choices and transcript to LOG")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the session's random numbers")
+    parser.add_argument("--metrics", metavar="DIR",
+                        help="collect timings and write metrics.json/metrics.prom to DIR")
+    parser.add_argument("--watch", action="store_true",
+                        help="reload the story file between scenes when it changes")
+    parser.add_argument("--history", type=int, default=HISTORY_LIMIT, metavar="N",
+                        help=f"choices the rewind command can take back (default: {HISTORY_LIMIT})")
+    parser.add_argument("--events", metavar="FILE",
+                        help="append play analytics summaries to FILE")
+    parser.add_argument("--events-window", type=float, default=60.0, metavar="SECONDS",
+                        help="analytics window length (default: 60)")
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="do not prepare the next scenes while waiting for a choice")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        HOOKS = metrics.Metrics()
+    if args.events:
+        EVENTS = analytics.Analytics(args.events, args.events_window, ANALYTICS_PAIRS)
+    WATCH_STORY = args.watch
+    PREFETCH = not args.no_prefetch
+    HISTORY_LIMIT = max(args.history, 0)
+
+    # Every session carries a seed so a recording replays the same way
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    random.seed(seed)
+
+    # The keyboard reads keys without line buffering for the whole session
+    with KEYBOARD:
+        # Greet the user, then resume a saved game or get the name
+        clear_screen()
+        typewrite(WELCOME_TEXT, 0.02)
+        session = None
+        if os.path.exists(SAVE_PATH) and TERMINAL.prompt(
+                RESUME_PROMPT, read=KEYBOARD.read_line).strip().lower().startswith("y"):
+            try:
+                session = resume(load_saved_game(), seed)
+            except (OSError, savegame.SaveError) as error:
+                typewrite(f"Could not load {SAVE_PATH}: {error}", 0)
+
+        resumed = session is not None
+        if not resumed:
+            name_input = TERMINAL.prompt(NAME_PROMPT, read=KEYBOARD.read_line).strip()
+            session = start(name_input, seed) if name_input else start(seed=seed)
+        typewrite(COMMANDS_HINT, 0.01)
+
+        if args.record:
+            if not resumed:
+                RECORDER = recording.SessionRecorder(args.record, seed, session.state.name)
+            else:
+                typewrite("Resumed games are not recorded.", 0)
+
+        # Start the main loop
+        try:
+            session = main_loop(session)
+        finally:
+            if HOOKS is not None:
+                HOOKS.set_gauges("layout_cache", LAYOUT.stats())
+                HOOKS.write(args.metrics)
+            if EVENTS is not None:
+                EVENTS.close()
 
-    # Start the main loop
-    main_loop()
+        if RECORDER is not None:
+            RECORDER.finish(summarize_state(session.state))
+            RECORDER = None
 
-    # Once done, we may do a final farewell
-    slow_print("Thank you for playing. Exiting now...")
+        # Once done, we may do a final farewell
+        typewrite(FAREWELL_TEXT)
+        TERMINAL.end()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,178 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: INSTRUMENTATION
+# ---------------------------------------------------------------------------------
+# Optional hot-path measurements for the game loop. main.play_scene (and the
+# server's session loop) call the hooks below only when a Metrics object has
+# been installed as main.HOOKS; otherwise each hook point is a single
+# "is not None" check.
+#
+# Collected:
+#   - dwell time per scene (monotonic clock, from the scene appearing until a
+#     choice is taken)
+#   - how often each (scene, choice) is taken
+#   - latency histograms for a whole scene step, rendering, effect
+#     application and the wait for player input
+#   - gauges set by the caller, such as the layout cache hit rate
+#
+# Results can be written as a JSON snapshot and as a Prometheus text-format
+# file (for a node_exporter textfile collector or a plain scrape).
+#
+# This module does not import main.
+# ---------------------------------------------------------------------------------
+
+import json
+import os
+from collections import Counter
+
+# Histogram bucket upper bounds in seconds, Prometheus style.
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+def label_value(value):
+    """
+    A label value escaped for the Prometheus text format: backslash,
+    double quote and line feed.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram.
+    """
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += seconds
+        self.count += 1
+
+    def snapshot(self):
+        cumulative = []
+        running = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), self.counts):
+            running += count
+            cumulative.append([bound, running])
+        return {"buckets": cumulative, "sum": round(self.total, 6), "count": self.count}
+
+class Metrics:
+    """
+    Receives the instrumentation hooks and keeps the aggregates.
+    """
+
+    HISTOGRAMS = ("step", "render", "effects", "input_wait")
+
+    def __init__(self):
+        self.dwell = {}
+        self.choices = Counter()
+        self.histograms = {name: Histogram() for name in self.HISTOGRAMS}
+        self.gauges = {}
+
+    # Hooks called by the game loop.
+
+    def scene_played(self, scene_id, seconds):
+        self.histograms["step"].observe(seconds)
+
+    def rendered(self, scene_id, seconds):
+        self.histograms["render"].observe(seconds)
+
+    def input_waited(self, scene_id, seconds):
+        self.histograms["input_wait"].observe(seconds)
+
+    def effects_applied(self, scene_id, seconds):
+        self.histograms["effects"].observe(seconds)
+
+    def choice_taken(self, scene_id, choice_number, dwell_seconds):
+        self.choices[(scene_id, choice_number)] += 1
+        entry = self.dwell.get(scene_id)
+        if entry is None:
+            entry = self.dwell[scene_id] = [0.0, 0, 0.0]
+        entry[0] += dwell_seconds
+        entry[1] += 1
+        entry[2] = max(entry[2], dwell_seconds)
+
+    def set_gauges(self, prefix, values):
+        """
+        Records point-in-time values such as cache statistics. Entries that
+        are not numbers are skipped.
+        """
+        for key, value in values.items():
+            if isinstance(value, (int, float)):
+                self.gauges[f"{prefix}_{key}"] = value
+
+    # Exporters.
+
+    def snapshot(self):
+        """
+        Returns all aggregates as a JSON-friendly dict.
+        """
+        return {
+            "dwell_seconds": {
+                scene_id: {"total": round(total, 6), "visits": visits, "max": round(longest, 6)}
+                for scene_id, (total, visits, longest) in sorted(self.dwell.items())
+            },
+            "choices": [
+                {"scene": scene_id, "choice": number, "count": count}
+                for (scene_id, number), count in sorted(self.choices.items())
+            ],
+            "latency_seconds": {name: histogram.snapshot()
+                                for name, histogram in self.histograms.items()},
+            "gauges": dict(sorted(self.gauges.items())),
+        }
+
+    def prometheus(self):
+        """
+        Returns the aggregates in Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP echo_scene_dwell_seconds_total Time players spent on each scene.",
+            "# TYPE echo_scene_dwell_seconds_total counter",
+        ]
+        for scene_id, (total, _, _) in sorted(self.dwell.items()):
+            lines.append(f'echo_scene_dwell_seconds_total{{scene="{label_value(scene_id)}"}} '
+                         f'{total:.6f}')
+        lines += [
+            "# HELP echo_scene_visits_total Choices taken on each scene.",
+            "# TYPE echo_scene_visits_total counter",
+        ]
+        for scene_id, (_, visits, _) in sorted(self.dwell.items()):
+            lines.append(f'echo_scene_visits_total{{scene="{label_value(scene_id)}"}} {visits}')
+        lines += [
+            "# HELP echo_choice_taken_total Times each choice was taken.",
+            "# TYPE echo_choice_taken_total counter",
+        ]
+        for (scene_id, number), count in sorted(self.choices.items()):
+            lines.append(f'echo_choice_taken_total{{scene="{label_value(scene_id)}",'
+                         f'choice="{number}"}} {count}')
+        for name, histogram in self.histograms.items():
+            metric = f"echo_{name}_seconds"
+            lines += [f"# HELP {metric} Latency of {name.replace('_', ' ')}.",
+                      f"# TYPE {metric} histogram"]
+            snapshot = histogram.snapshot()
+            for bound, count in snapshot["buckets"]:
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{metric}_sum {snapshot['sum']}")
+            lines.append(f"{metric}_count {snapshot['count']}")
+        for name, value in sorted(self.gauges.items()):
+            lines += [f"# TYPE echo_{name} gauge", f"echo_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory):
+        """
+        Writes metrics.json and metrics.prom into `directory`. Each file is
+        replaced atomically so scrapers never see a partial file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for filename, text in (("metrics.json", json.dumps(self.snapshot(), indent=2)),
+                               ("metrics.prom", self.prometheus())):
+            path = os.path.join(directory, filename)
+            with open(path + ".tmp", "w", encoding="utf-8") as handle:
+                handle.write(text)
+            os.replace(path + ".tmp", path)
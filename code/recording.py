@@ -0,0 +1,62 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: SESSION RECORDINGS
+# ---------------------------------------------------------------------------------
+# A recording log holds one JSON object per line, one line per finished session:
+#
+#   {"seed": 1234, "name": "Sam", "choices": [1, 2, ...],
+#    "steps": [["INTRO", 2837401923], ...], "final": {...}}
+#
+# "choices" are the choice numbers the player picked (a negative number -N
+# is a "rewind N" command), "steps" pair every scene that was shown with a
+# CRC-32 of the text shown for it, and "final" is the summary of the state at
+# the end of the session. replay.py plays recordings back and compares
+# against "steps" and "final".
+#
+# This module does not import main, so the game can use it while recording.
+# ---------------------------------------------------------------------------------
+
+import json
+import zlib
+
+def text_crc(text):
+    """
+    CRC-32 of a transcript text, as stored in "steps".
+    """
+    return zlib.crc32(text.encode("utf-8"))
+
+class SessionRecorder:
+    """
+    Collects one session's inputs and transcript and appends them to a log.
+    """
+
+    def __init__(self, path, seed, name=""):
+        self.path = path
+        self.seed = seed
+        self.name = name
+        self.choices = []
+        self.steps = []
+
+    def scene_shown(self, scene_id, text):
+        self.steps.append([scene_id, text_crc(text)])
+
+    def choice_taken(self, number):
+        self.choices.append(number)
+
+    def finish(self, final):
+        """
+        Appends the session to the log. `final` is the end-of-session summary.
+        """
+        entry = {"seed": self.seed, "name": self.name, "choices": self.choices,
+                 "steps": self.steps, "final": final}
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def read_log(path):
+    """
+    Yields the recorded sessions in a log.
+    """
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
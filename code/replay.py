@@ -0,0 +1,146 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: DETERMINISTIC REPLAY
+# ---------------------------------------------------------------------------------
+# Plays recorded sessions (python main.py --record LOG) back headlessly and at
+# full speed: no screen clearing, no typewriter delays and no input prompts.
+# Each session is reseeded from its recording, re-run through the engine API
+# (main.start(), main.step() and main.rewind()), and its transcript and
+# final state are compared with what was recorded.
+# Sessions are spread over a process pool.
+#
+# Usage:
+#   python replay.py LOG [--workers 4] [--show N]
+#
+# --show N prints the replayed transcript and final state of session N.
+# The exit status is 1 if any session diverged.
+# ---------------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+import recording
+
+# ---------------------------------------------------------------------------------
+# REPLAY
+# ---------------------------------------------------------------------------------
+
+def replay_session(entry, keep_transcript=False):
+    """
+    Re-runs one recorded session. Returns a result dict with the replayed
+    steps, the final state summary and where (if anywhere) it diverged.
+    """
+    random.seed(entry["seed"])
+    session = main.start(entry["name"], entry["seed"])
+    shown = main.scene_view(session)
+    choices = iter(entry["choices"])
+    steps = []
+    transcript = []
+    error = None
+
+    while True:
+        text = main.transcript_text(shown.pieces)
+        steps.append([shown.id, recording.text_crc(text)])
+        if keep_transcript:
+            transcript.append(text)
+        if not shown.choices:
+            break
+        number = next(choices, None)
+        if number is None:
+            error = f"recording ends at {shown.id} before the story does"
+            break
+        try:
+            shown, session = main.move(session, number)
+        except main.ChoiceError as choice_error:
+            error = str(choice_error)
+            break
+
+    state = session.state
+    final = main.summarize_state(state)
+    result = {
+        "steps": len(steps),
+        "final": final,
+        "error": error,
+        "diverged_at": None,
+        "final_matches": final == entry.get("final"),
+    }
+    expected = entry.get("steps", [])
+    for index in range(max(len(steps), len(expected))):
+        got = steps[index] if index < len(steps) else None
+        want = expected[index] if index < len(expected) else None
+        if got != want:
+            result["diverged_at"] = {"step": index, "expected": want, "replayed": got}
+            break
+    if keep_transcript:
+        result["transcript"] = transcript
+    return result
+
+def replay_batch(entries):
+    """
+    Replays a batch of sessions. Runs in pool workers.
+    """
+    return [replay_session(entry) for entry in entries]
+
+def replay_log(entries, workers=None, batch=256):
+    """
+    Replays every session, in parallel when there are enough of them.
+    Returns the results in log order.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    batches = [entries[i:i + batch] for i in range(0, len(entries), batch)]
+    if workers <= 1 or len(batches) <= 1:
+        return [result for part in batches for result in replay_batch(part)]
+    with ProcessPoolExecutor(workers) as pool:
+        return [result for part in pool.map(replay_batch, batches) for result in part]
+
+def summarize(results):
+    """
+    Counts matches and lists the sessions that diverged.
+    """
+    diverged = []
+    for index, result in enumerate(results):
+        if result["error"] or result["diverged_at"] or not result["final_matches"]:
+            diverged.append({"session": index, "error": result["error"],
+                             "diverged_at": result["diverged_at"],
+                             "final_matches": result["final_matches"]})
+    return {"sessions": len(results), "matched": len(results) - len(diverged),
+            "diverged": diverged}
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+def run():
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Replay recorded sessions headlessly")
+    parser.add_argument("log", help="recording log written by main.py --record")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--show", type=int, metavar="N",
+                        help="print the replayed transcript of session N")
+    args = parser.parse_args()
+
+    entries = list(recording.read_log(args.log))
+    if args.show is not None:
+        result = replay_session(entries[args.show], keep_transcript=True)
+        sys.stdout.write("\n".join(result.pop("transcript")))
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return
+
+    summary = summarize(replay_log(entries, args.workers))
+    print(f"Replayed {summary['sessions']} sessions: {summary['matched']} matched, "
+          f"{len(summary['diverged'])} diverged")
+    for item in summary["diverged"][:20]:
+        print(json.dumps(item, ensure_ascii=False))
+    if len(summary["diverged"]) > 20:
+        print(f"... and {len(summary['diverged']) - 20} more")
+    raise SystemExit(1 if summary["diverged"] else 0)
+
+if __name__ == "__main__":
+    run()
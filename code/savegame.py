@@ -0,0 +1,235 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: SAVE FILES
+# ---------------------------------------------------------------------------------
+# Versioned binary snapshots of a GameState.
+#
+# A save file is a header followed by one or more fixed-size records:
+#
+#   header:  "<8sHHI"  magic b"ECHOSAVE", format version, record size,
+#                      length of the name tables that follow
+#   tables:  the writer's scene IDs, item names and flag names, so a file
+#            written before scenes or items were added can be remapped
+#   record:  "<IIiiII48s{V}s{I}s"  session ID, scene, morality, health,
+#            time played, flags, player name (UTF-8, zero padded), visited
+#            bitset (V bytes), inventory bitset (I bytes)
+#
+# A single save holds one record. load_all() also reads files with several
+# records and keeps the last record of each session. Records are read with
+# struct, with no JSON or pickle involved. A truncated or damaged file raises
+# SaveError.
+#
+# This module does not import main; callers pass in the compiled story and a
+# state factory.
+# ---------------------------------------------------------------------------------
+
+import os
+import struct
+
+MAGIC = b"ECHOSAVE"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHHI")
+NAME_BYTES = 48
+
+class SaveError(ValueError):
+    """
+    Raised for files that are not save files or cannot be read.
+    """
+
+# ---------------------------------------------------------------------------------
+# LAYOUT
+# ---------------------------------------------------------------------------------
+
+class Layout:
+    """
+    The record layout and name tables for one story.
+    """
+
+    def __init__(self, scene_ids, item_names, flag_names):
+        self.scene_ids = tuple(scene_ids)
+        self.item_names = tuple(item_names)
+        self.flag_names = tuple(flag_names)
+        self.visited_bytes = (len(self.scene_ids) + 7) // 8
+        self.inventory_bytes = max(1, (len(self.item_names) + 7) // 8)
+        self.record = struct.Struct(
+            f"<IIiiII{NAME_BYTES}s{self.visited_bytes}s{self.inventory_bytes}s"
+        )
+
+    def tables(self):
+        """
+        The name tables as bytes: three blocks of newline-separated names.
+        """
+        blocks = ["\n".join(names).encode("utf-8")
+                  for names in (self.scene_ids, self.item_names, self.flag_names)]
+        return b"".join(struct.pack("<I", len(block)) + block for block in blocks)
+
+    @classmethod
+    def from_tables(cls, data):
+        names = []
+        offset = 0
+        for _ in range(3):
+            (length,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            if offset + length > len(data):
+                raise SaveError("Name tables are truncated")
+            block = bytes(data[offset:offset + length]).decode("utf-8")
+            names.append(block.split("\n") if block else [])
+            offset += length
+        return cls(*names)
+
+    def header(self):
+        tables = self.tables()
+        return HEADER.pack(MAGIC, FORMAT_VERSION, self.record.size, len(tables)) + tables
+
+    def same_as(self, other):
+        return (self.scene_ids == other.scene_ids
+                and self.item_names == other.item_names
+                and self.flag_names == other.flag_names)
+
+# ---------------------------------------------------------------------------------
+# RECORDS
+# ---------------------------------------------------------------------------------
+
+def encode_name(name):
+    """
+    UTF-8 name cut to NAME_BYTES on a character boundary.
+    """
+    data = name.encode("utf-8")[:NAME_BYTES]
+    return data.decode("utf-8", errors="ignore").encode("utf-8")
+
+def pack_state(layout, state, session_id=0):
+    """
+    Packs a GameState into one record.
+    """
+    return layout.record.pack(
+        session_id, state.scene, state.morality, state.health,
+        state.time_played, state.flags, encode_name(state.name),
+        state.visited.to_bytes(layout.visited_bytes, "little"),
+        state.inventory.to_bytes(layout.inventory_bytes, "little"),
+    )
+
+def unpack_fields(layout, fields, new_state):
+    """
+    Builds a GameState from unpacked record fields. Returns (session ID, state).
+    """
+    (session_id, scene, morality, health, time_played, flags,
+     name, visited, inventory) = fields
+    state = new_state(name.rstrip(b"\0").decode("utf-8"))
+    state.scene = scene
+    state.morality = morality
+    state.health = health
+    state.time_played = time_played
+    state.flags = flags
+    state.visited = int.from_bytes(visited, "little")
+    state.inventory = int.from_bytes(inventory, "little")
+    return session_id, state
+
+def remap_bits(bits, old_names, new_index):
+    """
+    Moves the set bits of a bitset from an old name table to a new one.
+    Names that no longer exist are dropped.
+    """
+    result = 0
+    index = 0
+    while bits:
+        if bits & 1 and index < len(old_names):
+            new = new_index.get(old_names[index])
+            if new is not None:
+                result |= 1 << new
+        bits >>= 1
+        index += 1
+    return result
+
+def migrate(state, old, new, start):
+    """
+    Rewrites a state read with an older layout for the current one. Scenes
+    that were removed send the player back to `start`.
+    """
+    scene_index = {name: i for i, name in enumerate(new.scene_ids)}
+    item_index = {name: i for i, name in enumerate(new.item_names)}
+    flag_index = {name: i for i, name in enumerate(new.flag_names)}
+    scene_id = old.scene_ids[state.scene] if state.scene < len(old.scene_ids) else None
+    state.scene = scene_index.get(scene_id, start)
+    state.visited = remap_bits(state.visited, old.scene_ids, scene_index)
+    state.inventory = remap_bits(state.inventory, old.item_names, item_index)
+    state.flags = remap_bits(state.flags, old.flag_names, flag_index)
+    return state
+
+# Readers for older format versions. Each takes the raw header fields and the
+# file contents and returns (layout, offset of the first record). Version 1 is
+# the only format so far; a future version 2 reader would add an entry here.
+def _read_v1(data, record_size, tables_length):
+    offset = HEADER.size
+    if offset + tables_length > len(data):
+        raise SaveError("File is truncated inside the name tables")
+    layout = Layout.from_tables(data[offset:offset + tables_length])
+    if layout.record.size != record_size:
+        raise SaveError("Record size does not match the name tables")
+    return layout, offset + tables_length
+
+READERS = {1: _read_v1}
+
+def read_header(data):
+    """
+    Parses the header of a save file. Returns (layout, first record offset).
+    """
+    if len(data) < HEADER.size:
+        raise SaveError("File is too short to be a save file")
+    magic, version, record_size, tables_length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SaveError("Not an Echoes of the Signal save file")
+    if version not in READERS:
+        raise SaveError(f"Unsupported save format version {version}")
+    try:
+        return READERS[version](data, record_size, tables_length)
+    except (struct.error, UnicodeDecodeError) as error:
+        raise SaveError(f"Damaged name tables: {error}") from None
+
+# ---------------------------------------------------------------------------------
+# FILES
+# ---------------------------------------------------------------------------------
+
+def save(path, state, layout):
+    """
+    Writes a single-session save file, replacing any earlier one.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as handle:
+        handle.write(layout.header())
+        handle.write(pack_state(layout, state))
+    os.replace(temp_path, path)
+
+def load_all(path, layout, new_state, start=0):
+    """
+    Reads a save file and returns {session ID: latest GameState}. States
+    written with another layout are migrated to `layout`.
+    """
+    with open(path, "rb") as handle:
+        data = handle.read()
+    file_layout, offset = read_header(data)
+    record = file_layout.record
+    usable = (len(data) - offset) // record.size * record.size
+    same = file_layout.same_as(layout)
+
+    sessions = {}
+    for fields in record.iter_unpack(memoryview(data)[offset:offset + usable]):
+        try:
+            session_id, state = unpack_fields(file_layout, fields, new_state)
+        except UnicodeDecodeError:
+            raise SaveError("Damaged record: the player name is not UTF-8") from None
+        if state.scene >= len(file_layout.scene_ids):
+            raise SaveError(f"Damaged record: no scene number {state.scene}")
+        sessions[session_id] = state
+    if not same:
+        for state in sessions.values():
+            migrate(state, file_layout, layout, start)
+    return sessions
+
+def load(path, layout, new_state, start=0):
+    """
+    Reads a single-session save file and returns its GameState.
+    """
+    sessions = load_all(path, layout, new_state, start)
+    if not sessions:
+        raise SaveError("Save file holds no snapshot")
+    return sessions[next(reversed(sessions))]
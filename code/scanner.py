@@ -0,0 +1,195 @@
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: SCANNER SEARCH
+# ---------------------------------------------------------------------------------
+# The handheld scanner keeps what the player has read: the crew notes, the
+# terminal file in the dorm, Dr. Elan's audio logs. "scan WORDS" at a choice
+# lists every scene the player has visited whose title or description
+# mentions all of the words.
+#
+# Text is split into lowercase word tokens, and a token-level inverted index
+# maps each token to the scenes that contain it. Scene numbers are the same
+# small integers GameState.visited uses as bit positions, so a query is a
+# few set intersections, the last one with the session's visited bitset,
+# and never looks at a description it does not return. Postings are kept
+# in whichever form is smaller:
+#
+#   - tokens found in many scenes (at least one in 32) as a Python int with
+#     a bit per scene, intersected with a bitset in a single operation
+#   - rarer tokens as a sorted array of scene numbers, checked against the
+#     visited bitset one entry at a time after turning it into bytes once
+#
+# add() and remove() keep the index current when scenes are edited (see
+# main.reload_story()); remove() needs the text the scene was indexed with.
+#
+# This module does not import main.
+# ---------------------------------------------------------------------------------
+
+import re
+import sys
+import textwrap
+from array import array
+from bisect import bisect_left, insort
+from itertools import compress
+
+TOKEN = re.compile(r"[^\W_]{2,}")
+SENTENCE_END = re.compile(r"(?<!\bDr)[.!?][\"']?\s+")
+
+# A posting becomes a bitset when at least one scene in this many has it.
+DENSE_RATIO = 32
+
+def tokenize(text):
+    """
+    The distinct word tokens of a text, lowercased, in order. Single
+    letters (the "s" of "Elan's") are left out.
+    """
+    return list(dict.fromkeys(TOKEN.findall(text.lower())))
+
+def bitset_members(bits):
+    """
+    The positions of the set bits of a non-negative int, in order. Only the
+    non-zero 64-bit words are looked at one by one.
+    """
+    size = (bits.bit_length() + 63) // 64
+    words = array("Q", bits.to_bytes(size * 8, "little"))
+    if sys.byteorder == "big":
+        words.byteswap()
+    members = []
+    for at in compress(range(size), words):
+        word = words[at]
+        base = at * 64 - 1
+        while word:
+            low = word & -word
+            members.append(base + low.bit_length())
+            word ^= low
+    return members
+
+class SearchIndex:
+    """
+    Inverted index from word tokens to scene numbers.
+    """
+
+    def __init__(self, texts=()):
+        """
+        Indexes `texts`, an iterable of (scene number, text) pairs in scene
+        number order.
+        """
+        postings = {}
+        count = 0
+        for number, text in texts:
+            count = max(count, number + 1)
+            for token in tokenize(text):
+                posting = postings.get(token)
+                if posting is None:
+                    posting = postings[token] = array("I")
+                posting.append(number)
+        self.postings = {}
+        for token, posting in postings.items():
+            self.postings[token] = (self._bitset(posting) if len(posting) * DENSE_RATIO >= count
+                                    else posting)
+
+    @staticmethod
+    def _bitset(numbers):
+        data = bytearray(numbers[-1] // 8 + 1)
+        for number in numbers:
+            data[number >> 3] |= 1 << (number & 7)
+        return int.from_bytes(data, "little")
+
+    def __len__(self):
+        return len(self.postings)
+
+    def add(self, number, text):
+        """
+        Indexes one more scene (or the new text of an edited one, after
+        remove() has dropped the old).
+        """
+        postings = self.postings
+        for token in tokenize(text):
+            posting = postings.get(token)
+            if posting is None:
+                postings[token] = array("I", (number,))
+            elif type(posting) is int:
+                postings[token] = posting | 1 << number
+            else:
+                insort(posting, number)
+
+    def remove(self, number, text):
+        """
+        Drops a scene that was indexed with `text`.
+        """
+        postings = self.postings
+        for token in tokenize(text):
+            posting = postings.get(token)
+            if posting is None:
+                continue
+            if type(posting) is int:
+                posting &= ~(1 << number)
+            else:
+                at = bisect_left(posting, number)
+                if at < len(posting) and posting[at] == number:
+                    del posting[at]
+            if posting:
+                postings[token] = posting
+            else:
+                del postings[token]
+
+    def search(self, query, visited=-1):
+        """
+        The scene numbers, in order, whose text has every word of `query`
+        and whose bit is set in `visited` (all scenes by default).
+        """
+        postings = []
+        for token in tokenize(query):
+            posting = self.postings.get(token)
+            if posting is None:
+                return []
+            postings.append(posting)
+        if not postings:
+            return []
+
+        found = visited
+        lists = []
+        for posting in postings:
+            if type(posting) is int:
+                found &= posting
+            else:
+                lists.append(posting)
+        if not lists:
+            return bitset_members(found)
+        if found == 0:
+            return []
+
+        # Walk the shortest list, testing each entry against the bitset and
+        # the other lists
+        lists.sort(key=len)
+        if found < 0:
+            numbers = list(lists[0])
+        else:
+            data = found.to_bytes((found.bit_length() + 7) // 8, "little")
+            limit = len(data) * 8
+            numbers = [number for number in lists[0]
+                       if number < limit and data[number >> 3] >> (number & 7) & 1]
+        for posting in lists[1:]:
+            numbers = [number for number in numbers
+                       if (at := bisect_left(posting, number)) < len(posting)
+                       and posting[at] == number]
+        return numbers
+
+def excerpt(text, query, width=72):
+    """
+    The sentence of `text` with the first word of `query` in it, shortened
+    to `width` characters (and started closer to the word if it is far in).
+    """
+    text = " ".join(text.split())
+    wanted = set(tokenize(query))
+    match = next((match for match in TOKEN.finditer(text) if match.group().lower() in wanted),
+                 None)
+    if match is None:
+        return ""
+    start = 0
+    for end in SENTENCE_END.finditer(text, 0, match.start()):
+        start = end.end()
+    if match.start() - start > width // 2:
+        # The first word break within a quarter width before the word
+        start = text.find(" ", match.start() - width // 4, match.start()) + 1 or match.start()
+        return textwrap.shorten("..." + text[start:], width, placeholder="...")
+    return textwrap.shorten(text[start:], width, placeholder="...")
@@ -0,0 +1,480 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: MULTI-SESSION SERVER
+# ---------------------------------------------------------------------------------
+# Serves the game over a line-based TCP protocol (any telnet or netcat client
+# works). Every connection runs its own session with its own state against the
+# shared compiled story graph; all sessions live in one asyncio event loop, and the
+# typewriter effect is paced by the loop instead of by sleeping threads.
+#
+# Usage:
+#   python server.py [--host 0.0.0.0] [--port 7009] [--watch] [--sessions DB]
+#                    [--events FILE]
+#   python server.py --soak [--idle 5000] [--active 500]
+#
+# The --soak mode starts the server and a local stand-in client in the same
+# process, parks the idle connections at the name prompt and plays the active
+# ones through the story, then reports whether any session was starved.
+#
+# With --watch the server polls the story file and reloads it in place when it
+# changes; sessions keep playing, and a session whose scene was removed
+# continues from the start scene when it next moves.
+#
+# With --sessions DB, players who give a name have their game kept in a SQLite
+# session store (sessionstore.py) and pick it up again when they reconnect
+# under the same name, also after a server restart. A name can only be
+# playing on one connection at a time.
+#
+# With --events FILE, every session's scenes and choices feed the play
+# analytics pipeline (analytics.py), which appends a summary line to FILE per
+# --events-window seconds.
+# ---------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import random
+import re
+import signal
+import time
+
+import analytics
+import main
+import metrics
+import sessionstore
+
+# Scales every typewriter delay; 0 sends text immediately.
+DELAY_SCALE = 1.0
+
+# With --sessions, a sessionstore.SessionStore: named players' games are kept
+# there and resume when the same name connects again.
+SESSIONS = None
+RESUMED_TEXT = "Welcome back. Resuming where you left off."
+
+# Keys of stored sessions a connection is playing right now. The store hands
+# out the same state object for a key, so a second connection under a name
+# that is already playing is asked for another name.
+ATTACHED = set()
+IN_USE_TEXT = "That name is already playing on another connection. Please choose another."
+
+CLEAR_SEQUENCE = "\x1b[2J\x1b[H"
+
+SERVER_STATS = {
+    "live": 0,
+    "started": 0,
+    "finished": 0,
+}
+
+# ---------------------------------------------------------------------------------
+# SESSION I/O
+# ---------------------------------------------------------------------------------
+
+def send(writer, text):
+    """
+    Queues text on the connection, using telnet line endings.
+    """
+    writer.write(text.replace("\n", "\r\n").encode("utf-8"))
+
+async def typewrite_async(writer, text, delay=0.03):
+    """
+    Sends text with the typewriter effect. Like main.typewrite() it emits one
+    chunk per frame, but it waits on the event loop between frames.
+    """
+    delay *= DELAY_SCALE
+    if main.INSTANT_RENDER or delay <= 0:
+        send(writer, text + "\n")
+        await writer.drain()
+        return
+
+    loop = asyncio.get_running_loop()
+    frame = 1.0 / main.FRAME_RATE
+    length = len(text)
+    shown = 0
+    start = next_tick = loop.time()
+    while True:
+        due = main.chars_due(loop.time() - start, delay, length)
+        if due > shown:
+            send(writer, text[shown:due])
+            await writer.drain()
+            shown = due
+        if shown >= length:
+            break
+        next_tick += frame
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+    send(writer, "\n")
+    await writer.drain()
+
+async def prompt(reader, writer, text):
+    """
+    Sends a prompt and waits for one line of input. Returns None once the
+    client has gone away.
+    """
+    send(writer, text)
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        return None
+    return line.decode("utf-8", errors="replace")
+
+# ---------------------------------------------------------------------------------
+# SESSION LOOP
+# ---------------------------------------------------------------------------------
+
+async def play_scene_async(reader, writer, session, shown=None):
+    """
+    Network counterpart of main.play_scene(). Returns main.step()'s (next
+    view, session), or None when the story ends or the client disconnects.
+    """
+    hooks = main.HOOKS
+    loop = asyncio.get_running_loop()
+    entered = loop.time()
+
+    send(writer, CLEAR_SEQUENCE)
+    if shown is None:
+        # Telnet clients do not report their width; keep the 80-column text
+        shown = main.scene_view(session)
+    for text, delay in shown.pieces:
+        await typewrite_async(writer, text, delay)
+    if hooks is not None:
+        hooks.rendered(shown.id, loop.time() - entered)
+
+    if not shown.choices:
+        return None
+
+    choice_index = None
+    waited = 0.0
+    while choice_index is None:
+        prompted = loop.time()
+        user_input = await prompt(reader, writer, main.CHOICE_PROMPT)
+        waited += loop.time() - prompted
+        if user_input is None:
+            return None
+        choice_index = main.parse_choice(user_input, len(shown.choices))
+
+    left = loop.time()
+    session.state.time_played += round(left - entered)
+    if hooks is None:
+        return main.step(session, choice_index)
+
+    hooks.input_waited(shown.id, waited)
+    hooks.choice_taken(shown.id, shown.offered[choice_index - 1] + 1, left - entered)
+    played = main.step(session, choice_index)
+    done = loop.time()
+    hooks.effects_applied(shown.id, done - left)
+    hooks.scene_played(shown.id, done - entered - waited)
+    return played
+
+async def run_session(reader, writer):
+    """
+    Runs one player's game from the welcome text to the final scene.
+    """
+    SERVER_STATS["live"] += 1
+    SERVER_STATS["started"] += 1
+    key = ""
+    try:
+        send(writer, CLEAR_SEQUENCE)
+        await typewrite_async(writer, main.WELCOME_TEXT, 0.02)
+        while True:
+            name_input = await prompt(reader, writer, main.NAME_PROMPT)
+            if name_input is None:
+                return
+            name = name_input.strip()
+            # Only named players are stored; the default name is shared
+            if SESSIONS is None or name not in ATTACHED:
+                break
+            await typewrite_async(writer, IN_USE_TEXT, 0)
+
+        key = name if SESSIONS is not None else ""
+        if key:
+            ATTACHED.add(key)
+        saved = SESSIONS.get(key) if key else None
+        if saved is not None:
+            session = main.resume(saved)
+            await typewrite_async(writer, RESUMED_TEXT, 0)
+        else:
+            session = main.start(name) if name else main.start()
+        shown = None
+        while True:
+            if main.resolve_session(session):
+                shown = None
+            played = await play_scene_async(reader, writer, session, shown)
+            if key:
+                SESSIONS.put(key, session.state)
+            if played is None:
+                break
+            shown, session = played
+        if key and main.is_terminal(session):
+            # The story is over; a disconnected player keeps their session
+            SESSIONS.delete(key)
+        await typewrite_async(writer, main.GOODBYE_TEXT)
+        await typewrite_async(writer, main.FAREWELL_TEXT)
+        SERVER_STATS["finished"] += 1
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    except asyncio.CancelledError:
+        pass  # server shutting down; a stored session resumes next time
+    finally:
+        ATTACHED.discard(key)
+        SERVER_STATS["live"] -= 1
+        writer.close()
+
+async def serve(host="0.0.0.0", port=7009, backlog=4096):
+    """
+    Starts accepting connections and returns the asyncio server.
+    """
+    return await asyncio.start_server(run_session, host, port, backlog=backlog)
+
+# ---------------------------------------------------------------------------------
+# STAND-IN CLIENT
+# ---------------------------------------------------------------------------------
+
+CHOICE_LINE = re.compile(r"^\[(\d+)\]", re.MULTILINE)
+
+async def idle_client(host, port, hold):
+    """
+    Connects, waits for the name prompt and then sits there until `hold` is
+    set. Returns True if the connection was still open at that point.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await reader.readuntil(main.NAME_PROMPT.encode("utf-8"))
+        await hold.wait()
+        return not reader.at_eof()
+    finally:
+        writer.close()
+
+async def active_client(host, port, rng):
+    """
+    Plays one game, picking a random choice at every prompt. Returns the
+    longest gap in seconds between two chunks of output while text was
+    streaming, or None if the game did not reach its farewell.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    prompt_bytes = main.CHOICE_PROMPT.replace("\n", "\r\n").encode("utf-8")
+    name_bytes = main.NAME_PROMPT.encode("utf-8")
+    farewell = main.FAREWELL_TEXT.encode("utf-8")
+    buffer = b""
+    worst_gap = 0.0
+    last = time.monotonic()
+    try:
+        while True:
+            chunk = await reader.read(4096)
+            now = time.monotonic()
+            if not chunk:
+                break
+            worst_gap = max(worst_gap, now - last)
+            last = now
+            buffer += chunk
+            if buffer.endswith(name_bytes):
+                writer.write(b"Stand-in\r\n")
+                buffer = b""
+            elif buffer.endswith(prompt_bytes):
+                text = buffer.decode("utf-8", errors="replace")
+                count = len(CHOICE_LINE.findall(text))
+                writer.write(f"{rng.randint(1, max(count, 1))}\r\n".encode("ascii"))
+                buffer = b""
+            # The client answers instantly, so the gap timer only covers the
+            # time the server spends streaming text.
+            last = time.monotonic()
+        if farewell in buffer:
+            return worst_gap
+        return None
+    finally:
+        writer.close()
+
+async def soak(idle=5000, active=500, stall_limit=1.0, seed=9):
+    """
+    Holds `idle` parked sessions open while `active` sessions play through
+    the story, all in this process. Returns a report dict.
+    """
+    server = await serve("127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    hold = asyncio.Event()
+    rng = random.Random(seed)
+
+    started = time.monotonic()
+    idle_tasks = []
+    for start in range(0, idle, 500):
+        batch = [asyncio.create_task(idle_client(host, port, hold))
+                 for _ in range(min(500, idle - start))]
+        idle_tasks.extend(batch)
+        await asyncio.sleep(0)
+    while SERVER_STATS["live"] < idle:
+        await asyncio.sleep(0.05)
+    held_at_start = SERVER_STATS["live"]
+
+    gaps = await asyncio.gather(
+        *(active_client(host, port, random.Random(rng.random())) for _ in range(active))
+    )
+    held_at_end = SERVER_STATS["live"]
+    hold.set()
+    still_open = sum(await asyncio.gather(*idle_tasks))
+    server.close()
+    await server.wait_closed()
+
+    finished = sorted(g for g in gaps if g is not None)
+    report = {
+        "idle_sessions_held": min(held_at_start, held_at_end),
+        "idle_connections_open_at_end": still_open,
+        "active_sessions": active,
+        "active_completed": len(finished),
+        "worst_stall_p50": finished[len(finished) // 2] if finished else None,
+        "worst_stall_max": finished[-1] if finished else None,
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+    }
+    report["ok"] = (
+        still_open == idle
+        and len(finished) == active
+        and bool(finished) and finished[-1] <= stall_limit
+    )
+    return report
+
+def raise_file_limit(needed):
+    """
+    Raises the soft open-file limit towards `needed` where the OS allows it.
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+def run():
+    """
+    Command-line entry point for the server and the soak check.
+    """
+    global DELAY_SCALE, SESSIONS
+    parser = argparse.ArgumentParser(description="Echoes of the Signal game server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=7009)
+    parser.add_argument("--delay-scale", type=float, default=None,
+                        help="multiply typewriter delays (0 sends text instantly)")
+    parser.add_argument("--metrics", metavar="DIR",
+                        help="collect timings and rewrite metrics.json/metrics.prom in DIR")
+    parser.add_argument("--metrics-interval", type=float, default=15.0,
+                        help="seconds between metrics writes")
+    parser.add_argument("--watch", action="store_true",
+                        help="reload the story file while serving when it changes")
+    parser.add_argument("--watch-interval", type=float, default=1.0,
+                        help="seconds between story file checks")
+    parser.add_argument("--sessions", metavar="DB",
+                        help="keep named players' games in this SQLite file across restarts")
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        help="most seconds a session change waits before it is written")
+    parser.add_argument("--events", metavar="FILE",
+                        help="append play analytics summaries to FILE")
+    parser.add_argument("--events-window", type=float, default=60.0, metavar="SECONDS",
+                        help="analytics window length (default: 60)")
+    parser.add_argument("--soak", action="store_true",
+                        help="run the in-process idle/active session check")
+    parser.add_argument("--idle", type=int, default=5000)
+    parser.add_argument("--active", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.soak:
+        DELAY_SCALE = 0.1 if args.delay_scale is None else args.delay_scale
+        raise_file_limit(2 * (args.idle + args.active) + 256)
+        report = asyncio.run(soak(args.idle, args.active))
+        for key, value in report.items():
+            print(f"{key}: {value}")
+        raise SystemExit(0 if report["ok"] else 1)
+
+    if args.delay_scale is not None:
+        DELAY_SCALE = args.delay_scale
+
+    if args.metrics:
+        main.HOOKS = metrics.Metrics()
+    if args.sessions:
+        SESSIONS = sessionstore.SessionStore(args.sessions, main.save_layout(), main.new_state,
+                                             main.STORY.start,
+                                             flush_interval=args.flush_interval)
+    if args.events:
+        main.EVENTS = analytics.Analytics(args.events, args.events_window,
+                                          main.ANALYTICS_PAIRS)
+
+    async def write_metrics():
+        while True:
+            await asyncio.sleep(args.metrics_interval)
+            main.HOOKS.set_gauges("layout_cache", main.LAYOUT.stats())
+            if SESSIONS is not None:
+                main.HOOKS.set_gauges("sessions", SESSIONS.stats)
+            main.HOOKS.write(args.metrics)
+
+    async def watch_story():
+        while True:
+            await asyncio.sleep(args.watch_interval)
+            started = time.perf_counter()
+            try:
+                report = main.reload_story()
+            except (OSError, ValueError, KeyError) as error:
+                print(f"Story file not reloaded: {error}", flush=True)
+                continue
+            if report is not None and SESSIONS is not None:
+                SESSIONS.use_layout(main.save_layout())
+            if report is not None:
+                counts = ", ".join(f"{len(ids)} {kind}" for kind, ids in report.items())
+                print(f"Reloaded {main.STORY_PATH}: {counts} "
+                      f"in {(time.perf_counter() - started) * 1000:.1f} ms", flush=True)
+
+    async def flush_sessions():
+        while True:
+            await asyncio.sleep(args.flush_interval / 2)
+            SESSIONS.maybe_flush()
+
+    async def tick_events():
+        # Windows close on time even while nobody is playing
+        while True:
+            await asyncio.sleep(min(args.events_window, 1.0))
+            main.EVENTS.tick()
+
+    def report_failure(task):
+        # A background loop that dies stops its work; say so when it happens
+        if not task.cancelled() and task.exception() is not None:
+            print(f"{task.get_name()} stopped: {task.exception()!r}", flush=True)
+
+    async def forever():
+        server = await serve(args.host, args.port)
+        print(f"Serving Echoes of the Signal on {args.host}:{args.port}")
+        loops = []
+        if main.HOOKS is not None:
+            loops.append(write_metrics)
+        if args.watch:
+            loops.append(watch_story)
+        if SESSIONS is not None:
+            loops.append(flush_sessions)
+        if main.EVENTS is not None:
+            loops.append(tick_events)
+        tasks = [asyncio.create_task(loop(), name=loop.__name__) for loop in loops]
+        for task in tasks:
+            task.add_done_callback(report_failure)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Stop on SIGTERM the way Ctrl-C does, so sessions and metrics are written
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if SESSIONS is not None:
+            SESSIONS.close()
+        if main.EVENTS is not None:
+            main.EVENTS.close()
+        if main.HOOKS is not None:
+            main.HOOKS.set_gauges("layout_cache", main.LAYOUT.stats())
+            main.HOOKS.write(args.metrics)
+
+if __name__ == "__main__":
+    run()
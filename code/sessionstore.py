@@ -0,0 +1,200 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: SESSION STORE
+# ---------------------------------------------------------------------------------
+# Keeps hosted players' game states in a SQLite database (stdlib sqlite3, WAL
+# journal), so sessions survive a server restart without a disk write on
+# every choice.
+#
+# Write-behind: put() only marks a session dirty. Dirty sessions are written
+# together in one transaction when enough of them have piled up or when the
+# oldest change is older than the flush interval, and on close(). Each write
+# stores the session's latest state, so a player who makes ten choices
+# between flushes costs one row write. A crash loses at most the changes
+# since the last flush.
+#
+# Active sessions are kept in a bounded LRU; a session that falls out of it
+# is read back from the database on its next get(). Dirty sessions are
+# never dropped before they are written.
+#
+# Rows hold savegame records (see savegame.py) next to the layout they were
+# written with, so a story that gained scenes or items still loads older
+# sessions.
+#
+# This module does not import main; callers pass the save layout and a state
+# factory, as for savegame.
+# ---------------------------------------------------------------------------------
+
+import sqlite3
+import time
+from collections import OrderedDict
+
+import savegame
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS layouts (
+    id INTEGER PRIMARY KEY,
+    tables BLOB NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    layout INTEGER NOT NULL REFERENCES layouts (id),
+    record BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+class SessionStore:
+    """
+    Game states by session key (e.g. the player's name), cached in memory
+    and written to `path` in batches.
+    """
+
+    def __init__(self, path, layout, new_state, start=0, cache_size=1024,
+                 flush_size=256, flush_interval=1.0, synchronous="NORMAL"):
+        self.layout = layout
+        self.new_state = new_state
+        self.start = start
+        self.cache_size = cache_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.cache = OrderedDict()
+        self.dirty = {}
+        self.dirty_since = None
+        self.layouts = {}
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "flushes": 0}
+
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode NORMAL survives a crash of the process; FULL also
+        # survives losing power, at the cost of an fsync per transaction.
+        self.db.execute(f"PRAGMA synchronous={synchronous}")
+        self.db.executescript(SCHEMA)
+        self.use_layout(layout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def use_layout(self, layout):
+        """
+        Switches to a new save layout, e.g. after the story was reloaded
+        with more scenes. Sessions written from now on use it.
+        """
+        tables = layout.tables()
+        self.db.execute("INSERT OR IGNORE INTO layouts (tables) VALUES (?)", (tables,))
+        (self.layout_id,) = self.db.execute(
+            "SELECT id FROM layouts WHERE tables = ?", (tables,)).fetchone()
+        self.layouts[self.layout_id] = self.layout = layout
+
+    # Reading.
+
+    def get(self, key):
+        """
+        Returns the session's GameState, or None if there is none.
+        """
+        state = self.cache.get(key)
+        if state is not None:
+            self.cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return state
+        state = self.dirty.get(key)
+        if state is None:
+            self.stats["misses"] += 1
+            state = self._load(key)
+            if state is None:
+                return None
+        self._remember(key, state)
+        return state
+
+    def _load(self, key):
+        row = self.db.execute("SELECT layout, record FROM sessions WHERE key = ?",
+                              (key,)).fetchone()
+        if row is None:
+            return None
+        layout_id, record = row
+        layout = self._layout(layout_id)
+        _, state = savegame.unpack_fields(layout, layout.record.unpack(record), self.new_state)
+        if layout_id != self.layout_id:
+            savegame.migrate(state, layout, self.layout, self.start)
+        return state
+
+    def _layout(self, layout_id):
+        layout = self.layouts.get(layout_id)
+        if layout is None:
+            (tables,) = self.db.execute("SELECT tables FROM layouts WHERE id = ?",
+                                        (layout_id,)).fetchone()
+            layout = self.layouts[layout_id] = savegame.Layout.from_tables(tables)
+        return layout
+
+    def _remember(self, key, state):
+        self.cache[key] = state
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            # A dirty session stays reachable through self.dirty until written
+            self.cache.popitem(last=False)
+
+    # Writing.
+
+    def put(self, key, state):
+        """
+        Records that the session changed. The state is written at the next
+        flush, as it is then.
+        """
+        self._remember(key, state)
+        if not self.dirty:
+            self.dirty_since = time.monotonic()
+        self.dirty[key] = state
+        self.maybe_flush()
+
+    def delete(self, key):
+        """
+        Forgets a session, e.g. once its story has ended.
+        """
+        self.cache.pop(key, None)
+        self.dirty.pop(key, None)
+        self.db.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def maybe_flush(self):
+        """
+        Flushes if enough sessions are dirty or the oldest change is due.
+        Returns the number of sessions written.
+        """
+        if not self.dirty:
+            return 0
+        if (len(self.dirty) >= self.flush_size
+                or time.monotonic() - self.dirty_since >= self.flush_interval):
+            return self.flush()
+        return 0
+
+    def flush(self):
+        """
+        Writes every dirty session in one transaction. Returns the number
+        of sessions written.
+        """
+        if not self.dirty:
+            return 0
+        now = time.time()
+        rows = [(key, self.layout_id, savegame.pack_state(self.layout, state), now)
+                for key, state in self.dirty.items()]
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR REPLACE INTO sessions (key, layout, record, updated) "
+                "VALUES (?, ?, ?, ?)", rows)
+        self.dirty.clear()
+        self.dirty_since = None
+        self.stats["writes"] += len(rows)
+        self.stats["flushes"] += 1
+        return len(rows)
+
+    def close(self):
+        """
+        Flushes and closes the database.
+        """
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
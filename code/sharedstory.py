@@ -0,0 +1,383 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: SHARED-MEMORY SCENE STORE
+# ---------------------------------------------------------------------------------
+# For deployments that run many game worker processes: one loader process
+# packs the compiled story into a multiprocessing.shared_memory segment, and
+# the workers attach to it read-only instead of each building its own copy.
+# A worker reads scene records and slices scene text straight out of the
+# segment through memoryviews, so its memory does not grow with the story.
+#
+# Segment layout (little-endian, sections 8-byte aligned):
+#   header   "<8sHxxIIIII": magic, version, scene count, choice count, start
+#            scene, item table length, string blob length
+#   items    item names joined by "\n", UTF-8, in item bit order
+#   scenes   8 x uint32 per scene: id offset/length, title offset/length,
+#            description offset/length, first choice, choice count
+#   choices  16 x uint32 per choice: target, text offset/length, has effect,
+#            item bits (low, high), morality (two's complement), flags set,
+#            flags cleared, has requirements, requirement mask (low, high),
+#            required bits (low, high), morality range (two's complement)
+#   sorted   uint32 scene numbers ordered by scene id, for id lookups
+#   strings  all ids, titles, descriptions and choice texts, UTF-8
+#
+# This module does not import main (except in run(), the loader).
+#
+# Usage:
+#   python sharedstory.py serve [--story FILE] [--name NAME]
+#       packs the story, prints the segment name and keeps it alive until
+#       interrupted; start workers with ECHO_SHARED_STORY=NAME
+# ---------------------------------------------------------------------------------
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+MAGIC = b"ECHOSHM\0"
+VERSION = 2
+HEADER = struct.Struct("<8sHxxIIIII")
+SCENE_FIELDS = 8
+CHOICE_FIELDS = 16
+MASK32 = 0xFFFFFFFF
+
+class SharedStoryError(ValueError):
+    """
+    Raised for a story that cannot be packed or a segment that is not one.
+    """
+
+def _check_platform():
+    # The tables are read with native memoryview casts
+    if sys.byteorder != "little" or array("I").itemsize != 4:
+        raise SharedStoryError("shared stories need a little-endian platform")
+
+def _align(size):
+    return (size + 7) & ~7
+
+def _signed(value):
+    # uint32 table entry holding a two's complement int32
+    return value - (1 << 32) if value & 0x80000000 else value
+
+# ---------------------------------------------------------------------------------
+# PACKING
+# ---------------------------------------------------------------------------------
+
+def pack(story, item_names):
+    """
+    Packs a compiled story (ids, scenes, start) into the segment layout.
+    Effects with function calls cannot be shared.
+    """
+    _check_platform()
+    strings = bytearray()
+    offsets = {}
+
+    def intern(text):
+        data = text.encode("utf-8")
+        key = offsets.get(data)
+        if key is None:
+            key = offsets[data] = (len(strings), len(data))
+            strings.extend(data)
+        return key
+
+    scene_table = []
+    choice_table = []
+    for scene in story.scenes:
+        first = len(choice_table) // CHOICE_FIELDS
+        scene_table += [*intern(scene.id), *intern(scene.title), *intern(scene.description),
+                        first, len(scene.targets)]
+        guards = scene.guards or [None] * len(scene.targets)
+        for number, (text, target, effect, guard) in enumerate(
+                zip(scene.texts, scene.targets, scene.effects, guards), start=1):
+            if effect is None:
+                effect_fields = [0, 0, 0, 0, 0, 0]
+            elif effect.calls or effect.items >> 64:
+                raise SharedStoryError(
+                    f"Scene {scene.id!r}, choice {number}: effect cannot be shared")
+            else:
+                effect_fields = [1, effect.items & MASK32, effect.items >> 32,
+                                 effect.morality & MASK32, effect.flags_set, effect.flags_clear]
+            if guard is None:
+                guard_fields = [0, 0, 0, 0, 0, 0, 0]
+            elif guard.mask >> 64 or not -(1 << 31) <= guard.low <= guard.high < 1 << 31:
+                raise SharedStoryError(
+                    f"Scene {scene.id!r}, choice {number}: requirement cannot be shared")
+            else:
+                guard_fields = [1, guard.mask & MASK32, guard.mask >> 32, guard.bits & MASK32,
+                                guard.bits >> 32, guard.low & MASK32, guard.high & MASK32]
+            choice_table += [target, *intern(text), *effect_fields, *guard_fields]
+
+    ids = list(story.ids)
+    ordered = sorted(range(len(ids)), key=lambda i: ids[i].encode("utf-8"))
+    items = "\n".join(item_names).encode("utf-8")
+    sections = [
+        items,
+        array("I", scene_table).tobytes(),
+        array("I", choice_table).tobytes(),
+        array("I", ordered).tobytes(),
+        bytes(strings),
+    ]
+    data = bytearray(HEADER.pack(MAGIC, VERSION, len(ids), len(choice_table) // CHOICE_FIELDS,
+                                 story.start, len(items), len(strings)))
+    for section in sections:
+        data += b"\0" * (_align(len(data)) - len(data))
+        data += section
+    return bytes(data)
+
+# ---------------------------------------------------------------------------------
+# SEGMENT
+# ---------------------------------------------------------------------------------
+
+class SharedIds:
+    """
+    Read-only sequence of the scene ids in a segment.
+    """
+
+    def __init__(self, shared):
+        self.shared = shared
+
+    def __len__(self):
+        return self.shared.count
+
+    def __getitem__(self, i):
+        if not -self.shared.count <= i < self.shared.count:
+            raise IndexError(i)
+        return self.shared.scene_id(i % self.shared.count)
+
+    def __iter__(self):
+        return (self.shared.scene_id(i) for i in range(self.shared.count))
+
+    def index(self, scene_id):
+        i = self.shared.find(scene_id)
+        if i is None:
+            raise ValueError(f"{scene_id!r} is not a scene")
+        return i
+
+class SharedIndex:
+    """
+    Read-only mapping from scene id to scene number, by binary search.
+    """
+
+    def __init__(self, shared):
+        self.shared = shared
+
+    def __getitem__(self, scene_id):
+        i = self.shared.find(scene_id)
+        if i is None:
+            raise KeyError(scene_id)
+        return i
+
+    def get(self, scene_id, default=None):
+        i = self.shared.find(scene_id)
+        return default if i is None else i
+
+    def __contains__(self, scene_id):
+        return self.shared.find(scene_id) is not None
+
+    def __len__(self):
+        return self.shared.count
+
+    def __iter__(self):
+        return iter(SharedIds(self.shared))
+
+class SharedStory:
+    """
+    A packed story in a shared memory segment. create() makes and owns the
+    segment; attach() maps an existing one read-only.
+    """
+
+    def __init__(self, buffer, name, owner=None, mapping=None):
+        self.name = name
+        self._owner = owner
+        self._mapping = mapping
+        _check_platform()
+        self.buffer = memoryview(buffer).toreadonly()
+        try:
+            (magic, version, self.count, self.choice_count, self.start, items_length,
+             strings_length) = HEADER.unpack_from(self.buffer)
+        except struct.error:
+            magic = version = None
+        if (magic, version) != (MAGIC, VERSION):
+            self.buffer.release()
+            raise SharedStoryError(f"{name}: not a shared story segment")
+
+        position = HEADER.size
+        self.item_names = tuple(bytes(self.buffer[position:position + items_length])
+                                .decode("utf-8").split("\n")) if items_length else ()
+        position += items_length
+        sections = []
+        for length in (self.count * SCENE_FIELDS * 4, self.choice_count * CHOICE_FIELDS * 4,
+                       self.count * 4, strings_length):
+            position = _align(position)
+            sections.append(self.buffer[position:position + length])
+            position += length
+        self.scene_table = sections[0].cast("I")
+        self.choice_table = sections[1].cast("I")
+        self.sorted = sections[2].cast("I")
+        self.strings = sections[3]
+        self.ids = SharedIds(self)
+        self.index = SharedIndex(self)
+
+    @classmethod
+    def create(cls, data, name=None):
+        """
+        Copies packed data into a new segment owned by this process.
+        """
+        segment = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+        segment.buf[:len(data)] = data
+        return cls(segment.buf[:len(data)], segment.name, owner=segment)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Maps an existing segment read-only. The attaching process never
+        unlinks it.
+        """
+        path = os.path.join("/dev/shm", name.lstrip("/"))
+        if os.path.exists(path):
+            # Map the file read-only directly; SharedMemory always maps
+            # read-write and registers the segment for cleanup at exit.
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                mapping = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+            return cls(mapping, name, mapping=mapping)
+        segment = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(segment._name, "shared_memory")
+        except (AttributeError, KeyError):
+            pass
+        return cls(segment.buf, name, mapping=segment)
+
+    def __reduce__(self):
+        # Other processes attach by name
+        return (SharedStory.attach, (self.name,))
+
+    # Zero-copy access.
+
+    def text(self, offset, length):
+        """
+        Returns a memoryview of UTF-8 text in the segment (no copy).
+        """
+        return self.strings[offset:offset + length]
+
+    def scene_id(self, i):
+        base = i * SCENE_FIELDS
+        return str(self.text(self.scene_table[base], self.scene_table[base + 1]), "utf-8")
+
+    def find(self, scene_id):
+        """
+        Returns the number of the scene with this id, or None.
+        """
+        key = scene_id.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            i = self.sorted[middle]
+            base = i * SCENE_FIELDS
+            candidate = self.text(self.scene_table[base], self.scene_table[base + 1])
+            if candidate == key:
+                return i
+            if bytes(candidate) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def scene_views(self, i):
+        """
+        Returns (id, title, description) of scene `i` as memoryviews.
+        """
+        base = i * SCENE_FIELDS
+        table = self.scene_table
+        return (self.text(table[base], table[base + 1]),
+                self.text(table[base + 2], table[base + 3]),
+                self.text(table[base + 4], table[base + 5]))
+
+    def scene(self, i):
+        """
+        Decodes scene `i`: (id, title, description, choice texts, targets,
+        effects, guards), each effect None or (items, morality, flags_set,
+        flags_clear). guards is None if no choice has requirements, else one
+        (mask, bits, low, high) per choice, None for a choice without
+        requirements.
+        """
+        scene_id, title, description = (str(view, "utf-8") for view in self.scene_views(i))
+        base = i * SCENE_FIELDS
+        first, count = self.scene_table[base + 6], self.scene_table[base + 7]
+        table = self.choice_table
+        texts, targets, effects, guards = [], [], [], []
+        for choice in range(first, first + count):
+            at = choice * CHOICE_FIELDS
+            targets.append(table[at])
+            texts.append(str(self.text(table[at + 1], table[at + 2]), "utf-8"))
+            if table[at + 3]:
+                effects.append((table[at + 4] | table[at + 5] << 32, _signed(table[at + 6]),
+                                table[at + 7], table[at + 8]))
+            else:
+                effects.append(None)
+            if table[at + 9]:
+                guards.append((table[at + 10] | table[at + 11] << 32,
+                               table[at + 12] | table[at + 13] << 32,
+                               _signed(table[at + 14]), _signed(table[at + 15])))
+            else:
+                guards.append(None)
+        if not any(guards):
+            guards = None
+        return (scene_id, title, description, tuple(texts), tuple(targets), tuple(effects),
+                guards)
+
+    def close(self):
+        """
+        Releases this process's views and mapping.
+        """
+        for view in (self.scene_table, self.choice_table, self.sorted, self.strings,
+                     self.buffer):
+            view.release()
+        if self._mapping is not None:
+            self._mapping.close()
+        if self._owner is not None:
+            self._owner.close()
+
+    def unlink(self):
+        """
+        Removes the segment (owner only). Attached workers keep their mapping.
+        """
+        if self._owner is not None:
+            self._owner.unlink()
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+def run():
+    """
+    Command-line entry point: the loader process.
+    """
+    parser = argparse.ArgumentParser(description="Share a compiled story between processes")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--story", help="story data file (default: the built-in story)")
+    parser.add_argument("--name", help="segment name (default: generated)")
+    args = parser.parse_args()
+
+    import main
+    story = main.load_story(args.story) if args.story else main.STORY
+    shared = SharedStory.create(pack(story, main.ITEM_NAMES), args.name)
+    print(f"Shared {len(story.ids)} scenes in segment {shared.name} "
+          f"({shared.buffer.nbytes:,} bytes)")
+    print(f"Start workers with ECHO_SHARED_STORY={shared.name}; Ctrl-C to stop.", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shared.close()
+        shared.unlink()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,320 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: MONTE CARLO PLAYTHROUGH SIMULATOR
+# ---------------------------------------------------------------------------------
+# Plays a large batch of simulated players ("walkers") through the compiled
+# story at once, for balancing. The story graph and its folded effects are
+# turned into NumPy arrays indexed by (scene, choice), and every step advances
+# all unfinished walkers with a handful of array operations.
+#
+# Each walker tracks its scene, morality, story flags and items as arrays; the
+# report holds histograms of endings, path lengths, morality and item counts.
+# Choices with requirements are offered only to walkers that meet them,
+# tested for all walkers at once from the compiled Guards' masks and bounds.
+#
+# Requires NumPy (pip install numpy); the game itself does not.
+#
+# Usage:
+#   python simulate.py [--walkers 1000000] [--policy random|weighted]
+#                      [--weights weights.json] [--max-steps 1000] [--seed 9]
+#
+# weights.json maps scene IDs to one weight per choice, e.g.
+#   {"BAY_INTRO": [1, 3]}
+# Scenes that are not listed pick uniformly.
+# ---------------------------------------------------------------------------------
+
+import argparse
+import json
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise SystemExit("simulate.py needs NumPy: pip install numpy")
+
+import main
+
+# ---------------------------------------------------------------------------------
+# TRANSITION TABLES
+# ---------------------------------------------------------------------------------
+
+class Tables:
+    """
+    The story as (scene, choice) arrays. Rows are padded to the widest scene.
+    """
+
+    def __init__(self, story, weights=None):
+        scene_count = len(story.scenes)
+        width = max(1, max(len(scene.targets) for scene in story.scenes))
+
+        self.ids = story.ids
+        self.start = story.start
+        self.width = width
+        self.choice_count = np.zeros(scene_count, dtype=np.int64)
+        self.targets = np.zeros((scene_count, width), dtype=np.int64)
+        self.morality = np.zeros((scene_count, width), dtype=np.int64)
+        self.items = np.zeros((scene_count, width), dtype=np.uint64)
+        self.flags_set = np.zeros((scene_count, width), dtype=np.uint64)
+        self.flags_keep = np.full((scene_count, width), ~np.uint64(0), dtype=np.uint64)
+        # Cumulative choice probabilities; a walker picks the first column
+        # whose value exceeds its random draw.
+        self.cumulative = np.ones((scene_count, width), dtype=np.float64)
+        # Choice weights and requirements, used when some choice has
+        # requirements: the weights of the choices a walker is offered are
+        # renormalized per walker.
+        self.weight = np.zeros((scene_count, width), dtype=np.float64)
+        self.has_guards = np.array([scene.guards is not None for scene in story.scenes])
+        self.guarded = bool(self.has_guards.any())
+        self.guard_mask = np.zeros((scene_count, width), dtype=np.uint64)
+        self.guard_bits = np.zeros((scene_count, width), dtype=np.uint64)
+        self.low = np.full((scene_count, width), main.MORALITY_MIN, dtype=np.int64)
+        self.high = np.full((scene_count, width), main.MORALITY_MAX, dtype=np.int64)
+
+        for s, scene in enumerate(story.scenes):
+            count = len(scene.targets)
+            self.choice_count[s] = count
+            self.targets[s, :] = s
+            for c, (target, effect) in enumerate(zip(scene.targets, scene.effects)):
+                self.targets[s, c] = target
+                if effect is None:
+                    continue
+                if effect.calls:
+                    raise main.StoryError(
+                        f"Scene {scene.id!r}, choice {c + 1}: legacy effect functions "
+                        "cannot be simulated; use effect ops"
+                    )
+                if max(effect.items, effect.flags_set, effect.flags_clear) >> 64:
+                    raise main.StoryError("The simulator supports at most 64 items and flags")
+                self.morality[s, c] = effect.morality
+                self.items[s, c] = effect.items
+                self.flags_set[s, c] = effect.flags_set
+                self.flags_keep[s, c] = ~np.uint64(effect.flags_clear)
+            for c, guard in enumerate(scene.guards or ()):
+                if guard.mask >> 64:
+                    raise main.StoryError("The simulator supports at most 64 items and flags")
+                self.guard_mask[s, c] = guard.mask
+                self.guard_bits[s, c] = guard.bits
+                self.low[s, c] = guard.low
+                self.high[s, c] = guard.high
+            if count:
+                row = np.ones(count, dtype=np.float64)
+                if weights and scene.id in weights:
+                    row = np.asarray(weights[scene.id], dtype=np.float64)
+                    if row.shape != (count,) or row.sum() <= 0 or (row < 0).any():
+                        raise ValueError(f"Bad weights for {scene.id}: expected {count} non-negative values")
+                self.cumulative[s, :count] = np.cumsum(row) / row.sum()
+                self.cumulative[s, count - 1] = 1.0
+                self.weight[s, :count] = row / row.sum()
+
+        self.terminal = self.choice_count == 0
+        # Scenes that count as an ending: named ENDING_* or without choices.
+        ending = np.array([scene_id.startswith("ENDING_") for scene_id in story.ids])
+        self.ending = ending | self.terminal
+
+    def offered(self, scenes, morality, flags, items):
+        """
+        (walkers, width) mask of the choices offered to each walker.
+        """
+        key = flags | items << np.uint64(main.FLAG_SHIFT)
+        return ((np.arange(self.width) < self.choice_count[scenes][:, None])
+                & ((key[:, None] & self.guard_mask[scenes]) == self.guard_bits[scenes])
+                & (self.low[scenes] <= morality[:, None])
+                & (morality[:, None] <= self.high[scenes]))
+
+    def pick(self, scenes, morality, flags, items, draw):
+        """
+        The choice each walker takes given its random draw in [0, 1), by
+        the weights of the choices it is offered, or uniformly among them if
+        they all have weight 0.
+        """
+        offered = self.offered(scenes, morality, flags, items)
+        weight = self.weight[scenes] * offered
+        unweighted = ~weight.any(axis=1)
+        weight[unweighted] = offered[unweighted]
+        cumulative = np.cumsum(weight, axis=1)
+        choice = (cumulative <= (draw * cumulative[:, -1])[:, None]).sum(axis=1)
+        return np.minimum(choice, self.width - 1)
+
+# ---------------------------------------------------------------------------------
+# SIMULATION
+# ---------------------------------------------------------------------------------
+
+def popcount(values):
+    """
+    Number of set bits in each uint64.
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values).astype(np.int64)
+    counts = np.zeros(values.shape, dtype=np.int64)
+    for bit in range(64):
+        counts += ((values >> np.uint64(bit)) & np.uint64(1)).astype(np.int64)
+    return counts
+
+def simulate(walkers=1000000, policy="random", weights=None, max_steps=1000,
+             seed=9, story=None):
+    """
+    Runs `walkers` simulated players from the start scene until they reach a
+    scene without choices or `max_steps` choices. Returns a report dict.
+    """
+    story = story or main.STORY
+    tables = Tables(story, weights if policy == "weighted" else None)
+    rng = np.random.default_rng(seed)
+
+    # Flattened (scene * width + choice) views make each lookup a 1-D take.
+    width = tables.width
+    targets = tables.targets.ravel()
+    morality_delta = tables.morality.ravel()
+    items_add = tables.items.ravel()
+    flags_set = tables.flags_set.ravel()
+    flags_keep = tables.flags_keep.ravel()
+    choice_count = tables.choice_count.astype(np.float32)
+
+    # Final per-walker results.
+    final = {
+        "scene": np.full(walkers, tables.start, dtype=np.int64),
+        "morality": np.zeros(walkers, dtype=np.int64),
+        "flags": np.zeros(walkers, dtype=np.uint64),
+        "items": np.zeros(walkers, dtype=np.uint64),
+        "steps": np.zeros(walkers, dtype=np.int64),
+        "ending": np.full(walkers, -1, dtype=np.int64),
+    }
+
+    # Working arrays hold only walkers that were unfinished at the last
+    # compaction. Finished walkers sit on a scene without choices, whose
+    # padded row points back at itself with no effects, so stepping them is
+    # harmless; they are dropped once enough of them pile up.
+    ids = np.flatnonzero(~tables.terminal[final["scene"]])
+    work = {key: values[ids] for key, values in final.items()}
+    walker_steps = 0
+    started = time.perf_counter()
+    for _ in range(max_steps):
+        if ids.size == 0:
+            break
+        current = work["scene"]
+        draw = rng.random(ids.size, dtype=np.float32)
+        if policy == "weighted":
+            choice = (draw[:, None] >= tables.cumulative[current]).sum(axis=1)
+        else:
+            choice = (draw * choice_count[current]).astype(np.int64)
+            np.minimum(choice, width - 1, out=choice)
+        if tables.guarded:
+            # Walkers on scenes with requirements pick again among the
+            # choices they are offered
+            at = np.flatnonzero(tables.has_guards[current])
+            if at.size:
+                choice[at] = tables.pick(current[at], work["morality"][at], work["flags"][at],
+                                         work["items"][at], draw[at])
+        flat = current * width + choice
+
+        live = ~tables.terminal[current]
+        target = targets[flat]
+        work["scene"] = target
+        work["morality"] += morality_delta[flat]
+        work["items"] |= items_add[flat]
+        work["flags"] = (work["flags"] & flags_keep[flat]) | flags_set[flat]
+        work["steps"] += live
+        walker_steps += int(np.count_nonzero(live))
+
+        reached = tables.ending[target] & (work["ending"] < 0)
+        work["ending"][reached] = target[reached]
+
+        finished = tables.terminal[target]
+        if np.count_nonzero(finished) * 4 >= ids.size:
+            for key, values in work.items():
+                final[key][ids] = values
+            keep = ~finished
+            ids = ids[keep]
+            work = {key: values[keep] for key, values in work.items()}
+    elapsed = time.perf_counter() - started
+
+    for key, values in work.items():
+        final[key][ids] = values
+    unfinished = int(np.count_nonzero(~tables.terminal[final["scene"]]))
+
+    return build_report(tables, walkers, final["ending"], final["steps"],
+                        final["morality"], final["flags"], final["items"],
+                        walker_steps, elapsed, unfinished)
+
+def histogram(values):
+    """
+    {value: count} for an integer array, in value order.
+    """
+    keys, counts = np.unique(values, return_counts=True)
+    return {int(k): int(c) for k, c in zip(keys, counts)}
+
+def build_report(tables, walkers, ending, steps, morality, flags, items,
+                 walker_steps, elapsed, unfinished):
+    """
+    Summarizes the walker arrays.
+    """
+    endings = {}
+    for index, count in histogram(ending).items():
+        label = "none" if index < 0 else tables.ids[index]
+        endings[label] = count
+    flag_counts = {
+        name: int(((flags & np.uint64(bit)) != 0).sum())
+        for name, bit in main.FLAG_BITS.items()
+    }
+    return {
+        "walkers": walkers,
+        "unfinished": int(unfinished),
+        "walker_steps": int(walker_steps),
+        "seconds": round(elapsed, 3),
+        "walker_steps_per_sec": int(walker_steps / elapsed) if elapsed else None,
+        "endings": endings,
+        "path_lengths": histogram(steps),
+        "morality": histogram(morality),
+        "item_counts": histogram(popcount(items)),
+        "flags": flag_counts,
+    }
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+def print_histogram(title, counts, total):
+    print(f"\n{title}:")
+    for key, count in counts.items():
+        bar = "#" * max(1, round(40 * count / total)) if count else ""
+        print(f"  {key!s:>16} {count:>10} {bar}")
+
+def run():
+    """
+    Command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Monte Carlo playthrough simulator")
+    parser.add_argument("--walkers", type=int, default=1000000)
+    parser.add_argument("--policy", choices=("random", "weighted"), default="random")
+    parser.add_argument("--weights", help="JSON file of per-scene choice weights")
+    parser.add_argument("--max-steps", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=9)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    weights = None
+    if args.weights:
+        with open(args.weights, encoding="utf-8") as handle:
+            weights = json.load(handle)
+    policy = "weighted" if weights else args.policy
+
+    report = simulate(args.walkers, policy, weights, args.max_steps, args.seed)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{report['walkers']:,} walkers, {report['walker_steps']:,} walker-steps "
+          f"in {report['seconds']} s ({report['walker_steps_per_sec']:,}/s)")
+    if report["unfinished"]:
+        print(f"{report['unfinished']:,} walkers hit --max-steps before finishing")
+    print_histogram("Endings", report["endings"], report["walkers"])
+    print_histogram("Path length (choices)", report["path_lengths"], report["walkers"])
+    print_histogram("Morality", report["morality"], report["walkers"])
+    print_histogram("Items held", report["item_counts"], report["walkers"])
+    print("\nFlags set at the end:")
+    for name, count in report["flags"].items():
+        print(f"  {name:>16} {count:>10}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,448 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: STORY DATA FILES
+# ---------------------------------------------------------------------------------
+# Stories live in JSON Lines files next to the game (stories/echo9.jsonl is the
+# built-in ECHO-9 story). The first line is a header, every other line is one
+# scene in the same shape as a SCENES entry, with effect and requirement ops
+# as lists ("requires" is optional):
+#
+#   {"story": "ECHO-9", "start": "INTRO"}
+#   {"id": "INTRO", "title": "...", "description": "...",
+#    "choices": [{"text": "...", "next_scene": "BAY_INTRO", "effects": [],
+#                 "requires": [["has_item", "ElanLogs"]]}]}
+#
+# Opening a story does not parse any scene. The data file is memory-mapped and
+# a compact index sidecar (<file>.idx) gives the byte offset of every scene,
+# the scene ids and the item names the story uses, so a scene is decoded only
+# when it is first needed. The index is rebuilt (and every reference checked)
+# whenever the data file's size or modification time no longer match it.
+#
+# refresh() re-reads a file that was edited while the game runs. It compares
+# the old and new bytes in large blocks and carries unchanged runs of scene
+# lines over from the old index; only lines inside edited regions are parsed
+# and checked, so the work that grows with the story is a memory comparison
+# and the rest grows with the size of the edit. The index keeps a checksum of
+# every scene line to recognise lines that survived an edit next to them.
+#
+# Index layout (little-endian):
+#   header   "<8sHIIIQq": magic, version, scene count, start scene, item
+#            table length, data file size, data file mtime in ns
+#   offsets  (count + 1) x uint64, one per scene plus the end of the last one
+#   keys     count x uint64, line_key() of every scene line
+#   ids      scene ids joined by "\n", UTF-8
+#   items    item names joined by "\n", UTF-8 (length from the header)
+#
+# This module does not import main.
+#
+# Usage:
+#   python storyfile.py index stories/echo9.jsonl
+#
+# Edit data files by writing a new file and renaming it over the old one: a
+# game that has the file mapped may crash if it is truncated in place.
+# ---------------------------------------------------------------------------------
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+
+INDEX_MAGIC = b"ECHOIDX\0"
+INDEX_VERSION = 2
+INDEX_HEADER = struct.Struct("<8sHIIIQq")
+
+class StoryError(ValueError):
+    """
+    Raised for a malformed story file or a reference to a missing scene.
+    """
+
+def index_path(path):
+    return path + ".idx"
+
+def line_key(line):
+    """
+    64-bit checksum of a scene line (surrounding whitespace ignored).
+    """
+    line = line.strip()
+    return zlib.crc32(line) << 32 | zlib.adler32(line)
+
+def scene_items(scene):
+    """
+    Item names added or required by a scene's choices, in order.
+    """
+    return [op[1] for choice in scene["choices"]
+            for op in [*(choice.get("effects") or ()), *(choice.get("requires") or ())]
+            if op[0] in ("add_item", "has_item")]
+
+# ---------------------------------------------------------------------------------
+# WRITING
+# ---------------------------------------------------------------------------------
+
+def write_story(scenes, path, start, title=""):
+    """
+    Writes a SCENES-style dict as a story data file. Effects must be op
+    lists; callables cannot be stored.
+    """
+    with open(path + ".tmp", "w", encoding="utf-8") as handle:
+        handle.write(json.dumps({"story": title, "start": start}, ensure_ascii=False) + "\n")
+        for scene_id, scene in scenes.items():
+            for number, choice in enumerate(scene["choices"], start=1):
+                effects = choice.get("effects") or ()
+                if callable(effects) or any(callable(op) for op in effects):
+                    raise StoryError(
+                        f"Scene {scene_id!r}, choice {number}: function effects cannot be stored")
+            line = {"id": scene_id, "title": scene["title"],
+                    "description": scene["description"], "choices": scene["choices"]}
+            handle.write(json.dumps(line, ensure_ascii=False) + "\n")
+    os.replace(path + ".tmp", path)
+    build_index(path)
+
+# ---------------------------------------------------------------------------------
+# INDEX
+# ---------------------------------------------------------------------------------
+
+def build_index(path, write=True):
+    """
+    Scans a data file, checks every next_scene reference and returns the
+    index bytes. Also writes them to the sidecar when `write` is set and
+    the directory is writable.
+    """
+    stat = os.stat(path)
+    offsets = array("Q")
+    keys = array("Q")
+    ids = []
+    items = {}
+    targets = []
+    with open(path, "rb") as handle:
+        header = json.loads(handle.readline())
+        position = handle.tell()
+        for line in handle:
+            if line.strip():
+                scene = json.loads(line)
+                offsets.append(position)
+                keys.append(line_key(line))
+                ids.append(scene["id"])
+                targets += [(scene["id"], number, choice["next_scene"])
+                            for number, choice in enumerate(scene["choices"], start=1)]
+                items.update(dict.fromkeys(scene_items(scene)))
+            position += len(line)
+        offsets.append(position)
+
+    index = check_ids(path, header, ids)
+    check_targets(targets, index)
+    return pack_index(path, stat, index[header["start"]], offsets, keys, ids, items, write)
+
+def check_ids(path, header, ids):
+    """
+    Returns the id -> scene number mapping, rejecting duplicate ids and a
+    missing start scene.
+    """
+    index = {scene_id: i for i, scene_id in enumerate(ids)}
+    if len(index) != len(ids):
+        raise StoryError(f"{path}: duplicate scene ids")
+    if header.get("start") not in index:
+        raise StoryError(f"{path}: start scene {header.get('start')!r} is not defined")
+    return index
+
+def check_targets(targets, index):
+    for scene_id, number, target in targets:
+        if target not in index:
+            raise StoryError(
+                f"Scene {scene_id!r}, choice {number}: unknown next_scene {target!r}")
+
+def pack_index(path, stat, start, offsets, keys, ids, items, write=True):
+    """
+    Returns the index bytes and, when `write` is set and the directory is
+    writable, stores them in the sidecar.
+    """
+    item_blob = "\n".join(items).encode("utf-8")
+    data = b"".join((
+        INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(ids), start,
+                          len(item_blob), stat.st_size, stat.st_mtime_ns),
+        offsets.tobytes(),
+        keys.tobytes(),
+        "\n".join(ids).encode("utf-8"),
+        item_blob,
+    ))
+    if write:
+        try:
+            with open(index_path(path) + ".tmp", "wb") as handle:
+                handle.write(data)
+            os.replace(index_path(path) + ".tmp", index_path(path))
+        except OSError:
+            pass  # read-only install: keep the index in memory only
+    return data
+
+def read_index(path):
+    """
+    Returns the index bytes for a data file, rebuilding a missing or stale
+    sidecar.
+    """
+    stat = os.stat(path)
+    try:
+        with open(index_path(path), "rb") as handle:
+            data = handle.read()
+        magic, version, _, _, _, size, mtime = INDEX_HEADER.unpack_from(data)
+        if (magic, version, size, mtime) == (INDEX_MAGIC, INDEX_VERSION,
+                                             stat.st_size, stat.st_mtime_ns):
+            return data
+    except (OSError, struct.error):
+        pass
+    return build_index(path)
+
+# ---------------------------------------------------------------------------------
+# READING
+# ---------------------------------------------------------------------------------
+
+class StoryFile:
+    """
+    An open story data file: ids, start scene and item names from the index,
+    scene bodies decoded on request from the memory-mapped data.
+    """
+
+    def __init__(self, path, index=None):
+        self.path = path
+        data = read_index(path) if index is None else index
+        (_, _, count, self.start, item_length, self.size,
+         self.mtime) = INDEX_HEADER.unpack_from(data)
+        table = INDEX_HEADER.size + (count + 1) * 8
+        self.offsets = memoryview(data)[INDEX_HEADER.size:table].cast("Q")
+        self.keys = memoryview(data)[table:table + count * 8].cast("Q")
+        names = data[table + count * 8:len(data) - item_length].decode("utf-8")
+        self.ids = tuple(names.split("\n")) if count else ()
+        items = data[len(data) - item_length:].decode("utf-8")
+        self.items = tuple(items.split("\n")) if item_length else ()
+        with open(path, "rb") as handle:
+            self.data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scene(self, i):
+        """
+        Decodes scene number `i` as a SCENES-style dict (effect and
+        requirement ops as tuples).
+        """
+        scene = json.loads(self.data[self.offsets[i]:self.offsets[i + 1]])
+        for choice in scene["choices"]:
+            choice["effects"] = [tuple(op) for op in choice.get("effects") or ()]
+            if "requires" in choice:
+                choice["requires"] = [tuple(op) for op in choice["requires"]]
+        return scene
+
+    def numbers(self):
+        """
+        Mapping from line key to scene number.
+        """
+        return dict(zip(self.keys, range(len(self.ids))))
+
+    def changed(self):
+        """
+        True when the data file on disk is no longer the one indexed.
+        """
+        stat = os.stat(self.path)
+        return (stat.st_size, stat.st_mtime_ns) != (self.size, self.mtime)
+
+    def close(self):
+        self.offsets.release()
+        self.keys.release()
+        self.data.close()
+
+# How far refresh() looks ahead in the old file for a line it has just read
+# before counting the line as new, and how many new lines in a row may miss
+# before it looks lines up by key across the whole old file instead.
+LOOKAHEAD = 8
+MISSES_BEFORE_LOOKUP = 64
+
+def common_length(old, a, new, b):
+    """
+    Length of the run of equal bytes starting at old[a] and new[b], found by
+    comparing blocks of doubling size and then halving into the first
+    difference.
+    """
+    limit = min(len(old) - a, len(new) - b)
+    length = 0
+    step = 4096
+    while length < limit:
+        step = min(step, limit - length)
+        if old[a + length:a + length + step] == new[b + length:b + length + step]:
+            length += step
+            step = min(step * 2, 1 << 20)
+            continue
+        while step > 1:
+            half = step // 2
+            if old[a + length:a + length + half] == new[b + length:b + length + half]:
+                length += half
+                step -= half
+            else:
+                step = half
+        return length
+    return length
+
+def refresh(old, index=None):
+    """
+    Re-reads the data file `old` was opened from after it was replaced with
+    an edited copy. The two files are compared byte for byte; runs of
+    unchanged scene lines are carried over from the old index without being
+    read line by line, and only lines inside edited regions are parsed and
+    checked. `index` is any container of the ids in `old` (built if not
+    given).
+
+    Returns (new StoryFile, {scene number: scene dict} for every parsed
+    line, ids of the old lines that are gone). Raises StoryError, leaving
+    `old` open and usable, if the new file is inconsistent.
+    """
+    path = old.path
+    with open(path, "rb") as handle:
+        stat = os.fstat(handle.fileno())
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _refresh(old, index, path, stat, data)
+    finally:
+        data.close()
+
+def _refresh(old, index, path, stat, data):
+    header_end = data.find(b"\n") + 1 or len(data)
+    header = json.loads(data[:header_end])
+    count = len(old.ids)
+    offsets, keys, ids = array("Q"), array("Q"), []
+    decoded = {}
+    dropped = []
+    numbers = None
+    misses = 0
+
+    i = 0
+    old_at, new_at = old.offsets[0], header_end
+    while True:
+        # Carry over the old lines that lie wholly inside a run of equal bytes
+        run = common_length(old.data, old_at, data, new_at)
+        end = bisect_right(old.offsets, old_at + run) - 1 if old_at + run < old.offsets[count] \
+            else count
+        if end > i:
+            shift = new_at - old_at
+            if shift:
+                offsets.extend(offset + shift for offset in old.offsets[i:end])
+            else:
+                offsets.frombytes(old.offsets[i:end].cast("B"))
+            keys.frombytes(old.keys[i:end].cast("B"))
+            ids.extend(old.ids[i:end])
+            new_at += old.offsets[end] - old_at
+            old_at = old.offsets[end]
+            i = end
+        if new_at >= len(data):
+            break
+
+        # Read the next new line and find it among the old lines ahead
+        line_end = data.find(b"\n", new_at)
+        line_end = len(data) if line_end < 0 else line_end + 1
+        line = data[new_at:line_end]
+        if not line.strip():
+            new_at = line_end
+            continue
+        key = line_key(line)
+        match = next((j for j in range(i, min(i + LOOKAHEAD, count)) if old.keys[j] == key),
+                     None)
+        if match is None and misses >= MISSES_BEFORE_LOOKUP:
+            numbers = numbers or old.numbers()
+            match = numbers.get(key)
+            if match is not None and match < i:
+                match = None
+        offsets.append(new_at)
+        keys.append(key)
+        if match is None:
+            misses += 1
+            scene = decoded[len(ids)] = json.loads(line)
+            ids.append(scene["id"])
+        else:
+            misses = 0
+            dropped += old.ids[i:match]
+            ids.append(old.ids[match])
+            i = match + 1
+            old_at = old.offsets[i]
+        new_at = line_end
+    dropped += old.ids[i:]
+    offsets.append(len(data))
+
+    # Check the parsed lines and whatever could have been broken by removals
+    index = set(old.ids) if index is None else index
+    gone = set(dropped)
+    added = {}
+    for scene in decoded.values():
+        if scene["id"] in added or (scene["id"] in index and scene["id"] not in gone):
+            raise StoryError(f"{path}: duplicate scene id {scene['id']!r}")
+        added[scene["id"]] = True
+
+    def defined(scene_id):
+        return scene_id in added or (scene_id in index and scene_id not in gone)
+
+    if not defined(header.get("start")):
+        raise StoryError(f"{path}: start scene {header.get('start')!r} is not defined")
+    targets = [(scene["id"], number, choice["next_scene"]) for scene in decoded.values()
+               for number, choice in enumerate(scene["choices"], start=1)]
+    # An unchanged line can still point at a scene that was removed. Only
+    # lines that mention a removed id by name need to be parsed to find out.
+    for scene_id in gone.difference(added):
+        needle = json.dumps(scene_id, ensure_ascii=False).encode("utf-8")
+        at = data.find(needle, header_end)
+        while at >= 0:
+            number = bisect_right(offsets, at) - 1
+            if number not in decoded:
+                scene = json.loads(data[offsets[number]:offsets[number + 1]])
+                targets += [(scene["id"], choice_number, choice["next_scene"])
+                            for choice_number, choice in enumerate(scene["choices"], start=1)]
+            at = data.find(needle, offsets[number + 1])
+    for scene_id, number, target in targets:
+        if not defined(target):
+            raise StoryError(
+                f"Scene {scene_id!r}, choice {number}: unknown next_scene {target!r}")
+
+    items = dict.fromkeys(old.items)
+    for scene in decoded.values():
+        items.update(dict.fromkeys(scene_items(scene)))
+    start = ids.index(header["start"])
+    story = StoryFile(path, pack_index(path, stat, start, offsets, keys, ids, items))
+    return story, decoded, dropped
+
+def read_scenes(path):
+    """
+    Reads a whole story data file into a SCENES-style dict, plus the id of
+    its start scene.
+    """
+    story = StoryFile(path)
+    try:
+        scenes = {}
+        for i, scene_id in enumerate(story.ids):
+            scene = story.scene(i)
+            del scene["id"]
+            scenes[scene_id] = scene
+        return scenes, story.ids[story.start]
+    finally:
+        story.close()
+
+# ---------------------------------------------------------------------------------
+# ENTRY POINT
+# ---------------------------------------------------------------------------------
+
+def run():
+    """
+    Command-line entry point: rebuild and check a story's index.
+    """
+    parser = argparse.ArgumentParser(description="Story data file tools")
+    parser.add_argument("command", choices=["index"])
+    parser.add_argument("path", help="story data file (.jsonl)")
+    args = parser.parse_args()
+
+    try:
+        build_index(args.path)
+        story = StoryFile(args.path)
+    except StoryError as error:
+        raise SystemExit(f"{args.path}: {error}")
+    print(f"{args.path}: {len(story)} scenes, {len(story.items)} items, "
+          f"start {story.ids[story.start]}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,494 @@
+
+# ---------------------------------------------------------------------------------
+# ECHOES OF THE SIGNAL: TERMINAL DRIVER
+# ---------------------------------------------------------------------------------
+# Draws the game with ANSI escape sequences written straight into the output
+# buffer, instead of running the system's `clear` command for every scene.
+#
+# A new scene starts from an erased screen (the cursor goes home and
+# everything below it is erased, which is cheaper than a full clear and keeps
+# the scrollback). The driver is double-buffered for frames that redraw the
+# text already on screen (begin(same=True)): it remembers the lines currently
+# on screen (the front buffer) and, while the frame is written, compares each
+# piece of text with what is already at that position. Unchanged text is
+# skipped, only differing text is written (the cursor is moved there with
+# CUP), the rest of an old line is erased as soon as differing text is
+# written over it, and rows below the new frame are cleared. Re-prompting
+# after invalid input or a command redraws just the prompt region.
+#
+# When the text would wrap or scroll, row positions can no longer be trusted:
+# the rest of the frame is written plainly and the next frame starts with a
+# full clear. Output that is not a terminal (pipes, files, TERM=dumb) gets the
+# text only, with no screen control at all.
+#
+# Keyboard reads keystrokes while text is still being typed out: the terminal
+# is put in cbreak mode (no line buffering, no echo) for the session, keys are
+# collected without blocking between animation frames, and the first one
+# makes the rest of the scene appear at once. Whatever was typed ahead starts
+# the next input line, so a choice number pressed during the animation is
+# taken as soon as the scene is drawn. While the player has not pressed a key
+# at a prompt, the caller can have small pieces of work done (main.py uses it
+# to prepare the next scenes). When stdin or stdout is not a terminal it falls
+# back to input().
+#
+# This module does not import main.
+# ---------------------------------------------------------------------------------
+
+import codecs
+import os
+import shutil
+import sys
+import time
+
+try:
+    import select
+    import termios
+except ImportError:  # Windows
+    termios = None
+    import msvcrt
+
+CLEAR = "\x1b[H\x1b[2J\x1b[3J"
+ERASE_LINE = "\x1b[K"
+ERASE_BELOW = "\x1b[J"
+
+def move(row, col):
+    """
+    Cursor position sequence for a 0-based row and column.
+    """
+    return f"\x1b[{row + 1};{col + 1}H"
+
+_VT_ENABLED = None
+
+def enable_vt():
+    """
+    Makes sure the console understands escape sequences. Always true on
+    POSIX; on Windows, turns on virtual terminal processing once.
+    """
+    global _VT_ENABLED
+    if _VT_ENABLED is None:
+        _VT_ENABLED = True
+        if os.name == "nt":
+            try:
+                import ctypes
+                kernel32 = ctypes.windll.kernel32
+                handle = kernel32.GetStdHandle(-11)
+                mode = ctypes.c_uint32()
+                _VT_ENABLED = bool(kernel32.GetConsoleMode(handle, ctypes.byref(mode))
+                                   and kernel32.SetConsoleMode(handle, mode.value | 0x0004))
+            except (AttributeError, OSError):
+                _VT_ENABLED = False
+    return _VT_ENABLED
+
+class Screen:
+    """
+    File-like writer that keeps the terminal in sync with a front buffer.
+    Use begin() to start a frame, write() for its text, prompt() to read
+    input below it and end() before handing the terminal back.
+    """
+
+    def __init__(self, out=None):
+        self._out = out
+        self.active = False     # output is a terminal we control
+        self.tracking = False   # the front buffer matches the screen
+        self.plain = False      # rest of this frame is written without diffing
+        self.front = []
+        self.back = []
+        self.row = self.col = 0
+        self.cursor = None
+        self.prompt_at = None
+        self.size = (80, 24)
+
+    @property
+    def out(self):
+        return self._out or sys.stdout
+
+    def detect(self):
+        """
+        Decides whether to use screen control for the current output.
+        """
+        try:
+            tty = self.out.isatty()
+        except (AttributeError, ValueError):
+            tty = False
+        self.active = tty and os.environ.get("TERM") != "dumb" and enable_vt()
+        return self.active
+
+    # Frames.
+
+    def clear(self):
+        """
+        Clears the whole screen and starts a new frame at the top.
+        """
+        if not self.detect():
+            return
+        self.out.write(CLEAR)
+        self.size = tuple(shutil.get_terminal_size())
+        self.front = []
+        self.cursor = (0, 0)
+        self.tracking = True
+        self._reset()
+
+    def begin(self, same=False):
+        """
+        Starts a new frame on an erased screen. With `same`, the frame
+        redraws the text already on screen (e.g. the same scene again), and
+        only what differs is written.
+        """
+        if not self.detect():
+            return
+        if not self.tracking or self.plain or tuple(shutil.get_terminal_size()) != self.size:
+            self.clear()
+            return
+        if not same:
+            self._goto(0, 0)
+            self.out.write(ERASE_BELOW)
+            self.front = []
+            self._reset()
+            return
+        self._commit()
+        self._reset()
+
+    def _reset(self):
+        self.back = []
+        self.row = self.col = 0
+        self.plain = False
+        self.prompt_at = None
+
+    def end(self):
+        """
+        Finishes the frame: erases what is left of the previous one and puts
+        the cursor after the new text.
+        """
+        if self.active and not self.plain:
+            self._finish()
+        self.out.flush()
+
+    # File-like interface (typewrite writes through this).
+
+    def write(self, text):
+        if not self.active or self.plain:
+            self.out.write(text)
+            return
+        lines = text.split("\n")
+        for index, segment in enumerate(lines):
+            if index:
+                self._newline()
+            if not self.plain:
+                self._put(segment)
+            if self.plain:
+                # Positions are lost: write the rest as it comes
+                self.out.write("\n".join(lines[index:]))
+                return
+
+    def flush(self):
+        self.out.flush()
+
+    # Input.
+
+    def prompt(self, text, message=None, read=None):
+        """
+        Shows an optional message and a prompt below the frame and returns
+        the player's input, read with `read` (input() or Keyboard.read_line).
+        Called again in the same frame, it redraws only this region.
+        """
+        read = read or input
+        if not self.active or self.plain or not self.tracking:
+            if message is not None:
+                self.out.write(message + "\n")
+            self.tracking = False
+            return read(text)
+
+        if self.prompt_at is None:
+            self.prompt_at = (self.row, self.col)
+        else:
+            self.row, self.col = self.prompt_at
+            del self.back[self.row + 1:]
+            if self.back:
+                self.back[-1] = self.back[-1][:self.col]
+        if message is not None:
+            self.write(message + "\n")
+        self.write(text)
+        if self.plain:
+            self.out.flush()
+            self.tracking = False
+            return read()
+        self._finish()
+        self.out.flush()
+
+        answer = read()
+        # The terminal echoed the answer and moved to the next row.
+        self.back[self.row] += answer
+        self.front = list(self.back)
+        self.row += 1
+        self.col = 0
+        self.cursor = (self.row, 0)
+        if self.row >= self.size[1] - 1 or len(self.back[self.row - 1]) >= self.size[0]:
+            self.tracking = False
+        return answer
+
+    # Diffing.
+
+    def _goto(self, row, col):
+        if self.cursor != (row, col):
+            self.out.write(move(row, col))
+            self.cursor = (row, col)
+
+    def _put(self, segment):
+        if not segment:
+            return
+        while len(self.back) <= self.row:
+            self.back.append("")
+        col = self.col
+        if col + len(segment) >= self.size[0]:
+            # Would wrap: give up on positions for the rest of the frame
+            self._go_plain()
+            return
+        old = self.front[self.row] if self.row < len(self.front) else ""
+        same = 0
+        limit = min(len(segment), len(old) - col)
+        while same < limit and segment[same] == old[col + same]:
+            same += 1
+        if same < len(segment):
+            self._goto(self.row, col + same)
+            self.out.write(segment[same:])
+            self.cursor = (self.row, col + len(segment))
+            if len(old) > col + len(segment):
+                # Never leave the old line's tail after new text
+                self.out.write(ERASE_LINE)
+                self.front[self.row] = self.back[self.row] + segment
+        self.back[self.row] += segment
+        self.col += len(segment)
+
+    def _newline(self):
+        while len(self.back) <= self.row:
+            self.back.append("")
+        old = self.front[self.row] if self.row < len(self.front) else ""
+        if len(old) > self.col:
+            self._goto(self.row, self.col)
+            self.out.write(ERASE_LINE)
+        self.row += 1
+        self.col = 0
+        if self.row >= self.size[1] - 1:
+            # Would scroll: same as wrapping
+            self._go_plain()
+
+    def _go_plain(self):
+        self._goto(self.row, self.col)
+        self.out.write(ERASE_BELOW)
+        self.plain = True
+        self.tracking = False
+
+    def _commit(self):
+        # What is on screen now: the frame written so far, over whatever of
+        # the previous frame it has not reached.
+        screen = list(self.back)
+        for row, old in enumerate(self.front):
+            if row >= len(screen):
+                screen.append(old)
+            elif len(old) > len(screen[row]) and row >= self.row:
+                screen[row] += old[len(screen[row]):]
+        self.front = screen
+
+    def _finish(self):
+        while len(self.back) <= self.row:
+            self.back.append("")
+        leftover = (len(self.front) > self.row + 1
+                    or (self.row < len(self.front) and len(self.front[self.row]) > self.col))
+        self._goto(self.row, self.col)
+        if leftover:
+            self.out.write(ERASE_BELOW)
+        self.front = list(self.back)
+
+# ---------------------------------------------------------------------------------
+# INPUT
+# ---------------------------------------------------------------------------------
+
+ENTER = ("\r", "\n")
+BACKSPACE = ("\x7f", "\b")
+EOF_KEY = "\x04"
+
+class Keyboard:
+    """
+    Non-blocking keystroke reader with a type-ahead buffer. Use as a context
+    manager around the session; outside it (or off a terminal) read_line()
+    is plain input().
+    """
+
+    def __init__(self, stream=None, out=None):
+        self._stream = stream
+        self._out = out
+        self.raw = False        # terminal is in cbreak mode and we read keys
+        self.pending = []       # keys typed but not consumed yet
+        self.skip = False       # a key was pressed during this scene's animation
+        self.swallow_enter = False
+        self.reading = False    # read_line() is waiting for keys
+        self._saved = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._escape = False
+        self.eof = False        # the input was closed
+
+    @property
+    def stream(self):
+        return self._stream or sys.stdin
+
+    @property
+    def out(self):
+        return self._out or sys.stdout
+
+    def __enter__(self):
+        try:
+            interactive = self.stream.isatty() and self.out.isatty()
+        except (AttributeError, ValueError):
+            interactive = False
+        if interactive and termios is not None:
+            fd = self.stream.fileno()
+            self._saved = termios.tcgetattr(fd)
+            mode = termios.tcgetattr(fd)
+            mode[3] &= ~(termios.ICANON | termios.ECHO)
+            mode[6][termios.VMIN] = 1
+            mode[6][termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSADRAIN, mode)
+            self.raw = True
+        elif interactive:
+            self.raw = True
+        return self
+
+    def __exit__(self, *exc):
+        if self._saved is not None:
+            termios.tcsetattr(self.stream.fileno(), termios.TCSADRAIN, self._saved)
+            self._saved = None
+        self.raw = False
+
+    def new_scene(self):
+        """
+        Called before a scene is drawn. Keys already typed ahead skip its
+        animation too.
+        """
+        self.skip = bool(self.pending)
+
+    # Reading keys.
+
+    def _read(self, timeout):
+        """
+        Reads whatever keys are available, waiting up to `timeout` seconds
+        (None waits for at least one key, less than 0 does not wait).
+        Returns True if any arrived, or if the input was closed: that queues
+        EOF_KEY.
+        """
+        if timeout is not None:
+            timeout = max(0.0, timeout)
+        if termios is not None:
+            fd = self.stream.fileno()
+            if not select.select([fd], [], [], timeout)[0]:
+                return False
+            data = os.read(fd, 1024)
+            if not data:
+                self.eof = self.skip = True
+                self.pending.append(EOF_KEY)
+                return True
+            text = self._decoder.decode(data)
+        else:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not msvcrt.kbhit():
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.005)
+            text = ""
+            while msvcrt.kbhit():
+                text += msvcrt.getwch()
+        for key in text:
+            self._feed(key)
+        return True
+
+    def _feed(self, key):
+        if self._escape:
+            # Drop the rest of an escape sequence (arrow keys and such)
+            self._escape = not (key.isalpha() or key == "~")
+            return
+        if key == "\x1b":
+            self._escape = True
+            return
+        self.skip = True
+        if key in ENTER:
+            if self.swallow_enter and not self.pending:
+                self.swallow_enter = False
+                return
+            key = "\n"
+        self.swallow_enter = False
+        if self.pending or self.reading or key not in ("\n", " "):
+            # During an animation, Enter or space on their own only skip it
+            self.pending.append(key)
+
+    def poll(self):
+        """
+        Collects keys without blocking. Returns True once a key has been
+        pressed during this scene.
+        """
+        if self.raw and not self.skip:
+            self._read(0)
+        return self.skip
+
+    def wait(self, seconds):
+        """
+        Sleeps for up to `seconds`, returning early (True) on a keypress.
+        """
+        if not self.raw:
+            if seconds > 0:
+                time.sleep(seconds)
+            return False
+        if self.skip:
+            return True
+        self._read(seconds)
+        return self.skip
+
+    def read_line(self, prompt="", complete=None, idle=None):
+        """
+        Reads one line, echoing it. The line starts with the keys typed
+        ahead; if those already form a complete answer (`complete(line)` is
+        true) it is taken without waiting for Enter. While no key has been
+        pressed, `idle()` is called over and over until it returns False,
+        so it should do a small piece of work per call.
+        """
+        if not self.raw:
+            return input(prompt)
+        out = self.out
+        out.write(prompt)
+        ahead = len(self.pending)
+        line = []
+        while True:
+            if not self.pending:
+                out.flush()
+                self.reading = True
+                try:
+                    # The first key stops the idle work for the rest of the line
+                    while idle is not None and not self._read(0):
+                        if not idle():
+                            break
+                    idle = None
+                    if not self.pending:
+                        self._read(None)
+                finally:
+                    self.reading = False
+                continue
+            key = self.pending.pop(0)
+            ahead -= 1
+            if key == "\n":
+                break
+            if key in BACKSPACE:
+                if line:
+                    line.pop()
+                    out.write("\b \b")
+            elif key == EOF_KEY and (not line or self.eof):
+                out.write("\n")
+                out.flush()
+                raise EOFError
+            elif key.isprintable():
+                line.append(key)
+                out.write(key)
+            if ahead == 0 and complete is not None and complete("".join(line)):
+                self.swallow_enter = True
+                break
+        out.write("\n")
+        out.flush()
+        self.skip = bool(self.pending)
+        return "".join(line)
@@ -0,0 +1,5 @@
+# The game modules live side by side in code/ and import each other by name.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
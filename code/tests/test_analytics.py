@@ -0,0 +1,26 @@
+import main
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, kind, session, scene, value=None):
+        self.events.append((kind, scene, value))
+
+
+def test_rewind_is_not_counted_as_entering_the_scene_again(monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(main, "EVENTS", recorder)
+    session = main.start("Zed", seed=1)
+    view, session = main.step(session, 1)
+    view, session = main.step(session, 1)
+    entered = [event for event in recorder.events if event[0] == "enter"]
+    del recorder.events[:]
+
+    view, session = main.rewind(session, 2)
+
+    assert [kind for kind, scene, value in entered] == ["enter"] * 3
+    assert entered[0] == ("enter", main.START_SCENE, "start")
+    assert recorder.events == [("rewind", main.START_SCENE, 2)]
+    assert view.id == main.START_SCENE
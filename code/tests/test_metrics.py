@@ -0,0 +1,15 @@
+import metrics
+
+
+def test_prometheus_label_values_are_escaped():
+    recorder = metrics.Metrics()
+    scene_id = 'ODD "SCENE"\\\nNEXT'
+    recorder.choice_taken(scene_id, 1, 2.5)
+
+    text = recorder.prometheus()
+
+    escaped = 'scene="ODD \\"SCENE\\"\\\\\\nNEXT"'
+    assert f"echo_scene_visits_total{{{escaped}}} 1" in text.splitlines()
+    assert f'echo_choice_taken_total{{{escaped},choice="1"}} 1' in text.splitlines()
+    samples = [line for line in text.splitlines() if line and not line.startswith("#")]
+    assert all(line.startswith("echo_") for line in samples)
@@ -0,0 +1,56 @@
+import pytest
+
+import main
+import savegame
+
+
+@pytest.fixture
+def save_file(tmp_path):
+    session = main.start("Zed Quill", seed=1)
+    view, session = main.step(session, 1)
+    path = str(tmp_path / "echo9.sav")
+    savegame.save(path, session.state, main.save_layout())
+    return path
+
+
+def load(path):
+    return savegame.load(path, main.save_layout(), main.new_state, main.STORY.start)
+
+
+def test_a_save_loads_back(save_file):
+    state = load(save_file)
+    assert state.name == "Zed Quill"
+    assert main.STORY.ids[state.scene] != main.START_SCENE
+
+
+def test_every_truncation_raises_save_error(save_file):
+    with open(save_file, "rb") as handle:
+        data = handle.read()
+    for length in range(len(data)):
+        with open(save_file, "wb") as handle:
+            handle.write(data[:length])
+        with pytest.raises(savegame.SaveError):
+            load(save_file)
+
+
+@pytest.mark.parametrize("damage", [
+    # A name table length running past the end of the file
+    lambda data, tables, record: data[:tables] + b"\xff\xff\xff\x7f" + data[tables + 4:],
+    # Scene IDs that are not UTF-8
+    lambda data, tables, record: data[:tables + 4] + b"\xff" + data[tables + 5:],
+    # A player name that is not UTF-8
+    lambda data, tables, record: data[:record + 24] + b"\xff" + data[record + 25:],
+    # A scene number past the end of the story
+    lambda data, tables, record: data[:record + 4] + b"\xff\xff\x00\x00" + data[record + 8:],
+])
+def test_a_damaged_save_raises_save_error(save_file, damage):
+    with open(save_file, "rb") as handle:
+        data = handle.read()
+    _, _, _, tables_length = savegame.HEADER.unpack_from(data)
+    tables = savegame.HEADER.size
+    damaged = damage(data, tables, tables + tables_length)
+    assert len(damaged) == len(data)
+    with open(save_file, "wb") as handle:
+        handle.write(damaged)
+    with pytest.raises(savegame.SaveError):
+        load(save_file)
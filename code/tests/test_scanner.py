@@ -0,0 +1,32 @@
+import main
+import scanner
+
+
+def visited_everything(name):
+    session = main.start(name, seed=1)
+    session.state.visited = (1 << len(main.STORY.scenes)) - 1
+    return session
+
+
+def test_scan_finds_the_name_the_player_entered():
+    session = visited_everything("Zed Quill")
+
+    for query in ("Zed", "quill", "Zed Quill", "Dr. Quill"):
+        result = main.scan_command(session, query)
+        assert "Waking in the Docking Bay: ...You are Dr. Zed Quill" in result, query
+    assert "finds nothing" in main.scan_command(session, "Riven")
+
+
+def test_a_name_that_is_also_a_story_word_finds_both():
+    session = visited_everything("Signal")
+    named = set(main.search_index().search(main.SEARCH_NAME[1], session.state.visited))
+    worded = set(main.search_index().search("signal", session.state.visited))
+    assert named - worded and worded - named
+
+    found = main.search_queries("signal", "Signal")
+    assert found == ["signal", main.SEARCH_NAME[1]]
+
+
+def test_excerpt_starts_close_to_a_word_after_a_long_unbroken_run():
+    text = "Header\n" + "-" * 90 + "\nYou are Dr. Zed Quill, a scientist."
+    assert scanner.excerpt(text, "Zed").startswith("...You are Dr. Zed Quill")
@@ -0,0 +1,62 @@
+import asyncio
+
+import main
+import server
+import sessionstore
+
+
+def test_soak_keeps_idle_sessions_while_active_ones_finish(monkeypatch):
+    # Typewriter pacing still goes through the event loop, just faster
+    monkeypatch.setattr(server, "DELAY_SCALE", 0.005)
+    server.raise_file_limit(1024)
+    report = asyncio.run(server.soak(idle=200, active=20, stall_limit=1.0))
+    assert report["ok"], report
+    assert report["idle_sessions_held"] >= 200
+    assert report["idle_connections_open_at_end"] == 200
+    assert report["active_completed"] == 20
+    assert report["worst_stall_max"] <= 1.0
+
+
+def test_a_name_plays_on_one_connection_at_a_time(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "DELAY_SCALE", 0)
+    store = sessionstore.SessionStore(str(tmp_path / "sessions.db"), main.save_layout(),
+                                      main.new_state, main.STORY.start)
+    monkeypatch.setattr(server, "SESSIONS", store)
+    name_prompt = main.NAME_PROMPT.encode("utf-8")
+    choice_prompt = main.CHOICE_PROMPT.replace("\n", "\r\n").encode("utf-8")
+
+    async def connect(port, name):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await reader.readuntil(name_prompt)
+        writer.write(f"{name}\r\n".encode("utf-8"))
+        return reader, writer
+
+    async def play():
+        listener = await asyncio.start_server(server.run_session, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            first, first_writer = await connect(port, "Zed")
+            await first.readuntil(choice_prompt)
+
+            second, second_writer = await connect(port, "Zed")
+            refused = await second.readuntil(name_prompt)
+            second_writer.write(b"Yan\r\n")
+            await second.readuntil(choice_prompt)
+            second_writer.close()
+
+            # Once the first connection has gone, the name resumes its game
+            first_writer.close()
+            while "Zed" in server.ATTACHED:
+                await asyncio.sleep(0.01)
+            third, third_writer = await connect(port, "Zed")
+            resumed = await third.readuntil(choice_prompt)
+            third_writer.close()
+        return refused, resumed
+
+    try:
+        refused, resumed = asyncio.run(play())
+    finally:
+        store.close()
+    assert server.IN_USE_TEXT.encode("utf-8") in refused
+    assert server.RESUMED_TEXT.encode("utf-8") in resumed
+    assert not server.ATTACHED
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bench
+import main
+import sharedstory
+import storyfile
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENES = 20000
+
+# Reports after importing main, then plays a scene and reads every scene of
+# the story, reports again and waits until stdin closes.
+WORKER_CODE = """
+import sys
+import main
+print("loaded", flush=True)
+sys.stdin.readline()
+session = main.start("Zed", seed=1)
+view, session = main.step(session, 1, width=80)
+for scene in main.STORY.scenes:
+    scene.description
+print("played", flush=True)
+sys.stdin.read()
+"""
+
+
+@pytest.fixture(scope="module")
+def story(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("story") / "story.jsonl")
+    storyfile.write_story(bench.synthetic_scenes(SCENES), path, main.START_SCENE)
+    return path
+
+
+@pytest.fixture
+def segment(story):
+    compiled = main.load_story(story)
+    shared = sharedstory.SharedStory.create(sharedstory.pack(compiled, main.ITEM_NAMES))
+    compiled.scenes.file.close()
+    yield shared
+    shared.close()
+    shared.unlink()
+
+
+def private_growth(env, count):
+    """
+    Starts `count` workers and returns how many MB of private memory each
+    gained between importing main and reading the story.
+    """
+    workers = [subprocess.Popen([sys.executable, "-c", WORKER_CODE], cwd=HERE, env=env,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+               for _ in range(count)]
+    try:
+        before = []
+        for worker in workers:
+            assert worker.stdout.readline().strip() == "loaded"
+            before.append(bench.process_memory(worker.pid)["uss"])
+        for worker in workers:
+            worker.stdin.write("\n")
+            worker.stdin.flush()
+        growth = []
+        for worker, start in zip(workers, before):
+            assert worker.stdout.readline().strip() == "played"
+            growth.append(bench.process_memory(worker.pid)["uss"] - start)
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+    return growth
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"),
+                    reason="needs /proc/PID/smaps_rollup (Linux)")
+def test_attached_workers_read_the_story_without_copying_it(story, segment):
+    env = dict(os.environ, ECHO_STORY=story)
+    env.pop("ECHO_SHARED_STORY", None)
+    [full_load] = private_growth(env, 1)
+
+    attached = private_growth(dict(env, ECHO_SHARED_STORY=segment.name), 3)
+    for growth in attached:
+        assert growth < full_load / 4, (attached, full_load)
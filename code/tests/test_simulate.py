@@ -0,0 +1,23 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import main
+import simulate
+
+
+def test_walkers_pick_uniformly_when_offered_choices_all_weigh_nothing():
+    # Only the guarded scanner bypass has weight; walkers without the
+    # scanner and Elan's logs are offered the other two choices
+    tables = simulate.Tables(main.STORY, {"AI_CONSOLE": [1, 0, 0]})
+    scene = main.STORY.ids.index("AI_CONSOLE")
+    walkers = 1000
+    draw = (np.arange(walkers) + 0.5) / walkers
+    zeros = np.zeros(walkers, dtype=np.uint64)
+
+    choice = tables.pick(np.full(walkers, scene), np.zeros(walkers, dtype=np.int64),
+                         zeros, zeros, draw)
+
+    assert set(np.unique(choice)) == {1, 2}
+    assert abs(np.count_nonzero(choice == 1) - walkers / 2) <= 1
+
@@ -0,0 +1,83 @@
+import io
+import os
+import signal
+
+import pytest
+
+import terminal
+
+
+class FakeTerminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    monkeypatch.setenv("COLUMNS", "100")
+    monkeypatch.setenv("LINES", "40")
+    monkeypatch.setenv("TERM", "xterm")
+    out = FakeTerminal()
+    screen = terminal.Screen(out)
+    screen.clear()
+    screen.write("The previous scene, a long first line\nand a second line\n")
+    screen.end()
+    out.seek(0)
+    out.truncate()
+    return screen
+
+
+def test_new_scene_erases_the_previous_one_first(screen):
+    screen.begin()
+    screen.write("Still in")
+    written = screen.out.getvalue()
+    assert written.startswith(terminal.move(0, 0) + terminal.ERASE_BELOW)
+    assert written.endswith("Still in")
+
+
+def test_same_frame_erases_old_tail_when_it_writes(screen):
+    screen.begin(same=True)
+    screen.write("The previous scene, short")
+    written = screen.out.getvalue()
+    assert terminal.ERASE_BELOW not in written
+    assert written.endswith("short" + terminal.ERASE_LINE)
+
+
+def test_same_frame_unchanged_text_is_not_rewritten(screen):
+    screen.begin(same=True)
+    screen.write("The previous scene, a long first line\nand a second line\n")
+    screen.end()
+    assert "previous" not in screen.out.getvalue()
+
+
+@pytest.mark.skipif(terminal.termios is None, reason="reads file descriptors (POSIX)")
+@pytest.mark.parametrize("typed", [b"", b"12"])
+def test_read_line_raises_eof_when_the_input_closes(typed):
+    read_end, write_end = os.pipe()
+    os.write(write_end, typed)
+    os.close(write_end)
+    signal.signal(signal.SIGALRM, lambda *args: pytest.fail("read_line() kept waiting"))
+    signal.alarm(5)
+    try:
+        with os.fdopen(read_end, "rb", buffering=0) as stream:
+            keyboard = terminal.Keyboard(stream, FakeTerminal())
+            keyboard.raw = True
+            with pytest.raises(EOFError):
+                keyboard.read_line("> ")
+    finally:
+        signal.alarm(0)
+
+
+@pytest.mark.skipif(terminal.termios is None, reason="reads file descriptors (POSIX)")
+def test_wait_with_a_late_deadline_does_not_block():
+    # typewrite() passes a negative time when a frame ran late
+    read_end, write_end = os.pipe()
+    try:
+        with os.fdopen(read_end, "rb", buffering=0) as stream:
+            keyboard = terminal.Keyboard(stream, FakeTerminal())
+            keyboard.raw = True
+            assert keyboard.wait(-0.2) is False
+            os.write(write_end, b"x")
+            assert keyboard.wait(-0.2) is True
+    finally:
+        os.close(write_end)